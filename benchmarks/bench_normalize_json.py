@@ -0,0 +1,86 @@
+"""
+Benchmark da normalização de páginas JSON da API.
+
+Compara o caminho atual (json + pd.json_normalize por página + pd.concat + projeção)
+com o motor rápido (orjson/json + caminhos configurados em blocos de colunas).
+
+Uso:
+    set PYTHONPATH=src
+    python benchmarks/bench_normalize_json.py --pages 20 --rows 1000 --width 200
+"""
+import argparse
+import json
+import time
+
+import pandas as pd
+
+from extract.api_extractor import normalize_json, page_records, select_columns
+from extract.fast_normalize import blocks_to_frame, loads, normalize_records_fast
+
+
+def make_page(page: int, rows: int, width: int) -> bytes:
+    """Página larga e aninhada: {"data": [{"id", "cliente": {...}, "conta": {"saldo": {...}}, ...}]}"""
+    records = []
+    for i in range(rows):
+        record = {
+            "id": page * rows + i,
+            "cliente": {"nome": f"cliente {i}", "nif": str(100000 + i),
+                        "morada": {"cidade": "Luanda", "pais": "AO"}},
+            "conta": {"numero": f"AO06{i:021d}", "saldo": {"valor": i * 1.5, "moeda": "AOA"}},
+        }
+        for w in range(width):
+            record[f"campo_{w}"] = {"v": w, "desc": f"valor {w}"}
+        records.append(record)
+    return json.dumps({"data": records}).encode("utf-8")
+
+
+def run_pandas(pages, columns):
+    dfs = [select_columns(normalize_json(json.loads(raw)), columns) for raw in pages]
+    return pd.concat(dfs, ignore_index=True)
+
+
+def run_fast(pages, columns):
+    blocks = []
+    for raw in pages:
+        payload = loads(raw)
+        blocks.append(normalize_records_fast(page_records(payload), payload, columns))
+    return blocks_to_frame(blocks, columns)
+
+
+def timeit(fn, *args, repeat: int = 3):
+    best = float("inf")
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn(*args)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--pages", type=int, default=20)
+    parser.add_argument("--rows", type=int, default=1000)
+    parser.add_argument("--width", type=int, default=200)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    from loguru import logger
+    logger.remove()
+
+    pages = [make_page(p, args.rows, args.width) for p in range(args.pages)]
+    columns = ["id", "cliente.nif", "cliente.morada.cidade", "conta.saldo.valor", "campo_0.v"]
+
+    t_pandas, df_pandas = timeit(run_pandas, pages, columns, repeat=args.repeat)
+    t_fast, df_fast = timeit(run_fast, pages, columns, repeat=args.repeat)
+    pd.testing.assert_frame_equal(df_fast, df_pandas)
+
+    total = args.pages * args.rows
+    print(f"{args.pages} páginas x {args.rows} registos x {args.width + 3} campos aninhados")
+    print(f"pandas (json_normalize): {t_pandas:8.3f}s  ({total / t_pandas:,.0f} registos/s)")
+    print(f"fast (caminhos/colunas): {t_fast:8.3f}s  ({total / t_fast:,.0f} registos/s)")
+    print(f"speedup: {t_pandas / t_fast:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,255 @@
+"""
+Benchmark de memória das regras de limpeza e cálculo do SAS_AML.
+
+Compara o encadeamento antigo (cópia fiel das funções originais: cada uma copia
+o DataFrame e o orquestrador copia outra vez) com o plano compilado, que altera
+um único DataFrame.
+O pico de memória é medido com tracemalloc (inclui os buffers numpy).
+
+Uso:
+    set PYTHONPATH=src
+    python benchmarks/bench_transform_memory.py --rows 1000000
+"""
+import argparse
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+from loguru import logger
+
+from transform import calculations, cleaning
+
+CLEANING_RULES = {
+    "normalize_dates": ["TransactionGenerationDate"],
+    "drop_duplicates": ["TransactionID"],
+    "fill_missing": {"ContractNumber": "N/A"},
+}
+CALCULATIONS = {
+    "add_id_tempo": True,
+    "offset_days": 1,
+    "substring": [{"col": "ContractNumber", "start": 0, "end": 5, "new_col": "ContractPrefix"}],
+}
+
+
+def make_frame(rows: int) -> pd.DataFrame:
+    rng = np.random.default_rng(42)
+    dates = pd.date_range("2025-01-01", periods=365).strftime("%Y-%m-%d %H:%M:%S").to_numpy()
+    return pd.DataFrame({
+        "ID_TEMPO": rng.integers(20250101, 20251231, rows),
+        "TransactionID": rng.integers(0, rows, rows),
+        "TransactionGenerationDate": rng.choice(dates, rows),
+        "ContractNumber": rng.choice([f"CT{i:07d}" for i in range(1000)] + [None], rows),
+        "Valor": np.where(rng.random(rows) < 0.05, np.nan, rng.random(rows) * 1000),
+    })
+
+
+# ---------------------------------------------------------------------------
+# Implementação original (cópia fiel do baseline: cada função copia o DataFrame)
+# ---------------------------------------------------------------------------
+
+def legacy_normalize_dates(df: pd.DataFrame, date_cols: list) -> pd.DataFrame:
+    """
+    Converte colunas de data para datetime, remove formatos inválidos.
+    """
+    df = df.copy()
+    for col in date_cols:
+        if col in df.columns:
+            df[col] = pd.to_datetime(df[col], errors="coerce")
+        else:
+            logger.warning(f"Coluna '{col}' não encontrada para normalização de data.")
+    logger.info(f"Colunas de data normalizadas: {date_cols}")
+    return df
+
+
+def legacy_handle_missing_values(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Substitui todos os valores ausentes (NaN, None, NaT) por pd.NA.
+    """
+    df = df.copy()
+    total_nulls_before = df.isna().sum().sum()
+
+    if total_nulls_before == 0:
+        logger.info("Nenhum valor ausente encontrado.")
+        return df
+
+    df = df.convert_dtypes()
+    df = df.fillna(pd.NA)
+
+    total_nulls_after = df.isna().sum().sum()
+    logger.info(
+        f"Valores ausentes substituídos por pd.NA "
+        f"(antes: {total_nulls_before}, depois: {total_nulls_after})"
+    )
+
+    return df
+
+
+def legacy_deduplicate(df: pd.DataFrame, subset=None) -> pd.DataFrame:
+    """
+    Remove duplicados, opcionalmente com base em colunas específicas.
+    """
+    df = df.copy()
+    before = len(df)
+    df = df.drop_duplicates(subset=subset)
+    after = len(df)
+    logger.info(f"Removidos {before - after} duplicados (base: {subset})")
+    return df
+
+
+def legacy_apply_cleaning_rules(df: pd.DataFrame, rules: dict) -> pd.DataFrame:
+    """
+    Aplica as regras de limpeza configuradas.
+    """
+    df_clean = df.copy()
+
+    if not rules:
+        logger.info("⚙ Nenhuma regra de limpeza definida. Retornando DataFrame original.")
+        return df_clean
+
+    logger.info(f"Aplicando regras de limpeza: {rules}")
+
+    # ⚙ Normalizar datas
+    if "normalize_dates" in rules:
+        df_clean = legacy_normalize_dates(df_clean, rules["normalize_dates"])
+
+    # ⚙ Substituir nulos por pd.NA
+    df_clean = legacy_handle_missing_values(df_clean)
+
+    # ⚙ Remover duplicados
+    if "drop_duplicates" in rules:
+        df_clean = legacy_deduplicate(df_clean, subset=rules["drop_duplicates"])
+
+    # ⚙ Preencher nulos com valor padrão
+    if "fill_missing" in rules:
+        for col, val in rules["fill_missing"].items():
+            if col in df_clean.columns:
+                df_clean[col] = df_clean[col].fillna(val)
+                logger.info(f"Preenchidos valores nulos em '{col}' com '{val}'")
+
+
+    logger.info("Limpeza concluída com sucesso.")
+    return df_clean
+
+
+def legacy_add_id_tempo(df, offset_days=1, fixed_date=None):
+    base_date = fixed_date or datetime.now()
+    load_date = (base_date - timedelta(days=offset_days)).strftime("%Y%m%d")
+    df["ID_TEMPO"] = int(load_date)
+    return df
+
+
+def legacy_substring_column(df: pd.DataFrame, col: str, start: int, end: int, new_col: str = None) -> pd.DataFrame:
+    """
+    Cria uma nova coluna com substring de outra.
+    """
+    df = df.copy()
+    if col not in df.columns:
+        logger.warning(f"Coluna '{col}' não encontrada — substring ignorada.")
+        return df
+
+    target_col = new_col or col
+    df[target_col] = df[col].astype(str).str[start:end]
+    logger.info(f"Substring aplicada em '{col}' → '{target_col}' [{start}:{end}].")
+    return df
+
+
+def legacy_aggregate_values(df: pd.DataFrame, group_by: list, agg_rules: dict) -> pd.DataFrame:
+    """
+    Executa agregações com base em colunas e funções especificadas.
+    Exemplo de agg_rules: { "Valor": "sum", "ContaOrigem": "nunique" }
+    """
+    df = df.copy()
+    if not set(group_by).issubset(df.columns):
+        missing = [c for c in group_by if c not in df.columns]
+        logger.warning(f"Colunas de agrupamento não encontradas: {missing}")
+        return df
+
+    grouped = df.groupby(group_by).agg(agg_rules).reset_index()
+    logger.info(f"Agregação executada por {group_by} com regras {agg_rules}.")
+    return grouped
+
+
+def legacy_apply_calculations(df: pd.DataFrame, rules: dict) -> pd.DataFrame:
+    """
+    Orquestrador de cálculos derivados baseado em configuração JSON.
+    """
+    df_result = df.copy()
+    if not rules:
+        logger.info("⚙ Nenhuma regra de cálculo definida. Retornando DataFrame original.")
+        return df_result
+
+    logger.info(f"Aplicando regras de cálculo: {rules}")
+
+    if rules.get("add_id_tempo", False):
+        df_result = legacy_add_id_tempo(df_result, offset_days=rules.get("offset_days", 1))
+
+    if "substring" in rules:
+        for s in rules["substring"]:
+            df_result = legacy_substring_column(df_result, **s)
+
+    if "aggregations" in rules:
+        for agg in rules["aggregations"]:
+            df_result = legacy_aggregate_values(
+                df_result,
+                group_by=agg["group_by"],
+                agg_rules=agg["agg"]
+            )
+
+    return df_result
+
+
+def run_legacy(df):
+    """Encadeamento anterior: cópia no orquestrador + cópia em cada função."""
+    return legacy_apply_calculations(legacy_apply_cleaning_rules(df, CLEANING_RULES), CALCULATIONS)
+
+
+def run_plan(df, copy: bool):
+    plan = cleaning.compile_cleaning_rules(CLEANING_RULES) + calculations.compile_calculations(CALCULATIONS)
+    return plan.run(df, copy=copy)
+
+
+def measure(fn, make_input):
+    df = make_input()
+    input_bytes = df.memory_usage(deep=True).sum()
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = fn(df)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak, input_bytes, result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=500_000)
+    args = parser.parse_args()
+
+    logger.remove()
+
+    source = make_frame(args.rows)
+    runs = {
+        "encadeamento antigo": lambda df: run_legacy(df),
+        "plano (copy=True)": lambda df: run_plan(df, copy=True),
+        "plano (copy=False)": lambda df: run_plan(df, copy=False),
+    }
+
+    results = {}
+    for name, fn in runs.items():
+        elapsed, peak, input_bytes, result = measure(fn, source.copy)
+        results[name] = result
+        print(f"{name:22s} {elapsed:7.2f}s  pico {peak / 2**20:8.1f} MiB "
+              f"({peak / input_bytes:4.2f}x o input de {input_bytes / 2**20:.1f} MiB)")
+
+    # O plano mantém os dtypes do input (o original fazia convert_dtypes): compara valores
+    legacy = results.pop("encadeamento antigo")
+    reference = results["plano (copy=True)"]
+    for result in results.values():
+        pd.testing.assert_frame_equal(result, reference)
+    pd.testing.assert_frame_equal(reference, legacy, check_dtype=False)
+
+
+if __name__ == "__main__":
+    main()
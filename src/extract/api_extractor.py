@@ -1,50 +1,304 @@
-from typing import Optional, Dict, Any, List, Union
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Dict, Any, List, Union, Callable, NamedTuple
 
 import pandas as pd
 import requests
 from loguru import logger
-from tenacity import retry, stop_after_attempt, wait_exponential, retry_if_exception_type
+from requests.adapters import HTTPAdapter
+from tenacity import retry, stop_any, stop_after_attempt, wait_exponential, retry_if_exception_type
+
+from extract.fast_normalize import ColumnBlock, blocks_to_frame, loads, normalize_records_fast
+from extract.http_cache import HttpCache, get_http_cache
+from extract.pagination import PageRequest, PaginationStrategy, get_pagination_strategy
 
 
 # ---------------- Retry configuration ----------------
+class RequestCancelled(Exception):
+    """A extração terminou (ou falhou) e os pedidos em curso já não são necessários."""
+
+
+def cancel_requested(retry_state) -> bool:
+    """Condição de paragem do retry: evento `cancel` do pedido assinalado."""
+    cancel = retry_state.kwargs.get("cancel")
+    return cancel is not None and cancel.is_set()
+
+
 @retry(
     reraise=True,
-    stop=stop_after_attempt(5),
+    stop=stop_any(stop_after_attempt(5), cancel_requested),
     wait=wait_exponential(multiplier=1, min=2, max=30),
     retry=retry_if_exception_type(requests.exceptions.RequestException),
 )
 def get(url: str, params: Optional[Dict[str, Any]] = None,
-        headers: Optional[Dict[str, str]] = None) -> requests.Response:
+        headers: Optional[Dict[str, str]] = None,
+        session: Optional[requests.Session] = None,
+        cancel: Optional[threading.Event] = None) -> requests.Response:
     """
     Faz uma chamada GET com retry/backoff exponencial.
+    Com `session`, reutiliza as ligações (keep-alive) do pool da sessão.
+    Com `cancel` (passado por nome), não há novas tentativas depois de o evento ser assinalado.
     """
+    if cancel is not None and cancel.is_set():
+        raise RequestCancelled(url)
     logger.info(f"GET {url} | params={params}")
-    response = requests.get(url, params=params, headers=headers, timeout=20)
+    client = session or requests
+    response = client.get(url, params=params, headers=headers, timeout=20)
     response.raise_for_status()
     return response
 
 
+def create_session(pool_size: int = 10) -> requests.Session:
+    """Cria uma sessão HTTP com pool de ligações dimensionado para `pool_size` pedidos em paralelo."""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
 # ---------------- JSON normalization ----------------
-def normalize_json(json_data: Any) -> pd.DataFrame:
+def page_records(json_data: Any) -> Optional[List[Any]]:
     """
-    Converte JSON em DataFrame, normalizando campos aninhados.
+    Devolve a lista de registos de uma resposta JSON (None se for um objeto simples).
     """
     if isinstance(json_data, list):
-        df = pd.json_normalize(json_data)
-    elif isinstance(json_data, dict):
+        return json_data
+    if isinstance(json_data, dict):
         # tenta achar lista dentro do dict (ex: {"data": [...]})
         key = next((k for k in json_data.keys() if isinstance(json_data[k], list)), None)
-        if key:
-            df = pd.json_normalize(json_data[key])
-        else:
-            df = pd.DataFrame([json_data])
+        return json_data[key] if key else None
+    raise ValueError("Formato JSON inválido para normalização.")
+
+
+def normalize_json(json_data: Any) -> pd.DataFrame:
+    """
+    Converte JSON em DataFrame, normalizando campos aninhados.
+    """
+    records = page_records(json_data)
+    if records is not None:
+        df = pd.json_normalize(records)
     else:
-        raise ValueError("Formato JSON inválido para normalização.")
+        df = pd.DataFrame([json_data])
 
     logger.info(f"JSON normalizado: {df.shape[0]} linhas, {df.shape[1]} colunas")
     return df
 
 
+def select_columns(df: pd.DataFrame, columns: Optional[List[str]] = None) -> pd.DataFrame:
+    """Mantém apenas as colunas pedidas (avisa sobre as que não existem)."""
+    if not columns or df.empty:
+        return df
+    missing = [c for c in columns if c not in df.columns]
+    if missing:
+        logger.warning(f"Colunas não encontradas: {missing}")
+    return df[[c for c in columns if c in df.columns]]
+
+
+# ---------------- Page fetching ----------------
+PageData = Union[pd.DataFrame, ColumnBlock]
+
+
+class RawPage(NamedTuple):
+    """Página obtida (do servidor ou do cache), com o JSON por normalizar."""
+    request: PageRequest
+    n_rows: int
+    next_request: Optional[PageRequest]
+    payload: Any = None
+
+
+def retrieve_page(
+        session: requests.Session,
+        request: PageRequest,
+        headers: Optional[Dict[str, str]],
+        strategy: PaginationStrategy,
+        cache: Optional[HttpCache] = None,
+        cancel: Optional[threading.Event] = None
+) -> RawPage:
+    """
+    Obtém uma página e calcula o pedido seguinte, sem normalizar o JSON.
+    Com cache, reutiliza o JSON guardado se o servidor responder 304 ao pedido
+    condicional (ou sem pedido, dentro do TTL, ver HttpCache).
+    """
+    entry = cache.lookup(request.url, request.params) if cache else None
+    if entry and cache.is_fresh(entry):
+        cached = cache.load(entry)
+        return RawPage(request, cached["n_rows"], cached["next_request"], loads(cached["body"]))
+
+    request_headers = {**(headers or {}), **HttpCache.conditional_headers(entry)}
+    response = get(request.url, request.params, request_headers or None, session=session, cancel=cancel)
+    if entry and response.status_code == 304:
+        logger.info(f"Página {request.index + 1} inalterada (304) — a reutilizar cache.")
+        cached = cache.load(entry, revalidated=True)
+        return RawPage(request, cached["n_rows"], cached["next_request"], loads(cached["body"]))
+
+    payload = loads(response.content)
+    records = page_records(payload)
+    n_rows = len(records) if records is not None else 1
+    next_request = strategy.next_request(request, response, payload, n_rows)
+    if cache:
+        cache.store(request.url, request.params, response, n_rows, next_request)
+    return RawPage(request, n_rows, next_request, payload)
+
+
+def normalize_page(raw: RawPage, columns: Optional[List[str]] = None, engine: str = "pandas") -> PageData:
+    """
+    Normaliza a página. Motor "pandas": pd.json_normalize + projeção; motor "fast":
+    só os caminhos de `columns`, em listas por coluna (ColumnBlock), sem DataFrame por página.
+    """
+    if engine == "fast":
+        df = normalize_records_fast(page_records(raw.payload), raw.payload, columns)
+    else:
+        df = normalize_json(raw.payload)
+    if isinstance(df, ColumnBlock):
+        return df
+    return select_columns(df, columns)
+
+
+def fetch_page(
+        session: requests.Session,
+        request: PageRequest,
+        headers: Optional[Dict[str, str]],
+        strategy: PaginationStrategy,
+        columns: Optional[List[str]] = None,
+        cache: Optional[HttpCache] = None,
+        engine: str = "pandas",
+        cancel: Optional[threading.Event] = None
+) -> PageData:
+    """Obtém e normaliza uma página, mantendo apenas as colunas pedidas."""
+    raw = retrieve_page(session, request, headers, strategy, cache, cancel)
+    return normalize_page(raw, columns, engine)
+
+
+def fetch_pages_sequentially(
+        session: requests.Session,
+        strategy: PaginationStrategy,
+        base_url: str,
+        params: Optional[Dict[str, Any]],
+        headers: Optional[Dict[str, str]],
+        columns: Optional[List[str]],
+        max_pages: Union[int, str],
+        cache: Optional[HttpCache] = None,
+        engine: str = "pandas"
+) -> List[PageData]:
+    """
+    Segue a estratégia de paginação página a página. O pedido da página N+1 é
+    lançado em segundo plano assim que é conhecido, enquanto a página N é normalizada.
+    """
+    all_data: List[PageData] = []
+    request = strategy.first_request(base_url, params)
+
+    with ThreadPoolExecutor(max_workers=1) as prefetcher:
+        future = prefetcher.submit(retrieve_page, session, request, headers, strategy, cache)
+
+        while future is not None:
+            page = request.index + 1
+            try:
+                raw = future.result()
+
+                # Decide se deve continuar (e pede já a próxima página)
+                future = None
+                if raw.next_request is not None and (max_pages == "all" or page < max_pages):
+                    request = raw.next_request
+                    future = prefetcher.submit(retrieve_page, session, request, headers, strategy, cache)
+
+                df = normalize_page(raw, columns, engine)
+            except Exception as e:
+                logger.error(f"Erro na página {page}: {e}")
+                break
+
+            if df.empty:
+                logger.info(f"Nenhum dado retornado na página {page}.")
+                break
+            all_data.append(df)
+            logger.info(f"Página {page} processada ({len(df)} registos).")
+
+    return all_data
+
+
+class RateLimiter:
+    """Limita o ritmo de arranque dos pedidos (pedidos/segundo) entre tarefas asyncio."""
+
+    def __init__(self, rate: Optional[float] = None):
+        self.interval = 1.0 / rate if rate else 0.0
+        self._next_slot = 0.0
+        self._lock = asyncio.Lock()
+
+    async def wait(self):
+        if not self.interval:
+            return
+        async with self._lock:
+            loop = asyncio.get_running_loop()
+            now = loop.time()
+            delay = self._next_slot - now
+            if delay > 0:
+                await asyncio.sleep(delay)
+            self._next_slot = max(now, self._next_slot) + self.interval
+
+
+async def fetch_pages_concurrently(
+        fetch: Callable[[int], PageData],
+        last_index: Optional[int],
+        concurrency: int,
+        rate_limit: Optional[float] = None,
+        is_last_page: Optional[Callable[[int], bool]] = None,
+        cancel: Optional[threading.Event] = None
+) -> List[PageData]:
+    """
+    Busca páginas com até `concurrency` pedidos em curso, devolvendo-as pela ordem das páginas.
+    Pára na primeira página vazia, com erro ou marcada como última (last_index=None → até esgotar).
+    No fim assinala `cancel` (os pedidos em curso deixam de fazer retries) e espera pelas
+    threads, para nenhum pedido usar a sessão HTTP depois de o chamador a fechar.
+    """
+    loop = asyncio.get_running_loop()
+    limiter = RateLimiter(rate_limit)
+    executor = ThreadPoolExecutor(max_workers=concurrency)
+
+    async def run(index: int) -> PageData:
+        await limiter.wait()
+        return await loop.run_in_executor(executor, fetch, index)
+
+    pending: Dict[int, asyncio.Task] = {}
+    next_index = 0
+    index = 0
+    results: List[PageData] = []
+
+    try:
+        while True:
+            while len(pending) < concurrency and (last_index is None or next_index <= last_index):
+                pending[next_index] = asyncio.create_task(run(next_index))
+                next_index += 1
+            if index not in pending:
+                break
+
+            page = index + 1
+            try:
+                df = await pending.pop(index)
+            except Exception as e:
+                logger.error(f"Erro na página {page}: {e}")
+                break
+            if df.empty:
+                logger.info(f"Nenhum dado retornado na página {page}.")
+                break
+
+            results.append(df)
+            logger.info(f"Página {page} processada ({len(df)} registos).")
+            if is_last_page and is_last_page(len(df)):
+                break
+            index += 1
+    finally:
+        # Páginas além do fim já não são necessárias
+        for task in pending.values():
+            task.cancel()
+        await asyncio.gather(*pending.values(), return_exceptions=True)
+        if cancel is not None:
+            cancel.set()
+        await loop.run_in_executor(None, lambda: executor.shutdown(wait=True, cancel_futures=True))
+
+    return results
+
+
 # ---------------- API Extractor ----------------
 def extract_api(
         base_url: str,
@@ -53,7 +307,12 @@ def extract_api(
         pagination_key: Optional[str] = None,
         max_pages: Union[int, str] = 5,
         columns: Optional[List[str]] = None,
-        page_param_start: int = 1
+        page_param_start: int = 1,
+        concurrency: int = 1,
+        rate_limit: Optional[float] = None,
+        pagination: Optional[Union[Dict[str, Any], PaginationStrategy]] = None,
+        http_cache: Optional[Union[Dict[str, Any], HttpCache]] = None,
+        engine: str = "pandas"
 ) -> pd.DataFrame:
     """
     Extrai dados de uma API paginada e devolve um DataFrame único.
@@ -66,51 +325,61 @@ def extract_api(
         max_pages: número de páginas a extrair (int) ou "all"
         columns: lista de colunas que se deseja manter
         page_param_start: número inicial da página (geralmente 1)
+        concurrency: número de páginas pedidas em paralelo (1 = sequencial)
+        rate_limit: máximo de pedidos por segundo (None = sem limite)
+        pagination: estratégia de paginação de sources.json (page, offset, cursor, link);
+            substitui pagination_key/page_param_start quando definida
+        http_cache: cache HTTP em disco (instância ou configuração `http_cache` de sources.json,
+            ex: {"max_bytes": 536870912}); as páginas são revalidadas com pedidos condicionais,
+            salvo com "ttl_seconds" (opt-in), que dispensa o pedido exceto para a última página
+        engine: "pandas" (pd.json_normalize por página) ou "fast" (só os caminhos de
+            `columns`, acumulados por coluna entre páginas; requer `columns`)
     """
-    all_data: List[pd.DataFrame] = []
-    page = page_param_start
-    total_rows = 0
+    if isinstance(max_pages, str):
+        if max_pages.lower() == "all":
+            max_pages = "all"
+        else:
+            logger.warning("Valor inválido para max_pages — deve ser int ou 'all'.")
+            max_pages = 1
 
-    while True:
-        query_params = params.copy() if params else {}
-        if pagination_key:
-            query_params[pagination_key] = page
+    if engine == "fast" and not columns:
+        logger.warning("Motor 'fast' requer columns — a usar pd.json_normalize.")
+        engine = "pandas"
 
-        try:
-            response = get(base_url, query_params, headers)
-            data = response.json()
-            df = normalize_json(data)
-            if df.empty:
-                logger.info(f"Nenhum dado retornado na página {page}.")
-                break
-            if columns:
-                missing = [c for c in columns if c not in df.columns]
-                if missing:
-                    logger.warning(f"Colunas não encontradas: {missing}")
-                df = df[[c for c in columns if c in df.columns]]
-            all_data.append(df)
-            total_rows += len(df)
-        except Exception as e:
-            logger.error(f"Erro na página {page}: {e}")
-            break
-
-        logger.info(f"Página {page} processada ({len(df)} registos).")
-
-        # Decide se deve parar
-        if not pagination_key:
-            break
-        if isinstance(max_pages, int) and page >= max_pages:
-            break
-        if isinstance(max_pages, str) and max_pages.lower() != "all":
-            logger.warning("Valor inválido para max_pages — deve ser int ou 'all'.")
-            break
+    strategy = get_pagination_strategy(pagination, pagination_key, page_param_start)
+    cache = get_http_cache(http_cache)
 
-        page += 1
+    with create_session(pool_size=max(concurrency, 1)) as session:
+        if concurrency > 1 and strategy.predictable:
+            cancel = threading.Event()
+
+            def fetch(index: int) -> PageData:
+                request = strategy.request_for(base_url, params, index)
+                return fetch_page(session, request, headers, strategy, columns, cache, engine, cancel)
+
+            last_index = max_pages - 1 if isinstance(max_pages, int) else None
+            all_data = asyncio.run(
+                fetch_pages_concurrently(fetch, last_index, concurrency, rate_limit, strategy.is_last_page,
+                                         cancel)
+            )
+        else:
+            if concurrency > 1:
+                logger.warning("Paginação sem pedidos previsíveis — a usar modo sequencial com prefetch.")
+            all_data = fetch_pages_sequentially(
+                session, strategy, base_url, params, headers, columns, max_pages, cache, engine
+            )
+
+    if cache:
+        cache.save()
 
     if not all_data:
         logger.warning("Nenhum dado foi extraído.")
         return pd.DataFrame()
 
-    final_df = pd.concat(all_data, ignore_index=True)
+    total_rows = sum(len(df) for df in all_data)
+    if engine == "fast":
+        final_df = blocks_to_frame(all_data, columns)
+    else:
+        final_df = pd.concat(all_data, ignore_index=True)
     logger.info(f"Extração concluída com {total_rows} registos totais e {final_df.shape[1]} colunas.")
     return final_df
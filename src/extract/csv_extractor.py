@@ -1,24 +1,62 @@
+import codecs
 import glob
 import os
-from typing import Optional, List, Dict
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+from typing import Optional, List, Dict, Iterator, Tuple, Union
 
 import chardet
+import numpy as np
 import pandas as pd
 from loguru import logger
 
+from extract.encoding_cache import EncodingCache, get_encoding_cache
+from transform import dedup
+from utils.state_store import StateStore
+
+# Leitura paralela: só compensa a partir de alguns ficheiros / volume
+PARALLEL_MIN_FILES = 8
+PARALLEL_MIN_BYTES = 64 * 1024 * 1024
+MAX_CSV_WORKERS = 8
+
+
+def is_utf8(raw: bytes) -> bool:
+    """Valida bytes como UTF-8 estrito (tolera um carácter cortado no fim da amostra)."""
+    try:
+        codecs.getincrementaldecoder("utf-8")("strict").decode(raw, final=False)
+        return True
+    except UnicodeDecodeError:
+        return False
+
+
+def detect_encoding(file_path: str, n_bytes: int = 10000,
+                    cache: Optional[EncodingCache] = None) -> str:
+    """
+    Detecta encoding de um ficheiro CSV.
+    Consulta primeiro o cache (se fornecido), tenta UTF-8 estrito e só depois usa chardet.
+    """
+    if cache is not None:
+        cached = cache.get(file_path)
+        if cached:
+            return cached
 
-def detect_encoding(file_path: str, n_bytes: int = 10000) -> str:
-    """Detecta encoding de um ficheiro CSV."""
     with open(file_path, 'rb') as f:
         raw = f.read(n_bytes)
-    enc = chardet.detect(raw)['encoding']
+    if is_utf8(raw):
+        enc = 'utf-8'
+    else:
+        enc = chardet.detect(raw)['encoding'] or 'utf-8'
     logger.info(f"Encoding detectado para {os.path.basename(file_path)}: {enc}")
-    return enc or 'utf-8'
+
+    if cache is not None:
+        cache.put(file_path, enc)
+    return enc
 
 
-def read_csv_file(file_path: str, schema: Optional[Dict[str, str]] = None) -> pd.DataFrame:
+def read_csv_file(file_path: str, schema: Optional[Dict[str, str]] = None,
+                  encoding: Optional[str] = None) -> pd.DataFrame:
     """Lê um CSV com detecção automática de encoding e valida schema."""
-    encoding = detect_encoding(file_path)
+    encoding = encoding or detect_encoding(file_path)
 
     try:
         df = pd.read_csv(file_path, encoding=encoding)
@@ -37,43 +75,134 @@ def read_csv_file(file_path: str, schema: Optional[Dict[str, str]] = None) -> pd
     return df
 
 
+def list_csv_files(path: str, pattern: str = "*.csv") -> List[str]:
+    """Lista os ficheiros a ler (ficheiro único ou glob num diretório), ordenados por nome."""
+    if os.path.isfile(path):
+        files = [path]
+    else:
+        files = sorted(glob.glob(os.path.join(path, pattern)))
+
+    if not files:
+        logger.warning(f"Nenhum ficheiro encontrado em {path} com pattern {pattern}")
+    return files
+
+
+def load_csv_file(file: str, schema: Optional[Dict[str, str]] = None,
+                  columns: Optional[List[str]] = None,
+                  encoding: Optional[str] = None) -> pd.DataFrame:
+    """Lê um ficheiro, marca `__source_file` e filtra as colunas definidas."""
+    df = read_csv_file(file, schema, encoding)
+    df['__source_file'] = os.path.basename(file)
+
+    # Filtra as colunas se definido
+    if columns:
+        missing = [c for c in columns if c not in df.columns]
+        if missing:
+            logger.warning(f"Colunas {missing} não encontradas em {file}")
+        df = df[[c for c in columns if c in df.columns]]
+
+    return df
+
+
+def use_parallel(files: List[str], parallel: Optional[bool] = None) -> bool:
+    """Decide se a leitura deve usar o pool de processos (auto quando parallel=None)."""
+    if parallel is not None:
+        return parallel and len(files) > 1
+    if len(files) < PARALLEL_MIN_FILES:
+        return False
+    total_bytes = sum(os.path.getsize(f) for f in files)
+    return total_bytes >= PARALLEL_MIN_BYTES
+
+
+def _load_csv_worker(file: str, schema: Optional[Dict[str, str]], columns: Optional[List[str]],
+                     encoding: Optional[str]) -> Tuple[pd.DataFrame, str]:
+    encoding = encoding or detect_encoding(file)
+    return load_csv_file(file, schema, columns, encoding), encoding
+
+
+def read_files_parallel(files: List[str], schema: Optional[Dict[str, str]] = None,
+                        columns: Optional[List[str]] = None,
+                        max_workers: Optional[int] = None,
+                        cache: Optional[EncodingCache] = None) -> List[pd.DataFrame]:
+    """
+    Lê vários ficheiros num pool de processos (encoding + parsing em cada worker).
+    A ordem do resultado segue a ordem de `files`.
+    """
+    workers = min(max_workers or os.cpu_count() or 1, MAX_CSV_WORKERS, len(files))
+    logger.info(f"Leitura paralela de {len(files)} ficheiro(s) com {workers} processo(s)")
+
+    # Encodings já conhecidos seguem para os workers; os restantes são detectados lá
+    encodings = [cache.get(f) if cache is not None else None for f in files]
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        results = list(executor.map(_load_csv_worker, files, repeat(schema), repeat(columns), encodings))
+
+    if cache is not None:
+        for file, (_, enc) in zip(files, results):
+            cache.put(file, enc)
+    return [df for df, _ in results]
+
+
+def skip_ingested(state: StateStore, source_name: str, files: List[str]) -> List[str]:
+    """Remove da lista os ficheiros já ingeridos (mesmo tamanho e mtime)."""
+    pending = state.pending_files(source_name, files)
+    if len(pending) < len(files):
+        logger.info(f"Ignorados {len(files) - len(pending)} ficheiro(s) já ingerido(s) em '{source_name}'")
+    return pending
+
+
 def extract_csv(path: str, pattern: str = "*.csv", schema: Optional[Dict[str, str]] = None,
             deduplicate: bool = True, save_sample: bool = False,
-            columns: Optional[List[str]] = None) -> pd.DataFrame:
+            columns: Optional[List[str]] = None, parallel: Optional[bool] = None,
+            max_workers: Optional[int] = None,
+            encoding_cache: Optional[EncodingCache] = None,
+            state: Optional[StateStore] = None,
+            source_name: Optional[str] = None,
+            chunksize: Optional[int] = None,
+            memory_budget: Optional[int] = None) -> Union[pd.DataFrame, Iterator[pd.DataFrame]]:
     """
     Extrai CSVs de um diretório e devolve um DataFrame filtrado pelas colunas definidas.
+
+    Com `chunksize` (modo streaming, como pd.read_csv) devolve um iterador de blocos
+    de até `chunksize` linhas (ver iter_csv_chunks), com a mesma deduplicação;
+    `memory_budget` limita a memória dessa deduplicação (spill em disco).
+
+    Com parallel=None a leitura é sequencial para poucos ficheiros e passa a usar um pool
+    de processos (limitado por max_workers) quando o volume o justifica.
+    Os encodings detectados ficam no cache persistente (encoding_cache ou o cache por defeito).
+    Com `state`, ficheiros já ingeridos e inalterados são ignorados; os lidos ficam
+    pendentes no estado até o chamador fazer `state.commit(source_name)` após o staging.
     """
-    if os.path.isfile(path):
-        files = [path]
-    else:
-        files = glob.glob(os.path.join(path, pattern))
+    if chunksize:
+        return iter_csv_chunks(path, pattern, schema, columns, chunksize, deduplicate,
+                               encoding_cache, state, source_name, memory_budget)
 
+    files = list_csv_files(path, pattern)
+    if state is not None and files:
+        source_name = source_name or path
+        files = skip_ingested(state, source_name, files)
     if not files:
-        logger.warning(f"Nenhum ficheiro encontrado em {path} com pattern {pattern}")
         return pd.DataFrame()
 
     logger.info(f"{len(files)} ficheiro(s) encontrados para leitura em {path}")
 
-    dfs = []
-    for file in files:
-        df = read_csv_file(file, schema)
-        df['__source_file'] = os.path.basename(file)
-
-        # Filtra as colunas se definido
-        if columns:
-            missing = [c for c in columns if c not in df.columns]
-            if missing:
-                logger.warning(f"Colunas {missing} não encontradas em {file}")
-            df = df[[c for c in columns if c in df.columns]]
+    cache = encoding_cache or get_encoding_cache()
+    if use_parallel(files, parallel):
+        dfs = read_files_parallel(files, schema, columns, max_workers, cache)
+    else:
+        dfs = [load_csv_file(file, schema, columns, detect_encoding(file, cache=cache)) for file in files]
+    cache.save()
+    logger.info(f"Cache de encodings: {cache.stats()}")
 
-        dfs.append(df)
+    if state is not None:
+        state.stage_files(source_name, files)
 
     full_df = pd.concat(dfs, ignore_index=True)
+    del dfs
     logger.info(f"Concatenação concluída: {len(full_df)} linhas totais")
 
     if deduplicate:
         before = len(full_df)
-        full_df.drop_duplicates(inplace=True)
+        full_df = dedup.drop_duplicates(full_df)
         logger.info(f"Removidos {before - len(full_df)} duplicados")
 
     if save_sample:
@@ -83,3 +212,146 @@ def extract_csv(path: str, pattern: str = "*.csv", schema: Optional[Dict[str, st
         logger.info(f"Amostra salva em {sample_path}")
 
     return full_df
+
+
+# ---------------- Streaming ----------------
+def hash_rows(df: pd.DataFrame) -> np.ndarray:
+    """
+    Calcula um hash de 64 bits por linha (independente do índice e dos dtypes
+    inferidos em cada bloco, ex: int64 num bloco e float64 noutro com nulos).
+    """
+    return dedup.text_digests(df)
+
+
+def read_csv_chunks(file: str, schema: Optional[Dict[str, str]] = None,
+                    columns: Optional[List[str]] = None, chunksize: int = 100_000,
+                    cache: Optional[EncodingCache] = None) -> Iterator[pd.DataFrame]:
+    """Lê um ficheiro em blocos, validando o cabeçalho e projetando `columns` na leitura."""
+    cache = cache or get_encoding_cache()
+    encoding = detect_encoding(file, cache=cache)
+    cache.save()
+    header = pd.read_csv(file, encoding=encoding, nrows=0).columns
+
+    if schema:
+        missing_cols = [col for col in schema.keys() if col not in header]
+        if missing_cols:
+            raise ValueError(f"Faltam colunas obrigatórias no CSV: {missing_cols}")
+
+    usecols = None
+    if columns:
+        missing = [c for c in columns if c not in header and c != "__source_file"]
+        if missing:
+            logger.warning(f"Colunas {missing} não encontradas em {file}")
+        usecols = [c for c in columns if c in header]
+
+    for chunk in pd.read_csv(file, encoding=encoding, usecols=usecols, chunksize=chunksize):
+        yield chunk[usecols] if usecols else chunk
+
+
+def rechunk(frames: Iterator[pd.DataFrame], chunksize: int) -> Iterator[pd.DataFrame]:
+    """Parte os DataFrames em blocos de até `chunksize` linhas."""
+    for frame in frames:
+        for start in range(0, len(frame), chunksize):
+            yield frame.iloc[start:start + chunksize]
+
+
+def iter_csv_chunks(path: str, pattern: str = "*.csv", schema: Optional[Dict[str, str]] = None,
+                    columns: Optional[List[str]] = None, chunksize: int = 100_000,
+                    deduplicate: bool = True,
+                    encoding_cache: Optional[EncodingCache] = None,
+                    state: Optional[StateStore] = None,
+                    source_name: Optional[str] = None,
+                    memory_budget: Optional[int] = None) -> Iterator[pd.DataFrame]:
+    """
+    Lê os CSVs em blocos de até `chunksize` linhas, sem carregar os ficheiros inteiros em memória.
+    Os blocos são por ficheiro: um bloco nunca junta linhas de dois ficheiros (o último
+    bloco de cada ficheiro pode ser mais pequeno), para `__source_file`, o cabeçalho
+    validado e o estado incremental corresponderem sempre a um só ficheiro.
+
+    A projeção para `columns` é feita na leitura (usecols) e as colunas devolvidas são as
+    de extract_csv: `__source_file` só se mantém sem `columns` ou quando está na lista.
+    Com deduplicate=True, os duplicados são removidos como em extract_csv (linhas iguais
+    nas colunas devolvidas: dentro de cada ficheiro quando `__source_file` é mantido,
+    entre ficheiros caso contrário) através de um conjunto de hashes das linhas já vistas
+    (8 bytes por linha distinta). Os hashes comparam texto como texto e só normalizam
+    int/float (um bloco com nulos lê inteiros como float).
+
+    Com `memory_budget` (bytes), a deduplicação passa pelo HashDeduplicator: as linhas
+    ficam em partições de hash, gravadas em disco acima do orçamento, e só saem no fim
+    do ficheiro (ou de todos, sem `__source_file`) — por partição, não pela ordem de leitura.
+
+    Args:
+        path: ficheiro ou diretório de origem
+        pattern: padrão glob dos ficheiros (quando path é diretório)
+        schema: colunas obrigatórias a validar no cabeçalho
+        columns: lista de colunas que se deseja manter
+        chunksize: número máximo de linhas por bloco (por ficheiro)
+        deduplicate: remove linhas repetidas entre blocos (ver acima)
+        encoding_cache: cache de encodings (por defeito, o cache persistente partilhado)
+        state: estado incremental — ignora ficheiros já ingeridos e marca como pendentes
+            os lidos até ao fim (gravados com `state.commit(source_name)`)
+        source_name: chave da fonte no estado (por defeito, `path`)
+        memory_budget: orçamento de memória da deduplicação com spill em disco
+    """
+    files = list_csv_files(path, pattern)
+    if state is not None and files:
+        source_name = source_name or path
+        files = skip_ingested(state, source_name, files)
+    cache = encoding_cache or get_encoding_cache()
+    keep_source = not columns or "__source_file" in columns
+    spill = deduplicate and bool(memory_budget)
+    seen = dedup.DigestSet()
+    deduplicator = None
+    total_read = 0
+    total_rows = 0
+
+    for file in files:
+        if keep_source:
+            # `__source_file` faz parte da linha: duplicados só dentro do ficheiro
+            seen = dedup.DigestSet()
+        source_file = os.path.basename(file)
+        chunks = read_csv_chunks(file, schema, columns, chunksize, cache)
+
+        if spill:
+            deduplicator = deduplicator or dedup.HashDeduplicator(memory_budget=memory_budget)
+            for chunk in chunks:
+                total_read += len(chunk)
+                deduplicator.add(chunk)
+            chunks = iter(())
+            if keep_source:
+                chunks, deduplicator = rechunk(deduplicator.partitions(), chunksize), None
+
+        for chunk in chunks:
+            if not spill:
+                total_read += len(chunk)
+            if deduplicate and not spill:
+                hashes = hash_rows(chunk)
+                # duplicados dentro do bloco + linhas já vistas em blocos anteriores
+                keep = dedup.first_occurrences(hashes) & ~seen.contains(hashes)
+                seen.add(hashes[keep])
+                chunk = chunk[keep]
+
+            if chunk.empty:
+                continue
+
+            if keep_source:
+                chunk = chunk.assign(__source_file=source_file)
+                if columns:
+                    chunk = chunk[[c for c in columns if c in chunk.columns]]
+            total_rows += len(chunk)
+            yield chunk
+
+        logger.info(f"Lido ficheiro em blocos: {file}")
+        if state is not None:
+            state.stage_files(source_name, [file])
+
+    if deduplicator is not None:
+        for chunk in rechunk(deduplicator.partitions(), chunksize):
+            total_rows += len(chunk)
+            yield chunk
+
+    logger.info(
+        f"Leitura em streaming concluída: {total_rows} linhas "
+        f"({total_read - total_rows} duplicados removidos)"
+    )
+    logger.info(f"Cache de encodings: {cache.stats()}")
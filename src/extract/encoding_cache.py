@@ -0,0 +1,92 @@
+import json
+import os
+from typing import Optional, Dict
+
+from loguru import logger
+
+DEFAULT_CACHE_PATH = os.path.join("data/staging", ".encoding_cache.json")
+
+
+class EncodingCache:
+    """
+    Cache persistente de encodings detectados, indexado por caminho + tamanho + mtime.
+    Um ficheiro alterado muda de fingerprint e volta a ser detectado; a entrada
+    antiga desse caminho é substituída, para o cache não crescer a cada alteração.
+    """
+
+    def __init__(self, path: str = DEFAULT_CACHE_PATH):
+        self.path = path
+        self.entries: Dict[str, str] = {}
+        self._keys: Dict[str, str] = {}  # caminho → fingerprint atual
+        self.hits = 0
+        self.misses = 0
+        self._dirty = False
+        self._load()
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                self.entries = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Cache de encodings ignorado ({self.path}): {e}")
+            self.entries = {}
+        for key in self.entries:
+            self._keys[self._file_of(key)] = key
+        if len(self._keys) < len(self.entries):
+            # Caches antigos guardavam uma entrada por versão do ficheiro: fica a última
+            self.entries = {key: self.entries[key] for key in self._keys.values()}
+            self._dirty = True
+
+    @staticmethod
+    def _file_of(key: str) -> str:
+        return key.rsplit("|", 2)[0]
+
+    @staticmethod
+    def fingerprint(file_path: str) -> str:
+        st = os.stat(file_path)
+        return f"{os.path.abspath(file_path)}|{st.st_size}|{st.st_mtime_ns}"
+
+    def get(self, file_path: str) -> Optional[str]:
+        enc = self.entries.get(self.fingerprint(file_path))
+        if enc is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return enc
+
+    def put(self, file_path: str, encoding: str):
+        key = self.fingerprint(file_path)
+        if self.entries.get(key) != encoding:
+            old_key = self._keys.get(self._file_of(key))
+            if old_key is not None and old_key != key:
+                del self.entries[old_key]
+            self.entries[key] = encoding
+            self._keys[self._file_of(key)] = key
+            self._dirty = True
+
+    def save(self):
+        """Grava o cache em disco (escrita atómica), apenas se houve alterações."""
+        if not self._dirty:
+            return
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.entries, f)
+        os.replace(tmp_path, self.path)
+        self._dirty = False
+
+    def stats(self) -> Dict[str, int]:
+        return {"hits": self.hits, "misses": self.misses, "entries": len(self.entries)}
+
+
+_default_cache: Optional[EncodingCache] = None
+
+
+def get_encoding_cache() -> EncodingCache:
+    """Devolve o cache partilhado do processo (carregado na primeira utilização)."""
+    global _default_cache
+    if _default_cache is None:
+        _default_cache = EncodingCache()
+    return _default_cache
@@ -0,0 +1,93 @@
+import json
+from typing import Any, Dict, List, Optional, Sequence
+
+import pandas as pd
+from loguru import logger
+
+try:
+    import orjson
+except ImportError:  # orjson é opcional
+    orjson = None
+
+_MISSING = object()
+
+
+def loads(raw: bytes) -> Any:
+    """Descodifica JSON com orjson (se instalado) ou com o módulo json."""
+    if orjson is not None:
+        return orjson.loads(raw)
+    return json.loads(raw)
+
+
+class ColumnBlock:
+    """Colunas de uma página em listas Python, sem construir DataFrame."""
+    __slots__ = ("columns", "n_rows")
+
+    def __init__(self, columns: Dict[str, List[Any]], n_rows: int):
+        self.columns = columns
+        self.n_rows = n_rows
+
+    def __len__(self) -> int:
+        return self.n_rows
+
+    @property
+    def empty(self) -> bool:
+        return self.n_rows == 0
+
+
+def _lookup(record: Any, path: str, parts: Sequence[str]) -> Any:
+    if not isinstance(record, dict):
+        return _MISSING
+    # Chave literal com ponto tem prioridade (mesmo resultado que json_normalize)
+    value = record.get(path, _MISSING)
+    if value is not _MISSING or len(parts) == 1:
+        return value
+    value = record
+    for part in parts:
+        if not isinstance(value, dict):
+            return _MISSING
+        value = value.get(part, _MISSING)
+        if value is _MISSING:
+            return _MISSING
+    return value
+
+
+def flatten_records(records: List[Any], columns: List[str]) -> ColumnBlock:
+    """
+    Extrai apenas os caminhos configurados (ex: "user.id") de cada registo,
+    em vez de achatar o documento inteiro como o pd.json_normalize.
+    """
+    paths = [(col, col.split(".")) for col in columns]
+    data: Dict[str, List[Any]] = {}
+    for col, parts in paths:
+        values = [_lookup(r, col, parts) for r in records]
+        if any(v is not _MISSING for v in values):
+            data[col] = [None if v is _MISSING else v for v in values]
+    return ColumnBlock(data, len(records))
+
+
+def blocks_to_frame(blocks: List[ColumnBlock], columns: List[str]) -> pd.DataFrame:
+    """Junta os blocos de todas as páginas num único DataFrame (uma única construção)."""
+    total_rows = sum(len(b) for b in blocks)
+    found = [c for c in columns if any(c in b.columns for b in blocks)]
+    missing = [c for c in columns if c not in found]
+    if missing:
+        logger.warning(f"Colunas não encontradas: {missing}")
+
+    data = {}
+    for col in found:
+        values: List[Any] = []
+        for block in blocks:
+            values.extend(block.columns.get(col, [None] * block.n_rows))
+        data[col] = values
+    df = pd.DataFrame(data, index=pd.RangeIndex(total_rows), columns=found)
+    logger.info(f"JSON normalizado (fast): {df.shape[0]} linhas, {df.shape[1]} colunas")
+    return df
+
+
+def normalize_records_fast(records: Optional[List[Any]], payload: Any,
+                           columns: List[str]) -> ColumnBlock:
+    """Normaliza uma página no motor rápido (objeto simples = um registo)."""
+    if records is None:
+        records = [payload]
+    return flatten_records(records, columns)
@@ -0,0 +1,170 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from typing import Optional, Dict, Any
+
+import requests
+from loguru import logger
+
+from extract.pagination import PageRequest
+
+DEFAULT_CACHE_DIR = os.path.join("data/staging", ".http_cache")
+
+
+class HttpCache:
+    """
+    Cache em disco de respostas da API, indexado por URL + parâmetros.
+
+    Guarda o corpo JSON da resposta (tal como veio do servidor), os validadores
+    ETag/Last-Modified e o pedido seguinte. Por defeito cada página é revalidada
+    com um pedido condicional e, com 304, reutiliza-se o corpo guardado. Com
+    `ttl_seconds` (opt-in), as páginas dentro do TTL são reutilizadas sem pedido,
+    exceto a última página, que é sempre revalidada (é a que ganha registos novos).
+    Quando o tamanho total excede `max_bytes`, saem primeiro as entradas menos usadas.
+    """
+
+    def __init__(self, cache_dir: str = DEFAULT_CACHE_DIR, ttl_seconds: float = 0,
+                 max_bytes: int = 512 * 1024 * 1024):
+        self.cache_dir = cache_dir
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self.index_path = os.path.join(cache_dir, "index.json")
+        self.index: Dict[str, Dict[str, Any]] = {}
+        self.stats = {"fresh": 0, "revalidated": 0, "misses": 0, "evicted": 0}
+        self._lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+        self._load_index()
+
+    def _load_index(self):
+        if not os.path.exists(self.index_path):
+            return
+        try:
+            with open(self.index_path, "r", encoding="utf-8") as f:
+                self.index = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Índice do cache HTTP ignorado ({self.index_path}): {e}")
+            self.index = {}
+        # Entradas de versões anteriores (páginas normalizadas em pickle) não são lidas
+        for key, entry in list(self.index.items()):
+            if not entry["file"].endswith(".json"):
+                del self.index[key]
+                try:
+                    os.remove(os.path.join(self.cache_dir, entry["file"]))
+                except OSError:
+                    pass
+
+    @staticmethod
+    def key(url: str, params: Optional[Dict[str, Any]] = None) -> str:
+        raw = json.dumps([url, sorted((params or {}).items())], default=str)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def lookup(self, url: str, params: Optional[Dict[str, Any]] = None) -> Optional[Dict[str, Any]]:
+        """Devolve a entrada (metadados) do pedido, se existir."""
+        key = self.key(url, params)
+        with self._lock:
+            entry = self.index.get(key)
+            if entry and not os.path.exists(os.path.join(self.cache_dir, entry["file"])):
+                self.index.pop(key, None)
+                return None
+            return entry
+
+    def is_fresh(self, entry: Dict[str, Any]) -> bool:
+        """Reutilizável sem pedido: dentro do TTL e não é a última página."""
+        if entry.get("next_request") is None:
+            return False
+        return time.time() - entry["stored_at"] < self.ttl_seconds
+
+    @staticmethod
+    def conditional_headers(entry: Optional[Dict[str, Any]]) -> Dict[str, str]:
+        """Cabeçalhos If-None-Match / If-Modified-Since para revalidar a entrada."""
+        headers = {}
+        if entry and entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry and entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+        return headers
+
+    def load(self, entry: Dict[str, Any], revalidated: bool = False) -> Dict[str, Any]:
+        """
+        Lê a página guardada ({"body", "n_rows", "next_request"}) e atualiza a
+        utilização (e o TTL, se revalidada com 304).
+        """
+        with open(os.path.join(self.cache_dir, entry["file"]), "rb") as f:
+            body = f.read()
+        next_request = entry.get("next_request")
+        page = {
+            "body": body,
+            "n_rows": entry["n_rows"],
+            "next_request": PageRequest(*next_request) if next_request is not None else None,
+        }
+        with self._lock:
+            entry["last_access"] = time.time()
+            if revalidated:
+                entry["stored_at"] = entry["last_access"]
+                self.stats["revalidated"] += 1
+            else:
+                self.stats["fresh"] += 1
+        return page
+
+    def store(self, url: str, params: Optional[Dict[str, Any]], response: requests.Response,
+              n_rows: int, next_request: Optional[PageRequest] = None):
+        """Guarda o corpo JSON da resposta com os validadores e o pedido seguinte."""
+        key = self.key(url, params)
+        file_name = f"{key}.json"
+        tmp_path = os.path.join(self.cache_dir, f"{file_name}.tmp")
+        with open(tmp_path, "wb") as f:
+            f.write(response.content)
+        os.replace(tmp_path, os.path.join(self.cache_dir, file_name))
+
+        now = time.time()
+        with self._lock:
+            self.stats["misses"] += 1
+            self.index[key] = {
+                "url": url,
+                "file": file_name,
+                "etag": response.headers.get("ETag"),
+                "last_modified": response.headers.get("Last-Modified"),
+                "n_rows": n_rows,
+                "next_request": list(next_request) if next_request is not None else None,
+                "stored_at": now,
+                "last_access": now,
+                "size": os.path.getsize(os.path.join(self.cache_dir, file_name)),
+            }
+            self._evict()
+
+    def _evict(self):
+        total = sum(e["size"] for e in self.index.values())
+        if total <= self.max_bytes:
+            return
+        for key, entry in sorted(self.index.items(), key=lambda kv: kv[1]["last_access"]):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(os.path.join(self.cache_dir, entry["file"]))
+            except OSError as e:
+                logger.warning(f"Não foi possível apagar {entry['file']}: {e}")
+            total -= entry["size"]
+            del self.index[key]
+            self.stats["evicted"] += 1
+
+    def save(self):
+        """Grava o índice em disco (escrita atómica)."""
+        with self._lock:
+            tmp_path = f"{self.index_path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(self.index, f)
+            os.replace(tmp_path, self.index_path)
+        logger.info(f"Cache HTTP: {self.stats}")
+
+
+def get_http_cache(cache: Optional[Any]) -> Optional[HttpCache]:
+    """Aceita uma instância de HttpCache ou a configuração `http_cache` de sources.json."""
+    if cache is None or cache is False:
+        return None
+    if isinstance(cache, HttpCache):
+        return cache
+    if cache is True:
+        return HttpCache()
+    return HttpCache(**cache)
@@ -0,0 +1,178 @@
+from typing import Optional, Dict, Any, NamedTuple, Union
+
+import requests
+from loguru import logger
+
+
+class PageRequest(NamedTuple):
+    """Pedido de uma página: URL, parâmetros e posição (0 = primeira página)."""
+    url: str
+    params: Optional[Dict[str, Any]]
+    index: int
+
+
+class PaginationStrategy:
+    """
+    Estratégia base: decide o pedido seguinte a partir da resposta atual.
+
+    Estratégias `predictable` conseguem calcular o pedido N sem a resposta N-1
+    e podem ser usadas no modo concorrente do extract_api.
+    """
+    predictable = False
+
+    def first_request(self, base_url: str, params: Optional[Dict[str, Any]]) -> PageRequest:
+        return PageRequest(base_url, dict(params or {}), 0)
+
+    def next_request(self, request: PageRequest, response: requests.Response,
+                     payload: Any, n_rows: int) -> Optional[PageRequest]:
+        return None
+
+    def is_last_page(self, n_rows: int) -> bool:
+        return n_rows == 0
+
+
+class SinglePage(PaginationStrategy):
+    """Sem paginação: um único pedido."""
+
+    def is_last_page(self, n_rows: int) -> bool:
+        return True
+
+
+class PageNumberPagination(PaginationStrategy):
+    """Parâmetro de página incremental (ex: ?page=1, ?page=2, ...)."""
+    predictable = True
+
+    def __init__(self, param: str = "page", start: int = 1, page_size: Optional[int] = None):
+        self.param = param
+        self.start = start
+        self.page_size = page_size
+
+    def request_for(self, base_url: str, params: Optional[Dict[str, Any]], index: int) -> PageRequest:
+        query_params = dict(params or {})
+        query_params[self.param] = self.start + index
+        return PageRequest(base_url, query_params, index)
+
+    def first_request(self, base_url, params):
+        return self.request_for(base_url, params, 0)
+
+    def next_request(self, request, response, payload, n_rows):
+        if self.is_last_page(n_rows):
+            return None
+        return self.request_for(request.url, request.params, request.index + 1)
+
+    def is_last_page(self, n_rows: int) -> bool:
+        # Com page_size conhecido, uma página incompleta é a última
+        return n_rows == 0 or (self.page_size is not None and n_rows < self.page_size)
+
+
+class OffsetLimitPagination(PaginationStrategy):
+    """Paginação por offset/limit (ex: ?offset=0&limit=100)."""
+    predictable = True
+
+    def __init__(self, offset_param: str = "offset", limit_param: str = "limit",
+                 limit: int = 100, start: int = 0):
+        self.offset_param = offset_param
+        self.limit_param = limit_param
+        self.limit = limit
+        self.start = start
+
+    def request_for(self, base_url: str, params: Optional[Dict[str, Any]], index: int) -> PageRequest:
+        query_params = dict(params or {})
+        query_params[self.offset_param] = self.start + index * self.limit
+        query_params[self.limit_param] = self.limit
+        return PageRequest(base_url, query_params, index)
+
+    def first_request(self, base_url, params):
+        return self.request_for(base_url, params, 0)
+
+    def next_request(self, request, response, payload, n_rows):
+        if self.is_last_page(n_rows):
+            return None
+        return self.request_for(request.url, request.params, request.index + 1)
+
+    def is_last_page(self, n_rows: int) -> bool:
+        return n_rows < self.limit
+
+
+class CursorPagination(PaginationStrategy):
+    """
+    Cursor devolvido no corpo da resposta (ex: {"data": [...], "meta": {"next": "abc"}}).
+    Se o cursor for um URL completo, é usado diretamente como próximo pedido.
+    """
+
+    def __init__(self, cursor_param: str = "cursor", cursor_path: str = "next"):
+        self.cursor_param = cursor_param
+        self.cursor_path = cursor_path
+
+    def next_request(self, request, response, payload, n_rows):
+        if n_rows == 0:
+            return None
+        cursor = _get_path(payload, self.cursor_path)
+        if not cursor:
+            return None
+        if isinstance(cursor, str) and cursor.startswith(("http://", "https://")):
+            return PageRequest(cursor, None, request.index + 1)
+        query_params = dict(request.params or {})
+        query_params[self.cursor_param] = cursor
+        return PageRequest(request.url, query_params, request.index + 1)
+
+
+class LinkHeaderPagination(PaginationStrategy):
+    """Cabeçalho `Link` (RFC 5988) com rel="next"."""
+
+    def next_request(self, request, response, payload, n_rows):
+        if n_rows == 0:
+            return None
+        next_url = response.links.get("next", {}).get("url")
+        if not next_url:
+            return None
+        # O URL do Link já inclui a query completa
+        return PageRequest(next_url, None, request.index + 1)
+
+
+STRATEGIES = {
+    "page": PageNumberPagination,
+    "offset": OffsetLimitPagination,
+    "cursor": CursorPagination,
+    "link": LinkHeaderPagination,
+}
+
+
+def get_pagination_strategy(
+        pagination: Optional[Union[Dict[str, Any], PaginationStrategy]] = None,
+        pagination_key: Optional[str] = None,
+        page_param_start: int = 1
+) -> PaginationStrategy:
+    """
+    Devolve a estratégia de paginação a partir da configuração da fonte.
+
+    Exemplos (sources.json):
+        {"type": "page", "param": "page", "start": 1, "page_size": 100}
+        {"type": "offset", "offset_param": "offset", "limit_param": "limit", "limit": 100}
+        {"type": "cursor", "cursor_param": "cursor", "cursor_path": "meta.next"}
+        {"type": "link"}
+    Sem `pagination`, mantém o comportamento antigo de `pagination_key`.
+    """
+    if isinstance(pagination, PaginationStrategy):
+        return pagination
+    if pagination:
+        options = dict(pagination)
+        strategy_type = options.pop("type", "page")
+        if strategy_type not in STRATEGIES:
+            raise ValueError(f"Tipo de paginação desconhecido: {strategy_type}")
+        strategy = STRATEGIES[strategy_type](**options)
+        logger.info(f"Paginação '{strategy_type}' configurada: {options}")
+        return strategy
+    if pagination_key:
+        return PageNumberPagination(pagination_key, page_param_start)
+    return SinglePage()
+
+
+def _get_path(payload: Any, path: str) -> Any:
+    value = payload
+    for part in path.split("."):
+        if not isinstance(value, dict):
+            return None
+        value = value.get(part)
+    return value
+
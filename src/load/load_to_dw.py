@@ -0,0 +1,191 @@
+import os
+import time
+from typing import Any, Dict, Iterator, List, Optional, Union
+
+import pandas as pd
+import pyarrow.dataset as ds
+from loguru import logger
+
+from extract.db_extractor import get_connection_pool
+from utils.config_loader import get_env_var, load_json
+from utils.db_pool import ConnectionPool
+
+DEFAULT_BATCH_SIZE = 10_000
+DEFAULT_COMMIT_SIZE = 100_000
+
+
+def dw_connection_config(conn_name: str) -> Dict[str, Any]:
+    """Resolve a conexão de destino (db_config.json + credenciais do .env)."""
+    db_conf = dict(load_json("db_config.json")[conn_name])
+    db_conf.update({
+        "user": get_env_var(db_conf["user_env"]),
+        "password": get_env_var(db_conf["password_env"]),
+    })
+    return {"connection": conn_name, "db_config": db_conf}
+
+
+def insert_statement(table: str, columns: List[str]) -> str:
+    cols = ", ".join(f"[{c}]" for c in columns)
+    placeholders = ", ".join("?" for _ in columns)
+    return f"INSERT INTO [{table}] ({cols}) VALUES ({placeholders})"
+
+
+def delete_statement(table: str, keys: List[str]) -> str:
+    where = " AND ".join(f"[{k}] = ?" for k in keys)
+    return f"DELETE FROM [{table}] WHERE {where}"
+
+
+StagedPath = Union[str, List[str]]
+
+
+def staged_dataset(file_path: StagedPath) -> ds.Dataset:
+    """
+    Dataset Parquet do staging: ficheiro, pasta ou lista de ficheiros de um dataset
+    particionado (as colunas de partição são lidas dos caminhos ID_TEMPO=.../).
+    """
+    if isinstance(file_path, str):
+        return ds.dataset(file_path, format="parquet", partitioning="hive")
+    root = os.path.commonpath([os.path.dirname(f) for f in file_path])
+    while "=" in os.path.basename(root):
+        root = os.path.dirname(root)
+    return ds.dataset(file_path, format="parquet", partitioning="hive", partition_base_dir=root)
+
+
+def is_csv(file_path: StagedPath) -> bool:
+    return isinstance(file_path, str) and file_path.endswith(".csv")
+
+
+def iter_staged_batches(file_path: StagedPath, batch_size: int,
+                        columns: Optional[List[str]] = None) -> Iterator[List[tuple]]:
+    """
+    Lê o staging (ficheiro, pasta ou lista de ficheiros Parquet, ou CSV) em lotes de
+    tuplos prontos para executemany, sem carregar a tabela inteira em memória.
+    """
+    if is_csv(file_path):
+        for chunk in pd.read_csv(file_path, chunksize=batch_size, usecols=columns):
+            chunk = chunk.astype(object).where(chunk.notna(), None)
+            yield list(chunk.itertuples(index=False, name=None))
+        return
+
+    dataset = staged_dataset(file_path)
+    for batch in dataset.to_batches(columns=columns, batch_size=batch_size):
+        if batch.num_rows:
+            yield list(zip(*(col.to_pylist() for col in batch.columns)))
+
+
+def staged_columns(file_path: StagedPath) -> List[str]:
+    if is_csv(file_path):
+        return list(pd.read_csv(file_path, nrows=0).columns)
+    return staged_dataset(file_path).schema.names
+
+
+def staged_keys(file_path: StagedPath, keys: List[str], batch_size: int) -> List[tuple]:
+    """Valores distintos das colunas `keys` no staging (ex: os ID_TEMPO do lote)."""
+    found = set()
+    for rows in iter_staged_batches(file_path, batch_size, keys):
+        found.update(rows)
+    return sorted(found, key=repr)
+
+
+def load_table(conn, file_path: StagedPath, table: str, columns: Optional[List[str]] = None,
+               batch_size: int = DEFAULT_BATCH_SIZE, commit_size: Optional[int] = DEFAULT_COMMIT_SIZE,
+               mode: str = "append", keys: Optional[List[str]] = None) -> Dict[str, Any]:
+    """
+    Carrega o ficheiro de staging na tabela em lotes de `batch_size` linhas.
+
+    Faz commit a cada `commit_size` linhas (None = uma única transação para a tabela).
+    Com mode="replace" a tabela é esvaziada na mesma transação do primeiro lote.
+    Com mode="upsert" só são apagadas as linhas com as `keys` presentes no staging
+    (ex: totais por ID_TEMPO de uma agregação incremental, que voltam a vir completos).
+    Em caso de erro é feito rollback do lote em curso e a exceção é propagada.
+    """
+    columns = columns or staged_columns(file_path)
+    sql = insert_statement(table, columns)
+    if mode == "upsert" and not keys:
+        raise ValueError(f"Carga em modo upsert sem chaves (load.keys) para {table}.")
+
+    cursor = conn.cursor()
+    if hasattr(cursor, "fast_executemany"):
+        cursor.fast_executemany = True  # pyodbc: envia o lote inteiro num só round-trip
+
+    stats = {"table": table, "rows": 0, "batches": 0, "commits": 0}
+    pending = 0
+    start = time.perf_counter()
+    try:
+        if mode == "replace":
+            cursor.execute(f"DELETE FROM [{table}]")
+        elif mode == "upsert":
+            replaced = staged_keys(file_path, keys, batch_size)
+            if replaced:
+                cursor.executemany(delete_statement(table, keys), replaced)
+            stats["replaced_keys"] = len(replaced)
+        elif mode != "append":
+            raise ValueError(f"Modo de carga desconhecido: {mode}")
+
+        for rows in iter_staged_batches(file_path, batch_size, columns):
+            cursor.executemany(sql, rows)
+            stats["rows"] += len(rows)
+            stats["batches"] += 1
+            pending += len(rows)
+            if commit_size and pending >= commit_size:
+                conn.commit()
+                stats["commits"] += 1
+                pending = 0
+        conn.commit()
+        stats["commits"] += 1
+    except Exception as e:
+        conn.rollback()
+        logger.error(f"Erro ao carregar {table} (linhas confirmadas: "
+                     f"{stats['rows'] - pending}): {e}")
+        raise
+    finally:
+        cursor.close()
+
+    stats["seconds"] = round(time.perf_counter() - start, 3)
+    stats["rows_per_sec"] = round(stats["rows"] / stats["seconds"]) if stats["seconds"] else stats["rows"]
+    logger.info(
+        f"Carregados {stats['rows']} registos em {table} "
+        f"({stats['seconds']}s, {stats['rows_per_sec']} linhas/s, {stats['commits']} commit(s))"
+    )
+    return stats
+
+
+def load_to_dw(file_path: StagedPath, cfg: Dict, pool: Optional[ConnectionPool] = None) -> Dict[str, Any]:
+    """
+    Carrega o staging de uma fonte no Data Warehouse.
+
+    A configuração vem do bloco "load" da fonte em sources.json:
+        table: tabela de destino (por defeito target_table)
+        connection: conexão de destino em db_config.json (por defeito a da fonte)
+        columns, batch_size, commit_size, mode ("append" | "replace" | "upsert")
+        keys: colunas que identificam as linhas substituídas em mode="upsert"
+    """
+    load_cfg = cfg.get("load", {})
+    table = load_cfg.get("table", cfg.get("target_table"))
+    if not table:
+        raise ValueError("Tabela de destino não definida (load.table ou target_table).")
+    paths = [file_path] if isinstance(file_path, str) else file_path
+    missing = [p for p in paths if not os.path.exists(p)]
+    if missing:
+        raise FileNotFoundError(f"Staging não encontrado: {missing}")
+
+    if pool is None:
+        conn_name = load_cfg.get("connection", cfg.get("connection"))
+        if not conn_name:
+            raise ValueError(f"Conexão de destino não definida para {table} (load.connection).")
+        conn_cfg = cfg if conn_name == cfg.get("connection") and "db_config" in cfg \
+            else dw_connection_config(conn_name)
+        pool = get_connection_pool(conn_cfg)
+
+    logger.info(f"A carregar {len(paths)} ficheiro(s) de staging → {table}...")
+    with pool.connection() as conn:
+        return load_table(
+            conn,
+            file_path,
+            table,
+            columns=load_cfg.get("columns"),
+            batch_size=load_cfg.get("batch_size", DEFAULT_BATCH_SIZE),
+            commit_size=load_cfg.get("commit_size", DEFAULT_COMMIT_SIZE),
+            mode=load_cfg.get("mode", "append"),
+            keys=load_cfg.get("keys"),
+        )
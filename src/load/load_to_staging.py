@@ -1,13 +1,145 @@
 import os
+import shutil
+import time
+import uuid
 import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
 from datetime import datetime
 from loguru import logger
 
+from load import staging_manifest as manifest
+
+# Opções de escrita Parquet (bloco "staging" em sources.json)
+DEFAULT_COMPRESSION = "snappy"
+DEFAULT_ROW_GROUP_SIZE = 128 * 1024
+DATA_EXTENSIONS = (".parquet", ".csv")
+# Ficheiros temporários mais antigos do que isto são restos de uma escrita interrompida
+STALE_TMP_SECONDS = 6 * 3600
+
+
+def staging_options(cfg: dict) -> dict:
+    """
+    Lê o bloco "staging" da fonte, ex:
+        {"partition_by": ["ID_TEMPO"], "compression": "zstd",
+         "row_group_size": 100000, "use_dictionary": ["ContractNumber"],
+         "key_columns": ["TransactionID"]}
+
+    key_columns: colunas com min/max no manifesto (por defeito as de partição
+    e a incremental_key da fonte).
+    """
+    options = cfg.get("staging", {})
+    partition_by = options.get("partition_by") or []
+    if isinstance(partition_by, str):
+        partition_by = [partition_by]
+    key_columns = options.get("key_columns")
+    if key_columns is None:
+        key_columns = list(partition_by)
+        if cfg.get("incremental_key") and cfg["incremental_key"] not in key_columns:
+            key_columns.append(cfg["incremental_key"])
+    return {
+        "partition_by": partition_by,
+        "compression": options.get("compression", DEFAULT_COMPRESSION),
+        "row_group_size": options.get("row_group_size", DEFAULT_ROW_GROUP_SIZE),
+        "use_dictionary": options.get("use_dictionary", True),
+        "key_columns": key_columns,
+    }
+
+
+def write_partitioned(df: pd.DataFrame, table_dir: str, basename: str, options: dict, mode: str):
+    """
+    Grava um dataset Parquet particionado estilo hive (ex: ID_TEMPO=20250925/).
+
+    Os ficheiros são gravados numa pasta temporária oculta e só depois movidos
+    (rename atómico) para as partições finais.
+    - append: acrescenta ficheiros novos às partições (sem copiar os existentes)
+    - replace: substitui apenas as partições presentes no lote
+
+    Devolve (ficheiros gravados, ficheiros substituídos), relativos a table_dir.
+    """
+    missing = [c for c in options["partition_by"] if c not in df.columns]
+    if missing:
+        raise KeyError(f"Colunas de partição não encontradas: {missing}")
+
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    file_options = ds.ParquetFileFormat().make_write_options(
+        compression=options["compression"],
+        use_dictionary=options["use_dictionary"],
+    )
+    row_group_size = options["row_group_size"]
+    tmp_dir = os.path.join(table_dir, f".tmp_{basename}")
+    written = []
+    try:
+        ds.write_dataset(
+            table,
+            base_dir=tmp_dir,
+            format="parquet",
+            partitioning=options["partition_by"],
+            partitioning_flavor="hive",
+            file_options=file_options,
+            basename_template=f"{basename}_{{i}}.parquet",
+            max_rows_per_group=row_group_size,
+            min_rows_per_group=min(row_group_size, max(len(df), 1)),
+            file_visitor=lambda written_file: written.append(written_file.path),
+        )
+
+        new_files = sorted(os.path.relpath(p, tmp_dir).replace(os.sep, "/") for p in written)
+        replaced = []
+        for rel in new_files:
+            final = os.path.join(table_dir, rel)
+            partition_dir = os.path.dirname(final)
+            if mode == "replace" and os.path.isdir(partition_dir):
+                partition = os.path.dirname(rel)
+                replaced += [
+                    f"{partition}/{f}" for f in os.listdir(partition_dir)
+                    if f.endswith(".parquet") and f"{partition}/{f}" not in new_files
+                ]
+            os.makedirs(partition_dir, exist_ok=True)
+            os.replace(os.path.join(tmp_dir, rel), final)
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    for rel in sorted(set(replaced)):
+        try:
+            os.remove(os.path.join(table_dir, rel))
+        except OSError as e:
+            logger.warning(f"Não foi possível apagar {rel}: {e}")
+    return new_files, sorted(set(replaced))
+
+
+def write_file(df: pd.DataFrame, file_path: str, format_type: str, options: dict):
+    """Grava um ficheiro único num nome temporário e renomeia-o no fim (atómico)."""
+    directory, filename = os.path.split(file_path)
+    tmp_path = os.path.join(directory, f".{filename}.tmp")
+    try:
+        if format_type == "parquet":
+            df.to_parquet(
+                tmp_path,
+                index=False,
+                compression=options["compression"],
+                row_group_size=options["row_group_size"],
+                use_dictionary=options["use_dictionary"],
+            )
+        elif format_type == "csv":
+            df.to_csv(tmp_path, index=False, encoding="utf-8")
+        else:
+            raise ValueError(f"Formato desconhecido: {format_type}")
+        os.replace(tmp_path, file_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
 
 def load_to_staging(df: pd.DataFrame, cfg: dict, mode: str = "replace"):
     """
     Grava o DataFrame em formato Parquet ou CSV na pasta staging/.
-    Cria versões datadas (yyyymmdd_hhmmss).
+    Cria versões datadas (yyyymmdd_hhmmss), registadas no manifesto da tabela
+    (_manifest.json) só depois de gravadas por completo.
+
+    Com "staging": {"partition_by": [...]} o Parquet é gravado como dataset
+    particionado em staging/<target_table>/ e é devolvida a lista de ficheiros
+    gravados nesta execução (só esses seguem para a carga no DW).
 
     Args:
         df: DataFrame a guardar
@@ -17,6 +149,7 @@ def load_to_staging(df: pd.DataFrame, cfg: dict, mode: str = "replace"):
 
     target_name = cfg.get("target_table", "unknown_table")
     format_type = cfg.get("staging_format", "parquet").lower()
+    options = staging_options(cfg)
 
     # Cria diretório staging se não existir
     os.makedirs("staging", exist_ok=True)
@@ -25,18 +158,36 @@ def load_to_staging(df: pd.DataFrame, cfg: dict, mode: str = "replace"):
     table_dir = os.path.join("staging", target_name)
     os.makedirs(table_dir, exist_ok=True)
 
-    # Nome de ficheiro com timestamp
+    # Um lote vazio nunca substitui versões existentes (apagaria a última versão boa)
+    if mode == "replace" and df.empty and has_versions(table_dir):
+        raise ValueError(f"Lote vazio: o staging de {target_name} não é substituído")
+
+    # Nome de versão com timestamp (sufixo único: várias cargas no mesmo segundo não se sobrepõem)
     timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    filename = f"{target_name}_{timestamp}.{format_type}"
-    file_path = os.path.join(table_dir, filename)
+    version = f"{target_name}_{timestamp}_{uuid.uuid4().hex[:8]}"
+    schema = manifest.schema_hash(df)
 
     try:
-        if format_type == "parquet":
-            df.to_parquet(file_path, index=False)
-        elif format_type == "csv":
-            df.to_csv(file_path, index=False, encoding="utf-8")
-        else:
-            raise ValueError(f"Formato desconhecido: {format_type}")
+        if format_type == "parquet" and options["partition_by"]:
+            new_files, replaced = write_partitioned(df, table_dir, version, options, mode)
+            entries = []
+            for rel in new_files:
+                path = os.path.join(table_dir, rel)
+                mins, maxs = manifest.parquet_ranges(path, rel, options["key_columns"])
+                rows = pq.ParquetFile(path).metadata.num_rows
+                entries.append(manifest.file_entry(table_dir, path, rows, schema, mins, maxs))
+            manifest.add_version(table_dir, target_name, version, entries, replaced)
+            logger.info(
+                f"Guardado {len(df)} registos em {table_dir} "
+                f"({len(new_files)} ficheiro(s), partições: {options['partition_by']}, modo: {mode})"
+            )
+            return [os.path.join(table_dir, rel) for rel in new_files]
+
+        file_path = os.path.join(table_dir, f"{version}.{format_type}")
+        write_file(df, file_path, format_type, options)
+        mins, maxs = manifest.frame_ranges(df, options["key_columns"])
+        entry = manifest.file_entry(table_dir, file_path, len(df), schema, mins, maxs)
+        manifest.add_version(table_dir, target_name, version, [entry])
 
         logger.info(f"Guardado {len(df)} registos em {file_path}")
 
@@ -51,13 +202,64 @@ def load_to_staging(df: pd.DataFrame, cfg: dict, mode: str = "replace"):
         raise
 
 
-def cleanup_old_versions(table_dir: str, keep_last: int = 1):
-    """Remove versões antigas, mantendo apenas as mais recentes."""
-    files = sorted(
-        [f for f in os.listdir(table_dir) if f.endswith(".parquet") or f.endswith(".csv")],
-        reverse=True
-    )
-    for old_file in files[keep_last:]:
+def has_versions(table_dir: str) -> bool:
+    """Se a pasta de staging já tem dados (versões no manifesto ou ficheiros sem manifesto)."""
+    if manifest.read_manifest(table_dir) is not None:
+        return manifest.latest_version(table_dir) is not None
+    return any(f.endswith(DATA_EXTENSIONS) for f in os.listdir(table_dir))
+
+
+def latest_staging(cfg: dict) -> list:
+    """Ficheiros da última versão gravada da fonte (pelo manifesto, sem listar a pasta)."""
+    table_dir = os.path.join("staging", cfg.get("target_table", "unknown_table"))
+    version = manifest.latest_version(table_dir)
+    if version is None:
+        return []
+    return [os.path.join(table_dir, f["file"]) for f in version["files"]]
+
+
+def read_staging(cfg: dict, columns: list = None, filters: list = None) -> pd.DataFrame:
+    """
+    Lê o staging Parquet de uma fonte. Em datasets particionados, os filtros sobre
+    colunas de partição (ex: [("ID_TEMPO", "=", 20250925)]) só leem as pastas necessárias;
+    com manifesto, os ficheiros cujo min/max não satisfaz os filtros nem são abertos.
+    """
+    table_dir = os.path.join("staging", cfg.get("target_table", "unknown_table"))
+    files = manifest.manifest_files(table_dir, filters)
+    if files is None:
+        return pq.read_table(table_dir, columns=columns, filters=filters, partitioning="hive").to_pandas()
+    if not files:
+        return pd.DataFrame(columns=columns)
+    dataset = ds.dataset(files, format="parquet", partitioning="hive", partition_base_dir=table_dir)
+    expression = pq.filters_to_expression(filters) if filters else None
+    return dataset.to_table(columns=columns, filter=expression).to_pandas()
+
+
+def cleanup_old_versions(table_dir: str, keep_last: int = 1, stale_after: float = STALE_TMP_SECONDS):
+    """
+    Remove versões antigas, mantendo apenas as mais recentes.
+    Com manifesto, as versões a manter vêm do manifesto (por ordem de gravação)
+    e qualquer outro ficheiro de dados na pasta (ex: restos de uma falha) é apagado.
+    Os temporários (.<nome>.tmp) só são apagados com mais de `stale_after` segundos:
+    os recentes podem ser de uma escrita em curso noutro processo.
+    """
+    cutoff = time.time() - stale_after
+    for name in os.listdir(table_dir):
+        path = os.path.join(table_dir, name)
+        if name.startswith(".") and name.endswith(".tmp") and os.path.getmtime(path) < cutoff:
+            os.remove(path)
+
+    if manifest.read_manifest(table_dir) is not None:
+        manifest.drop_versions(table_dir, keep_last)
+        keep = {os.path.basename(f) for f in manifest.manifest_files(table_dir)}
+        old_files = [f for f in os.listdir(table_dir) if f.endswith(DATA_EXTENSIONS) and f not in keep]
+    else:
+        old_files = sorted(
+            [f for f in os.listdir(table_dir) if f.endswith(DATA_EXTENSIONS)],
+            reverse=True
+        )[keep_last:]
+
+    for old_file in old_files:
         try:
             os.remove(os.path.join(table_dir, old_file))
         except Exception as e:
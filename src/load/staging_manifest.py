@@ -0,0 +1,203 @@
+import hashlib
+import json
+import os
+import threading
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+import pandas as pd
+import pyarrow.parquet as pq
+from loguru import logger
+
+MANIFEST_NAME = "_manifest.json"
+
+_lock = threading.Lock()
+
+# Operadores de filtro (formato pyarrow) avaliáveis só com min/max
+_PRUNE_OPS = {
+    "=": lambda lo, hi, v: lo <= v <= hi,
+    "==": lambda lo, hi, v: lo <= v <= hi,
+    ">": lambda lo, hi, v: hi > v,
+    ">=": lambda lo, hi, v: hi >= v,
+    "<": lambda lo, hi, v: lo < v,
+    "<=": lambda lo, hi, v: lo <= v,
+    "in": lambda lo, hi, v: any(lo <= x <= hi for x in v),
+}
+
+
+def manifest_path(table_dir: str) -> str:
+    return os.path.join(table_dir, MANIFEST_NAME)
+
+
+def read_manifest(table_dir: str) -> Optional[Dict[str, Any]]:
+    path = manifest_path(table_dir)
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def write_manifest(table_dir: str, manifest: Dict[str, Any]):
+    """Grava o manifesto numa escrita atómica (temporário + rename)."""
+    path = manifest_path(table_dir)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2, default=str)
+    os.replace(tmp_path, path)
+
+
+def file_checksum(path: str, chunk_size: int = 1024 * 1024) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def schema_hash(df: pd.DataFrame) -> str:
+    """Hash do schema lógico (nomes e tipos das colunas) de uma versão."""
+    schema = [[str(col), str(dtype)] for col, dtype in df.dtypes.items()]
+    return hashlib.sha256(json.dumps(schema).encode("utf-8")).hexdigest()[:16]
+
+
+def _scalar(value: Any) -> Any:
+    if hasattr(value, "item"):
+        value = value.item()
+    if isinstance(value, (pd.Timestamp, datetime)):
+        return value.isoformat()
+    return value
+
+
+def frame_ranges(df: pd.DataFrame, key_columns: List[str]) -> Tuple[Dict, Dict]:
+    """Min/max das colunas-chave calculados sobre o DataFrame (vetorizado)."""
+    mins, maxs = {}, {}
+    for col in key_columns:
+        if col in df.columns and df[col].notna().any():
+            mins[col] = _scalar(df[col].min())
+            maxs[col] = _scalar(df[col].max())
+    return mins, maxs
+
+
+def _partition_values(rel_path: str) -> Dict[str, Any]:
+    values = {}
+    for part in os.path.dirname(rel_path).split("/"):
+        if "=" in part:
+            key, _, raw = part.partition("=")
+            try:
+                values[key] = int(raw)
+            except ValueError:
+                values[key] = raw
+    return values
+
+
+def parquet_ranges(path: str, rel_path: str, key_columns: List[str]) -> Tuple[Dict, Dict]:
+    """
+    Min/max de um ficheiro Parquet a partir das estatísticas dos row groups
+    (sem ler os dados); colunas de partição vêm do caminho (ID_TEMPO=...).
+    """
+    partitions = _partition_values(rel_path)
+    mins = {k: v for k, v in partitions.items() if k in key_columns}
+    maxs = dict(mins)
+
+    metadata = pq.ParquetFile(path).metadata
+    names = [metadata.schema.column(i).name for i in range(metadata.num_columns)]
+    for col in key_columns:
+        if col in partitions or col not in names:
+            continue
+        idx = names.index(col)
+        col_min = col_max = None
+        for rg in range(metadata.num_row_groups):
+            stats = metadata.row_group(rg).column(idx).statistics
+            if stats is None or not stats.has_min_max:
+                col_min = col_max = None
+                break
+            col_min = stats.min if col_min is None else min(col_min, stats.min)
+            col_max = stats.max if col_max is None else max(col_max, stats.max)
+        if col_min is not None:
+            mins[col], maxs[col] = _scalar(col_min), _scalar(col_max)
+    return mins, maxs
+
+
+def file_entry(table_dir: str, path: str, rows: int, schema: str,
+               mins: Dict, maxs: Dict) -> Dict[str, Any]:
+    return {
+        "file": os.path.relpath(path, table_dir).replace(os.sep, "/"),
+        "rows": int(rows),
+        "schema_hash": schema,
+        "min": mins,
+        "max": maxs,
+        "checksum": file_checksum(path),
+    }
+
+
+def add_version(table_dir: str, target_table: str, version: str, files: List[Dict[str, Any]],
+                replaced: Optional[List[str]] = None) -> Dict[str, Any]:
+    """
+    Regista uma nova versão no manifesto. `replaced` são ficheiros (relativos)
+    que deixaram de existir (ex: partições substituídas) e saem das versões anteriores.
+    """
+    with _lock:
+        manifest = read_manifest(table_dir) or {"target_table": target_table, "versions": []}
+        if replaced:
+            replaced_set = set(replaced)
+            for entry in manifest["versions"]:
+                entry["files"] = [f for f in entry["files"] if f["file"] not in replaced_set]
+            manifest["versions"] = [v for v in manifest["versions"] if v["files"]]
+        manifest["versions"].append({
+            "version": version,
+            "written_at": datetime.now().isoformat(),
+            "rows": sum(f["rows"] for f in files),
+            "files": files,
+        })
+        write_manifest(table_dir, manifest)
+    return manifest
+
+
+def drop_versions(table_dir: str, keep_last: int) -> List[str]:
+    """Remove do manifesto as versões mais antigas; devolve os ficheiros dessas versões."""
+    with _lock:
+        manifest = read_manifest(table_dir)
+        if manifest is None:
+            return []
+        old = manifest["versions"][:-keep_last] if keep_last else manifest["versions"]
+        manifest["versions"] = manifest["versions"][len(old):]
+        write_manifest(table_dir, manifest)
+    return [f["file"] for v in old for f in v["files"]]
+
+
+def latest_version(table_dir: str) -> Optional[Dict[str, Any]]:
+    """Última versão gravada com sucesso (sem listar a pasta)."""
+    manifest = read_manifest(table_dir)
+    if not manifest or not manifest["versions"]:
+        return None
+    return manifest["versions"][-1]
+
+
+def _may_match(entry: Dict[str, Any], filters: List[Tuple[str, str, Any]]) -> bool:
+    for col, op, value in filters:
+        prune = _PRUNE_OPS.get(op)
+        if prune is None or col not in entry["min"]:
+            continue
+        lo, hi = entry["min"][col], entry["max"][col]
+        try:
+            if not prune(lo, hi, value):
+                return False
+        except TypeError:
+            continue  # tipos não comparáveis: não é possível excluir
+    return True
+
+
+def manifest_files(table_dir: str, filters: Optional[List[Tuple[str, str, Any]]] = None) -> Optional[List[str]]:
+    """
+    Ficheiros válidos do staging (caminhos completos), excluindo os que pelo
+    min/max das colunas-chave não podem satisfazer os filtros.
+    Devolve None se a pasta não tiver manifesto.
+    """
+    manifest = read_manifest(table_dir)
+    if manifest is None:
+        return None
+    entries = [f for v in manifest["versions"] for f in v["files"]]
+    selected = [f for f in entries if _may_match(f, filters or [])]
+    if filters:
+        logger.info(f"Pruning pelo manifesto: {len(selected)}/{len(entries)} ficheiro(s)")
+    return [os.path.join(table_dir, f["file"]) for f in selected]
@@ -0,0 +1,229 @@
+"""
+Dimensão de calendário (Dim_Tempo) gerada a partir de um intervalo de datas.
+
+A dimensão completa é criada de uma vez com pd.date_range (sem ciclos por dia)
+e guardada num Calendar, que mantém em memória dois arrays indexados pelo dia:
+
+    dia - início → ID_TEMPO (YYYYMMDD)
+    dia - início → surrogate key de Dim_Tempo (depois de attach_surrogate_keys)
+
+Assim a chave de tempo dos factos é obtida a partir da data real de cada
+transação com uma subtração e um take, em vez de uma constante por execução.
+As datas com fuso são convertidas para o `timezone` de general.yaml.
+"""
+import threading
+from datetime import datetime
+from functools import lru_cache
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+from loguru import logger
+
+from model.scd2 import merge_dimension
+from model.surrogate_keys import MISSING_SK, load_index
+from transform import dates
+
+DEFAULT_START = "2015-01-01"
+DEFAULT_YEARS_AHEAD = 2
+DATE_KEY = "ID_TEMPO"
+
+# Atributos que o calendário sabe gerar (os da dimensão vêm do dimensional_model)
+CALENDAR_ATTRIBUTES: Dict[str, Callable[[pd.DatetimeIndex], Any]] = {
+    "Ano": lambda days: days.year,
+    "Mes": lambda days: days.month,
+    "Dia": lambda days: days.day,
+    "Trimestre": lambda days: days.quarter,
+    "Semana": lambda days: days.isocalendar().week.to_numpy(),
+    "DiaSemana": lambda days: days.weekday + 1,
+    "Data": lambda days: days,
+}
+
+
+@lru_cache(maxsize=1)
+def calendar_settings() -> Dict[str, Any]:
+    """timezone, calendar_start e calendar_years_ahead do general.yaml."""
+    try:
+        from utils.config_loader import load_yaml
+        general = load_yaml("general.yaml")
+    except Exception as e:
+        logger.debug(f"general.yaml indisponível para o calendário: {e}")
+        general = {}
+    return {
+        "timezone": general.get("timezone"),
+        "start": general.get("calendar_start", DEFAULT_START),
+        "years_ahead": general.get("calendar_years_ahead", DEFAULT_YEARS_AHEAD),
+    }
+
+
+def local_now(tz: Optional[str] = None) -> datetime:
+    """Data/hora atual no fuso configurado (sem fuso, como datetime.now())."""
+    tz = tz or calendar_settings()["timezone"]
+    if not tz:
+        return datetime.now()
+    return pd.Timestamp.now(tz=tz).tz_localize(None).to_pydatetime()
+
+
+def local_days(values, tz: Optional[str] = None) -> np.ndarray:
+    """
+    Dia de cada valor (datetime64[D]; NaT para inválidos). Texto é convertido com
+    dates.parse_dates; datas com fuso passam para `tz` antes de perderem a hora.
+    """
+    series = values if isinstance(values, pd.Series) else pd.Series(values)
+    if not pd.api.types.is_datetime64_any_dtype(series):
+        series = dates.parse_dates(series)[0]
+    if getattr(series.dt, "tz", None) is not None:
+        tz = tz or calendar_settings()["timezone"]
+        series = series.dt.tz_convert(tz).dt.tz_localize(None) if tz else series.dt.tz_localize(None)
+    return series.to_numpy(dtype="datetime64[ns]").astype("datetime64[D]")
+
+
+def date_keys(days: pd.DatetimeIndex) -> np.ndarray:
+    return (days.year * 10000 + days.month * 100 + days.day).to_numpy(dtype=np.int64)
+
+
+class Calendar:
+    """
+    Calendário de `start` a `end` (inclusive), ex:
+
+        cal = get_calendar()                       # intervalo e fuso do general.yaml
+        dim = cal.dimension(["Ano", "Mes", "Dia"])  # linhas de Dim_Tempo
+        df["ID_TEMPO"] = cal.id_tempo(df["TransactionGenerationDate"])
+    """
+
+    def __init__(self, start, end, tz: Optional[str] = None):
+        self.tz = tz
+        self.days = pd.date_range(pd.Timestamp(start).normalize(), pd.Timestamp(end).normalize(), freq="D")
+        if not len(self.days):
+            raise ValueError(f"Intervalo de calendário vazio: {start} → {end}")
+        self.first_day = self.days[0].to_datetime64().astype("datetime64[D]")
+        self.keys = date_keys(self.days)
+        self.sks: Optional[np.ndarray] = None
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.days)
+
+    @property
+    def start(self) -> pd.Timestamp:
+        return self.days[0]
+
+    @property
+    def end(self) -> pd.Timestamp:
+        return self.days[-1]
+
+    def dimension(self, attributes: Optional[List[str]] = None) -> pd.DataFrame:
+        """Linhas da dimensão: ID_TEMPO + atributos pedidos (por defeito Ano, Mes, Dia)."""
+        attributes = list(attributes or ["Ano", "Mes", "Dia"])
+        unknown = [a for a in attributes if a not in CALENDAR_ATTRIBUTES]
+        if unknown:
+            raise ValueError(f"Atributos de calendário desconhecidos: {unknown}")
+        frame = pd.DataFrame({DATE_KEY: self.keys})
+        for attr in attributes:
+            values = CALENDAR_ATTRIBUTES[attr](self.days)
+            frame[attr] = values if attr == "Data" else np.asarray(values, dtype=np.int64)
+        return frame
+
+    def positions(self, values) -> Tuple[np.ndarray, np.ndarray]:
+        """Posição de cada data nos arrays do calendário e máscara das que estão no intervalo."""
+        return self._positions(local_days(values, self.tz))
+
+    def _positions(self, days: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        valid = ~np.isnat(days)
+        pos = np.zeros(len(days), dtype=np.int64)
+        pos[valid] = (days[valid] - self.first_day).astype(np.int64)
+        inside = valid & (pos >= 0) & (pos < len(self))
+        return np.where(inside, pos, 0), inside
+
+    def id_tempo(self, values) -> pd.Series:
+        """ID_TEMPO (YYYYMMDD, Int64) de cada data; <NA> para datas inválidas."""
+        index = values.index if isinstance(values, pd.Series) else None
+        days = local_days(values, self.tz)
+        pos, inside = self._positions(days)
+        keys = self.keys[pos]
+        valid = ~np.isnat(days)
+        outside = valid & ~inside
+        if outside.any():
+            # Fora do intervalo: mesma chave, calculada diretamente
+            keys[outside] = date_keys(pd.DatetimeIndex(days[outside]))
+            logger.debug(f"Calendário: {int(outside.sum())} data(s) fora de "
+                         f"{self.start:%Y-%m-%d} → {self.end:%Y-%m-%d}")
+        return pd.Series(pd.array(keys, dtype="Int64"), index=index).where(valid)
+
+    def attach_surrogate_keys(self, index) -> int:
+        """Preenche o array dia → SK a partir de um SurrogateKeyIndex de Dim_Tempo."""
+        sks = index.resolve(pd.DataFrame({DATE_KEY: self.keys}))
+        with self._lock:
+            self.sks = sks
+        resolved = int((sks != MISSING_SK).sum())
+        logger.info(f"Calendário: {resolved}/{len(sks)} dia(s) com SK em {index.table}")
+        return resolved
+
+    def surrogate_keys(self, values) -> np.ndarray:
+        """SK de Dim_Tempo de cada data (MISSING_SK fora do intervalo ou sem membro)."""
+        if self.sks is None:
+            raise ValueError("Surrogate keys do calendário não carregadas (ver attach_surrogate_keys)")
+        pos, inside = self.positions(values)
+        return np.where(inside, self.sks[pos], MISSING_SK)
+
+
+_CALENDARS: Dict[Tuple, Calendar] = {}
+_CALENDARS_LOCK = threading.Lock()
+
+
+def get_calendar(start=None, end=None, tz: Optional[str] = None) -> Calendar:
+    """
+    Calendário partilhado no processo (um por intervalo e fuso). Sem argumentos:
+    de calendar_start até ao fim do ano atual + calendar_years_ahead, no fuso de general.yaml.
+    """
+    settings = calendar_settings()
+    tz = tz or settings["timezone"]
+    start = pd.Timestamp(start or settings["start"]).normalize()
+    if end is None:
+        end = pd.Timestamp(year=local_now(tz).year + int(settings["years_ahead"]), month=12, day=31)
+    end = pd.Timestamp(end).normalize()
+
+    key = (start, end, tz)
+    with _CALENDARS_LOCK:
+        calendar = _CALENDARS.get(key)
+        if calendar is None:
+            calendar = _CALENDARS[key] = Calendar(start, end, tz)
+            logger.info(f"Calendário gerado: {start:%Y-%m-%d} → {end:%Y-%m-%d} "
+                        f"({len(calendar)} dias, {tz or 'hora local'})")
+    return calendar
+
+
+def clear_cache():
+    with _CALENDARS_LOCK:
+        _CALENDARS.clear()
+
+
+def time_dimension(model: Dict[str, Any]) -> Optional[Tuple[str, Dict[str, Any]]]:
+    """Dimensão do dimensional_model cuja chave é ID_TEMPO (ex: "Tempo")."""
+    for name, info in model.get("dimensions", {}).items():
+        if list(info.get("keys", [])) == [DATE_KEY]:
+            return name, info
+    return None
+
+
+def load_calendar_dimension(conn, model: Dict[str, Any], calendar: Optional[Calendar] = None,
+                            as_of: Optional[datetime] = None) -> Dict[str, int]:
+    """
+    Garante que Dim_Tempo tem todos os dias do calendário (merge SCD2: só os dias
+    novos são inseridos) e carrega o array dia → SK do calendário.
+    """
+    found = time_dimension(model)
+    if found is None:
+        logger.warning(f"dimensional_model sem dimensão com chave {DATE_KEY} — calendário não carregado.")
+        return {}
+    dim_name, dim_info = found
+    calendar = calendar or get_calendar()
+    attributes = [a for a in dim_info.get("attributes", {}) if a in CALENDAR_ATTRIBUTES]
+
+    naming = model.get("naming", {})
+    stats = merge_dimension(conn, dim_name, dim_info, calendar.dimension(attributes), naming, as_of)
+    index = load_index(conn, f"{naming.get('dimension_prefix', 'Dim_')}{dim_name}", [DATE_KEY],
+                       f"{naming.get('surrogate_key', 'SK_')}{dim_name}",
+                       scd2=dim_info.get("scd_type") == 2, cache_dir=None)
+    calendar.attach_surrogate_keys(index)
+    return stats
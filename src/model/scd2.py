@@ -0,0 +1,184 @@
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+from loguru import logger
+
+from load.load_to_dw import insert_statement
+
+VALID_FROM = "ValidFrom"
+VALID_TO = "ValidTo"
+IS_CURRENT = "IsCurrent"
+OPEN_VALID_TO = pd.Timestamp("9999-12-31")
+
+
+@dataclass
+class Scd2Changes:
+    """Resultado do merge: versões a expirar (por surrogate key) e novas versões a inserir."""
+    expired_keys: np.ndarray
+    new_rows: pd.DataFrame
+    as_of: pd.Timestamp
+    stats: Dict[str, int] = field(default_factory=dict)
+
+
+def row_hashes(df: pd.DataFrame, columns: List[str]) -> np.ndarray:
+    """Hash de 64 bits por linha sobre as colunas indicadas (vetorizado)."""
+    if not columns:
+        return np.zeros(len(df), dtype=np.uint64)
+    return pd.util.hash_pandas_object(df[columns], index=False).to_numpy()
+
+
+def align_dtypes(incoming: pd.DataFrame, current: pd.DataFrame, columns: List[str]) -> pd.DataFrame:
+    """Converte as colunas do lote para os tipos da dimensão (para os hashes serem comparáveis)."""
+    incoming = incoming.copy()
+    for col in columns:
+        if col in current.columns and incoming[col].dtype != current[col].dtype:
+            try:
+                incoming[col] = incoming[col].astype(current[col].dtype)
+            except (TypeError, ValueError):
+                incoming[col] = incoming[col].astype(str)
+                current[col] = current[col].astype(str)
+    return incoming
+
+
+def scd2_merge(current: pd.DataFrame, incoming: pd.DataFrame, keys: List[str],
+               attributes: List[str], surrogate_key: str,
+               as_of: Optional[datetime] = None) -> Scd2Changes:
+    """
+    Compara um lote da dimensão com a versão atual, por operações em bloco:
+
+    - chaves novas → nova versão
+    - chaves existentes com hash de atributos diferente → expira a versão atual
+      (ValidTo = as_of, IsCurrent = 0) e insere uma nova
+    - chaves com atributos iguais → sem alterações
+
+    `current` é a dimensão (só as linhas IsCurrent são consideradas); `incoming`
+    tem as chaves naturais e os atributos. Duplicados no lote: fica a última linha.
+    """
+    as_of = pd.Timestamp(as_of or datetime.now()).floor("s")
+    missing = [c for c in keys + attributes if c not in incoming.columns]
+    if missing:
+        raise KeyError(f"Colunas em falta no lote da dimensão: {missing}")
+
+    if IS_CURRENT in current.columns:
+        current = current[current[IS_CURRENT].astype(bool)]
+    current = current[[surrogate_key] + keys + attributes].reset_index(drop=True)
+
+    incoming = incoming[keys + attributes].drop_duplicates(subset=keys, keep="last")
+    incoming = align_dtypes(incoming, current, keys + attributes).reset_index(drop=True)
+
+    current_keys = pd.Index(row_hashes(current, keys))
+    if not current_keys.is_unique:
+        raise ValueError(f"Dimensão com mais de uma versão atual para a mesma chave: {keys}")
+
+    positions = current_keys.get_indexer(row_hashes(incoming, keys))
+    matched = positions >= 0
+    changed = np.zeros(len(incoming), dtype=bool)
+    if matched.any():
+        incoming_attrs = row_hashes(incoming.loc[matched], attributes)
+        current_attrs = row_hashes(current, attributes)[positions[matched]]
+        changed[matched] = incoming_attrs != current_attrs
+
+    is_new = ~matched
+    new_rows = incoming.loc[is_new | changed].copy()
+    new_rows[VALID_FROM] = as_of
+    new_rows[VALID_TO] = OPEN_VALID_TO
+    new_rows[IS_CURRENT] = True
+
+    expired_keys = current[surrogate_key].to_numpy()[positions[changed]]
+    stats = {
+        "inserted": int(is_new.sum()),
+        "changed": int(changed.sum()),
+        "unchanged": int(matched.sum() - changed.sum()),
+    }
+    logger.info(f"SCD2 merge: {stats}")
+    return Scd2Changes(expired_keys, new_rows.reset_index(drop=True), as_of, stats)
+
+
+def apply_to_frame(dimension: pd.DataFrame, changes: Scd2Changes, surrogate_key: str) -> pd.DataFrame:
+    """Aplica o merge a uma dimensão em memória, atribuindo surrogate keys sequenciais."""
+    dimension = dimension.copy()
+    expired = dimension[surrogate_key].isin(changes.expired_keys)
+    dimension.loc[expired, VALID_TO] = changes.as_of
+    dimension.loc[expired, IS_CURRENT] = False
+
+    new_rows = changes.new_rows.copy()
+    start = int(dimension[surrogate_key].max()) + 1 if len(dimension) else 1
+    new_rows.insert(0, surrogate_key, np.arange(start, start + len(new_rows), dtype=np.int64))
+    return pd.concat([dimension, new_rows], ignore_index=True)
+
+
+def read_current(conn, table: str, surrogate_key: str, keys: List[str],
+                 attributes: List[str]) -> pd.DataFrame:
+    """Lê apenas as versões atuais da dimensão (colunas necessárias ao merge)."""
+    cols = ", ".join(f"[{c}]" for c in [surrogate_key] + keys + attributes)
+    return pd.read_sql(f"SELECT {cols} FROM [{table}] WHERE [{IS_CURRENT}] = 1", conn)
+
+
+def db_value(value: Any) -> Any:
+    """Converte valores pandas/numpy para tipos aceites pelos drivers DB-API."""
+    if value is None or value is pd.NA or value is pd.NaT:
+        return None
+    if isinstance(value, pd.Timestamp):
+        return value.to_pydatetime()
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, float) and np.isnan(value):
+        return None
+    return value
+
+
+def apply_to_db(conn, table: str, changes: Scd2Changes, surrogate_key: str,
+                batch_size: int = 10_000) -> Dict[str, int]:
+    """
+    Grava o merge numa única transação: UPDATE em lote das versões expiradas e
+    INSERT em lote das novas (a surrogate key é gerada pela base de dados).
+    """
+    cursor = conn.cursor()
+    if hasattr(cursor, "fast_executemany"):
+        cursor.fast_executemany = True
+    as_of = changes.as_of.to_pydatetime()
+    expire_sql = (
+        f"UPDATE [{table}] SET [{VALID_TO}] = ?, [{IS_CURRENT}] = 0 "
+        f"WHERE [{surrogate_key}] = ?"
+    )
+    columns = list(changes.new_rows.columns)
+    insert_sql = insert_statement(table, columns)
+    rows = [tuple(db_value(v) for v in row)
+            for row in changes.new_rows.itertuples(index=False, name=None)]
+    try:
+        expired = [(as_of, db_value(sk)) for sk in changes.expired_keys]
+        for i in range(0, len(expired), batch_size):
+            cursor.executemany(expire_sql, expired[i:i + batch_size])
+        for i in range(0, len(rows), batch_size):
+            cursor.executemany(insert_sql, rows[i:i + batch_size])
+        conn.commit()
+    except Exception as e:
+        conn.rollback()
+        logger.error(f"Erro no merge SCD2 de {table}: {e}")
+        raise
+    finally:
+        cursor.close()
+
+    logger.info(f"{table}: {len(expired)} versões expiradas, {len(rows)} inseridas")
+    return changes.stats
+
+
+def merge_dimension(conn, dim_name: str, dim_info: Dict[str, Any], incoming: pd.DataFrame,
+                    naming: Optional[Dict[str, str]] = None,
+                    as_of: Optional[datetime] = None) -> Dict[str, int]:
+    """
+    Merge SCD2 de uma dimensão do `dimensional_model` de sources.json
+    (mesmas convenções de nomes que build_star_schema).
+    """
+    naming = naming or {}
+    table = f"{naming.get('dimension_prefix', 'Dim_')}{dim_name}"
+    surrogate_key = f"{naming.get('surrogate_key', 'SK_')}{dim_name}"
+    keys = list(dim_info.get("keys", []))
+    attributes = [a for a in dim_info.get("attributes", {}) if a in incoming.columns]
+
+    current = read_current(conn, table, surrogate_key, keys, attributes)
+    changes = scd2_merge(current, incoming, keys, attributes, surrogate_key, as_of)
+    return apply_to_db(conn, table, changes, surrogate_key)
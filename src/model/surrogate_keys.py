@@ -0,0 +1,215 @@
+import decimal
+import json
+import math
+import os
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+from loguru import logger
+
+from load.load_to_dw import insert_statement
+from model.scd2 import IS_CURRENT, OPEN_VALID_TO, VALID_FROM, VALID_TO, db_value
+
+DEFAULT_CACHE_DIR = os.path.join("data/staging", ".sk_cache")
+MISSING_SK = -1
+
+
+def _integral_text(value: Any) -> str:
+    if isinstance(value, (float, decimal.Decimal)) and math.isfinite(value) and value == int(value):
+        return str(int(value))
+    return str(value)
+
+
+def key_text(values: pd.Series) -> pd.Series:
+    """
+    Chave como texto canónico: números inteiros guardados como float ou Decimal
+    (ex: 20240101.0, por causa de nulos) ficam iguais ao inteiro ("20240101").
+    """
+    if pd.api.types.is_float_dtype(values):
+        numbers = values.to_numpy(dtype="float64", na_value=np.nan)
+        integral = np.isfinite(numbers) & (numbers == np.floor(numbers)) & (np.abs(numbers) < 2**63)
+        text = values.astype(str).to_numpy(dtype=object)
+        text[integral] = numbers[integral].astype(np.int64).astype(str)
+        text[np.isnan(numbers)] = None
+        return pd.Series(text, index=values.index)
+    if pd.api.types.is_object_dtype(values):
+        return values.map(_integral_text, na_action="ignore")
+    return values.astype(str).where(values.notna(), None)
+
+
+def key_hashes(df: pd.DataFrame, keys: List[str]) -> np.ndarray:
+    """
+    Hash de 64 bits da chave natural. As chaves são comparadas como texto
+    (ex: ID_TEMPO inteiro no facto e NVARCHAR na dimensão), ver key_text.
+    """
+    text = pd.DataFrame({k: key_text(df[k]) for k in keys})
+    return pd.util.hash_pandas_object(text, index=False).to_numpy()
+
+
+class SurrogateKeyIndex:
+    """
+    Índice chave natural → surrogate key de uma dimensão, em dois arrays numpy
+    ordenados (hash uint64 + SK int64, 16 bytes por membro). A resolução de um
+    lote de factos é feita com searchsorted, sem dicionários Python.
+    """
+
+    def __init__(self, table: str, keys: List[str], surrogate_key: str,
+                 hashes: Optional[np.ndarray] = None, sks: Optional[np.ndarray] = None):
+        self.table = table
+        self.keys = keys
+        self.surrogate_key = surrogate_key
+        self.hashes = np.empty(0, dtype=np.uint64) if hashes is None else hashes
+        self.sks = np.empty(0, dtype=np.int64) if sks is None else sks
+
+    def __len__(self) -> int:
+        return len(self.hashes)
+
+    @property
+    def max_sk(self) -> int:
+        return int(self.sks.max()) if len(self.sks) else 0
+
+    def update(self, df: pd.DataFrame):
+        """Acrescenta/substitui membros (a SK mais alta ganha: versão SCD2 mais recente)."""
+        if df.empty:
+            return
+        hashes = np.concatenate([self.hashes, key_hashes(df, self.keys)])
+        sks = np.concatenate([self.sks, df[self.surrogate_key].to_numpy(dtype=np.int64)])
+        order = np.lexsort((-sks, hashes))
+        hashes, sks = hashes[order], sks[order]
+        first = np.ones(len(hashes), dtype=bool)
+        first[1:] = hashes[1:] != hashes[:-1]
+        self.hashes, self.sks = hashes[first], sks[first]
+
+    def resolve(self, df: pd.DataFrame) -> np.ndarray:
+        """Surrogate keys para cada linha de `df` (MISSING_SK quando o membro não existe)."""
+        wanted = key_hashes(df, self.keys)
+        if not len(self.hashes):
+            return np.full(len(wanted), MISSING_SK, dtype=np.int64)
+        pos = np.searchsorted(self.hashes, wanted).clip(max=len(self.hashes) - 1)
+        found = self.hashes[pos] == wanted
+        return np.where(found, self.sks[pos], MISSING_SK)
+
+    # ---------------- Persistência ----------------
+    def cache_path(self, cache_dir: str) -> str:
+        return os.path.join(cache_dir, f"{self.table}.npz")
+
+    def save(self, cache_dir: str = DEFAULT_CACHE_DIR):
+        os.makedirs(cache_dir, exist_ok=True)
+        path = self.cache_path(cache_dir)
+        meta = json.dumps({"keys": self.keys, "surrogate_key": self.surrogate_key})
+        tmp_path = f"{path}.tmp.npz"
+        np.savez(tmp_path, hashes=self.hashes, sks=self.sks, meta=np.array(meta))
+        os.replace(tmp_path, path)
+
+    def load(self, cache_dir: str = DEFAULT_CACHE_DIR) -> bool:
+        """Carrega o índice guardado; ignora-o se as chaves configuradas mudaram."""
+        path = self.cache_path(cache_dir)
+        if not os.path.exists(path):
+            return False
+        try:
+            with np.load(path) as data:
+                meta = json.loads(str(data["meta"]))
+                if meta != {"keys": self.keys, "surrogate_key": self.surrogate_key}:
+                    logger.warning(f"Cache de SKs de {self.table} ignorado (chaves diferentes).")
+                    return False
+                self.hashes, self.sks = data["hashes"], data["sks"]
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning(f"Cache de SKs de {self.table} ignorado: {e}")
+            return False
+        return True
+
+    def refresh(self, conn, scd2: bool = True):
+        """Lê da dimensão só os membros com SK acima da maior já indexada."""
+        cols = ", ".join(f"[{c}]" for c in [self.surrogate_key] + self.keys)
+        query = f"SELECT {cols} FROM [{self.table}] WHERE [{self.surrogate_key}] > {self.max_sk}"
+        if scd2:
+            query += f" AND [{IS_CURRENT}] = 1"
+        new_members = pd.read_sql(query, conn)
+        self.update(new_members)
+        return len(new_members)
+
+
+def load_index(conn, table: str, keys: List[str], surrogate_key: str, scd2: bool = True,
+               cache_dir: Optional[str] = DEFAULT_CACHE_DIR) -> SurrogateKeyIndex:
+    """Índice da dimensão: do cache em disco (se existir) + membros novos desde a última execução."""
+    index = SurrogateKeyIndex(table, keys, surrogate_key)
+    cached = cache_dir is not None and index.load(cache_dir)
+    added = index.refresh(conn, scd2)
+    logger.info(
+        f"Índice de SKs de {table}: {len(index)} membros "
+        f"({'cache + ' if cached else ''}{added} lidos da base de dados)"
+    )
+    return index
+
+
+def insert_inferred_members(conn, index: SurrogateKeyIndex, members: pd.DataFrame,
+                            scd2: bool = True, as_of: Optional[datetime] = None) -> int:
+    """
+    Late-arriving members: insere em lote linhas inferidas (só a chave natural,
+    atributos a NULL) para os membros que ainda não existem na dimensão.
+    """
+    rows = members[index.keys].drop_duplicates().copy()
+    if rows.empty:
+        return 0
+    if scd2:
+        rows[VALID_FROM] = pd.Timestamp(as_of or datetime.now()).floor("s")
+        rows[VALID_TO] = OPEN_VALID_TO
+        rows[IS_CURRENT] = 1
+
+    cursor = conn.cursor()
+    if hasattr(cursor, "fast_executemany"):
+        cursor.fast_executemany = True
+    try:
+        cursor.executemany(
+            insert_statement(index.table, list(rows.columns)),
+            [tuple(db_value(v) for v in row) for row in rows.itertuples(index=False, name=None)]
+        )
+        conn.commit()
+    except Exception as e:
+        conn.rollback()
+        logger.error(f"Erro ao inserir membros inferidos em {index.table}: {e}")
+        raise
+    finally:
+        cursor.close()
+    logger.warning(f"{index.table}: {len(rows)} membro(s) inferido(s) (late-arriving)")
+    return len(rows)
+
+
+def resolve_surrogate_keys(conn, facts: pd.DataFrame, model: Dict[str, Any],
+                           cache_dir: Optional[str] = DEFAULT_CACHE_DIR,
+                           infer_missing: bool = True,
+                           as_of: Optional[datetime] = None) -> pd.DataFrame:
+    """
+    Acrescenta ao lote de factos uma coluna SK_<dim> por dimensão do
+    `dimensional_model` (mesmas convenções de nomes que build_star_schema).
+    Membros em falta são inferidos na dimensão (ou ficam com MISSING_SK).
+    """
+    naming = model.get("naming", {})
+    dim_prefix = naming.get("dimension_prefix", "Dim_")
+    surrogate_prefix = naming.get("surrogate_key", "SK_")
+    facts = facts.copy()
+
+    for dim_name, dim_info in model["dimensions"].items():
+        keys = list(dim_info.get("keys", []))
+        missing_cols = [k for k in keys if k not in facts.columns]
+        if missing_cols:
+            logger.warning(f"Dimensão {dim_name} ignorada: chaves {missing_cols} não existem nos factos.")
+            continue
+
+        scd2 = dim_info.get("scd_type") == 2
+        index = load_index(conn, f"{dim_prefix}{dim_name}", keys, f"{surrogate_prefix}{dim_name}",
+                           scd2, cache_dir)
+        sks = index.resolve(facts)
+        unresolved = sks == MISSING_SK
+        if unresolved.any() and infer_missing:
+            insert_inferred_members(conn, index, facts.loc[unresolved], scd2, as_of)
+            index.refresh(conn, scd2)
+            sks[unresolved] = index.resolve(facts.loc[unresolved])
+
+        facts[index.surrogate_key] = sks
+        if cache_dir is not None:
+            index.save(cache_dir)
+
+    return facts
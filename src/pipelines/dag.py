@@ -0,0 +1,167 @@
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional
+
+import pandas as pd
+from loguru import logger
+
+IO = "io"
+CPU = "cpu"
+
+REPORT_COLUMNS = ["source", "stage", "status", "seconds", "rows", "error"]
+
+
+class NoData(Exception):
+    """
+    Levantada por uma tarefa que não tem dados para as seguintes (ex: extração
+    sem ficheiros novos): a tarefa fica "empty" e as dependentes são ignoradas,
+    sem contar como falha.
+    """
+
+
+@dataclass
+class Task:
+    """Nó do DAG: `fn` recebe os resultados das dependências, pela ordem de `deps`."""
+    name: str
+    fn: Callable[..., Any]
+    deps: List[str] = field(default_factory=list)
+    kind: str = IO
+    source: Optional[str] = None
+    stage: Optional[str] = None
+
+
+@dataclass
+class TaskResult:
+    name: str
+    source: Optional[str]
+    stage: Optional[str]
+    status: str = "pending"
+    seconds: float = 0.0
+    rows: Optional[int] = None
+    error: Optional[str] = None
+    value: Any = None
+
+
+class DagScheduler:
+    """
+    Executa um DAG de tarefas com dois pools separados: um para etapas de I/O
+    (extração, gravação, carga) e outro, mais pequeno, para etapas de CPU
+    (limpeza, cálculos). Tarefas independentes correm em paralelo; se uma falhar
+    (ou não tiver dados, ver NoData), as que dependem dela são ignoradas e as
+    restantes continuam.
+    """
+
+    def __init__(self, io_workers: int = 4, cpu_workers: int = 2):
+        self.io_workers = io_workers
+        self.cpu_workers = cpu_workers
+        self.tasks: Dict[str, Task] = {}
+
+    def add(self, task: Task) -> Task:
+        if task.name in self.tasks:
+            raise ValueError(f"Tarefa duplicada no DAG: {task.name}")
+        self.tasks[task.name] = task
+        return task
+
+    def _validate(self):
+        for task in self.tasks.values():
+            missing = [d for d in task.deps if d not in self.tasks]
+            if missing:
+                raise ValueError(f"Dependências desconhecidas para {task.name}: {missing}")
+
+        # Deteção de ciclos (Kahn)
+        indegree = {name: len(t.deps) for name, t in self.tasks.items()}
+        ready = [name for name, n in indegree.items() if n == 0]
+        visited = 0
+        while ready:
+            name = ready.pop()
+            visited += 1
+            for other in self.tasks.values():
+                if name in other.deps:
+                    indegree[other.name] -= 1
+                    if indegree[other.name] == 0:
+                        ready.append(other.name)
+        if visited != len(self.tasks):
+            raise ValueError("O DAG contém ciclos.")
+
+    def run(self) -> Dict[str, TaskResult]:
+        self._validate()
+        results = {name: TaskResult(name, t.source, t.stage) for name, t in self.tasks.items()}
+        remaining = dict(self.tasks)
+        running: Dict[Future, str] = {}
+        started: Dict[str, float] = {}
+
+        executors = {
+            IO: ThreadPoolExecutor(max_workers=self.io_workers, thread_name_prefix="etl-io"),
+            CPU: ThreadPoolExecutor(max_workers=self.cpu_workers, thread_name_prefix="etl-cpu"),
+        }
+        try:
+            while remaining or running:
+                # Lança todas as tarefas cujas dependências já terminaram
+                for name, task in list(remaining.items()):
+                    dep_status = [results[d].status for d in task.deps]
+                    if any(s in ("failed", "skipped", "empty") for s in dep_status):
+                        results[name].status = "skipped"
+                        del remaining[name]
+                        if "empty" in dep_status and "failed" not in dep_status:
+                            logger.info(f"Tarefa {name} ignorada (sem dados).")
+                        else:
+                            logger.warning(f"Tarefa {name} ignorada (dependência falhou).")
+                    elif all(s == "done" for s in dep_status):
+                        args = [results[d].value for d in task.deps]
+                        started[name] = time.perf_counter()
+                        results[name].status = "running"
+                        running[executors[task.kind].submit(task.fn, *args)] = name
+                        del remaining[name]
+
+                if not running:
+                    continue
+
+                done, _ = wait(list(running), return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = running.pop(future)
+                    result = results[name]
+                    result.seconds = time.perf_counter() - started[name]
+                    try:
+                        result.value = future.result()
+                        result.status = "done"
+                        if isinstance(result.value, dict):
+                            result.rows = result.value.get("rows")
+                        elif isinstance(result.value, pd.DataFrame):
+                            result.rows = len(result.value)
+                        logger.info(f"Tarefa {name} concluída em {result.seconds:.2f}s")
+                    except NoData as e:
+                        result.status = "empty"
+                        result.rows = 0
+                        logger.info(f"Tarefa {name} sem dados: {e}")
+                    except Exception as e:
+                        result.status = "failed"
+                        result.error = str(e)
+                        logger.error(f"Tarefa {name} falhou após {result.seconds:.2f}s: {e}")
+
+                    # Liberta o resultado quando já nenhuma tarefa o vai usar
+                    for dep in self.tasks[name].deps:
+                        if not any(dep in t.deps for t in remaining.values()) and \
+                                not any(dep in self.tasks[r].deps for r in running.values()):
+                            results[dep].value = None
+        finally:
+            for executor in executors.values():
+                executor.shutdown(wait=True)
+
+        return results
+
+
+def timing_report(results: Dict[str, TaskResult]) -> pd.DataFrame:
+    """Relatório por fonte/etapa: estado, duração e número de registos."""
+    report = pd.DataFrame([
+        {
+            "source": r.source,
+            "stage": r.stage or r.name,
+            "status": r.status,
+            "seconds": round(r.seconds, 3),
+            "rows": r.rows,
+            "error": r.error,
+        }
+        for r in results.values()
+    ], columns=REPORT_COLUMNS)
+    return report
@@ -0,0 +1,255 @@
+import argparse
+import os
+import sys
+from typing import Any, Callable, Dict, List, Optional, Sequence, Union
+
+import pandas as pd
+from loguru import logger
+
+# Permite `python src/pipelines/run_all_sources.py` sem PYTHONPATH=src
+SRC_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if SRC_DIR not in sys.path:
+    sys.path.insert(0, SRC_DIR)
+
+from extract.api_extractor import extract_api
+from extract.csv_extractor import extract_csv
+from extract.db_extractor import extract_db
+from load.load_to_dw import load_to_dw
+from load.load_to_staging import load_to_staging
+from pipelines.dag import CPU, IO, DagScheduler, NoData, Task, timing_report
+from transform.compiler import compile_rules
+from transform.dedup import open_index
+from transform.dtypes import target_dtypes
+from utils.config_loader import load_config, load_json
+from utils.db_pool import close_all_pools
+from utils.state_store import DEFAULT_STATE_PATH, StateStore, state_key
+
+SUPPORTED_TYPES = ("csv", "api", "database")
+
+
+def extract_source(cfg: Dict, params: Optional[Dict] = None,
+                   state: Optional[StateStore] = None) -> pd.DataFrame:
+    """Chama o extrator do tipo da fonte com os argumentos definidos em sources.json."""
+    source_type = cfg.get("type")
+    if source_type == "csv":
+        return extract_csv(
+            path=cfg["path"],
+            pattern=cfg.get("pattern", "*.csv"),
+            schema=cfg.get("schema"),
+            columns=cfg.get("columns"),
+            state=state,
+            source_name=state_key(cfg),
+        )
+    if source_type == "api":
+        return extract_api(
+            base_url=cfg["base_url"],
+            params=cfg.get("params"),
+            headers=cfg.get("headers"),
+            pagination_key=cfg.get("pagination_key"),
+            pagination=cfg.get("pagination"),
+            max_pages=cfg.get("max_pages", 5),
+            columns=cfg.get("columns"),
+            concurrency=cfg.get("concurrency", 1),
+            rate_limit=cfg.get("rate_limit"),
+            http_cache=cfg.get("http_cache"),
+            engine=cfg.get("engine", "pandas"),
+        )
+    if source_type == "database":
+        # O watermark fica pendente até o staging terminar (commit na etapa stage)
+        return extract_db(cfg, params=params, save_csv=False, state=state)
+    raise ValueError(f"Tipo de fonte desconhecido: {source_type}")
+
+
+def extract_task(cfg: Dict, params: Optional[Dict] = None,
+                 state: Optional[StateStore] = None) -> pd.DataFrame:
+    """
+    Etapa extract do DAG. Sem linhas novas (ex: nenhum CSV por ingerir) o estado
+    da extração é confirmado e as etapas seguintes são ignoradas: o staging e o
+    DW ficam com a última versão boa.
+    """
+    df = extract_source(cfg, params, state)
+    if df.empty:
+        if state is not None:
+            state.commit(state_key(cfg))
+        raise NoData("extração sem linhas novas")
+    return df
+
+
+def commit_state(cfg: Dict, state: Optional[StateStore] = None, pending: Sequence = ()):
+    """Confirma o estado incremental da fonte e os estados do plano de regras."""
+    if state is not None:
+        state.commit(state_key(cfg))
+    for item in pending:
+        item.commit()
+
+
+def rollback_state(cfg: Dict, state: Optional[StateStore] = None, pending: Sequence = ()):
+    if state is not None:
+        state.rollback(state_key(cfg))
+    for item in pending:
+        item.rollback()
+
+
+def stage_source(df: pd.DataFrame, cfg: Dict, state: Optional[StateStore] = None,
+                 pending: Sequence = (), commit: bool = True) -> Union[str, List[str]]:
+    """
+    Grava o staging e só então confirma o estado incremental da fonte e os
+    estados do plano de regras (índice de deduplicação, agregações incrementais).
+    Com commit=False (fonte com carga no DW) a confirmação fica para load_source.
+    Um lote que ficou vazio nas regras (ex: só chaves já carregadas) não é gravado.
+    """
+    if df.empty:
+        commit_state(cfg, state, pending)
+        raise NoData("nenhuma linha após limpeza e cálculos")
+    try:
+        file_path = load_to_staging(df, cfg, mode=cfg.get("staging_mode", "replace"))
+    except Exception:
+        rollback_state(cfg, state, pending)
+        raise
+    if commit:
+        commit_state(cfg, state, pending)
+    return file_path
+
+
+def load_source(file_path: Union[str, List[str]], cfg: Dict, loader: Callable[[str, Dict], Any],
+                state: Optional[StateStore] = None, pending: Sequence = ()) -> Any:
+    """
+    Carrega o staging no DW e só então confirma os estados: se a carga falhar,
+    a execução seguinte volta a extrair e a agregar o mesmo lote.
+    """
+    try:
+        result = loader(file_path, cfg)
+    except Exception:
+        rollback_state(cfg, state, pending)
+        raise
+    commit_state(cfg, state, pending)
+    return result
+
+
+def add_source_tasks(scheduler: DagScheduler, name: str, cfg: Dict,
+                     params: Optional[Dict] = None, state: Optional[StateStore] = None,
+                     loader: Optional[Callable[[str, Dict], Any]] = None) -> List[Task]:
+    """
+    Acrescenta ao DAG a cadeia extract → clean → calculate → stage (→ load) da fonte.
+    Extração, staging e carga são etapas de I/O; limpeza e cálculos são de CPU.
+    Os estados (watermark, ficheiros ingeridos, índice de chaves, agregações) são
+    confirmados na última etapa: load, se existir, senão stage.
+    """
+    # Limpeza e cálculos num só plano lazy, otimizado para o plano todo em cada etapa
+    plan = compile_rules(cfg.get("cleaning_rules", {}), cfg.get("calculations", {}),
+                         schema=target_dtypes(cfg), key_index=open_index(cfg))
+    steps = [
+        ("extract", IO, lambda: extract_task(cfg, params, state)),
+        # Cada etapa recebe um DataFrame que mais ninguém usa: transforma-o sem cópias
+        ("clean", CPU, lambda df: plan.collect(df, copy=False, stages=("clean",))),
+        ("calculate", CPU, lambda df: plan.collect(df, copy=False, stages=("calculate",))),
+        ("stage", IO, lambda df: stage_source(df, cfg, state, plan.pending, commit=loader is None)),
+    ]
+    if loader is not None:
+        # Os estados só são confirmados depois de a carga no DW terminar
+        steps.append(("load", IO, lambda file_path: load_source(file_path, cfg, loader, state, plan.pending)))
+
+    tasks = []
+    previous = None
+    for stage, kind, fn in steps:
+        task = scheduler.add(Task(
+            name=f"{name}.{stage}",
+            fn=fn,
+            deps=[previous] if previous else [],
+            kind=kind,
+            source=name,
+            stage=stage,
+        ))
+        tasks.append(task)
+        previous = task.name
+    return tasks
+
+
+def build_pipeline(source_names: Optional[List[str]] = None, params: Optional[Dict] = None,
+                   state: Optional[StateStore] = None, io_workers: int = 4, cpu_workers: int = 2,
+                   loader: Optional[Callable[[str, Dict], Any]] = None) -> DagScheduler:
+    """
+    Constrói o DAG para as fontes indicadas (por defeito todas as de sources.json).
+    Fontes de tipo sem extrator ou com configuração inválida são ignoradas com aviso.
+    A etapa de carga só é criada para fontes com bloco "load" em sources.json.
+    """
+    source_names = source_names or list(load_json("sources.json"))
+    scheduler = DagScheduler(io_workers=io_workers, cpu_workers=cpu_workers)
+
+    for name in source_names:
+        try:
+            cfg = load_config(name)
+        except Exception as e:
+            logger.error(f"Fonte '{name}' ignorada: configuração inválida ({e})")
+            continue
+        if cfg.get("type") not in SUPPORTED_TYPES:
+            logger.warning(f"Fonte '{name}' ignorada: tipo '{cfg.get('type')}' sem extrator.")
+            continue
+        add_source_tasks(scheduler, name, cfg, params, state, loader if "load" in cfg else None)
+
+    return scheduler
+
+
+def run_all_sources(source_names: Optional[List[str]] = None, params: Optional[Dict] = None,
+                    io_workers: int = 4, cpu_workers: int = 2,
+                    state_path: str = DEFAULT_STATE_PATH,
+                    loader: Optional[Callable[[str, Dict], Any]] = None) -> pd.DataFrame:
+    """
+    Executa o pipeline completo de todas as fontes em paralelo e devolve o
+    relatório de tempos por fonte/etapa.
+    """
+    state = StateStore(state_path)
+    try:
+        scheduler = build_pipeline(source_names, params, state, io_workers, cpu_workers, loader)
+        logger.info(
+            f"Pipeline com {len(scheduler.tasks)} tarefas "
+            f"(io_workers={io_workers}, cpu_workers={cpu_workers})"
+        )
+        results = scheduler.run()
+    finally:
+        close_all_pools()
+        state.close()
+
+    report = timing_report(results)
+    if not report.empty:
+        logger.info(f"Relatório de execução:\n{report.drop(columns='error').to_string(index=False)}")
+        totals = report.groupby("stage", sort=False)["seconds"].sum()
+        logger.info(f"Tempo total por etapa (s):\n{totals.to_string()}")
+        failed = report[report["status"] == "failed"]
+        for _, row in failed.iterrows():
+            logger.error(f"{row['source']}.{row['stage']} falhou: {row['error']}")
+    return report
+
+
+def parse_params(values: List[str]) -> Dict[str, Any]:
+    """Converte argumentos chave=valor (ex: id_tempo=20250925) em parâmetros da query."""
+    params = {}
+    for item in values:
+        key, _, value = item.partition("=")
+        params[key] = int(value) if value.lstrip("-").isdigit() else value
+    return params
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Executa o ETL de todas as fontes de sources.json")
+    parser.add_argument("--sources", nargs="*", help="Fontes a executar (por defeito todas)")
+    parser.add_argument("--param", nargs="*", default=[], help="Parâmetros chave=valor")
+    parser.add_argument("--io-workers", type=int, default=4)
+    parser.add_argument("--cpu-workers", type=int, default=max(1, (os.cpu_count() or 2) // 2))
+    parser.add_argument("--state", default=DEFAULT_STATE_PATH, help="Ficheiro de estado incremental")
+    parser.add_argument("--no-load", action="store_true", help="Pára no staging (sem carga no DW)")
+    args = parser.parse_args(argv)
+
+    report = run_all_sources(
+        source_names=args.sources,
+        params=parse_params(args.param),
+        io_workers=args.io_workers,
+        cpu_workers=args.cpu_workers,
+        state_path=args.state,
+        loader=None if args.no_load else load_to_dw,
+    )
+    return 1 if (report["status"] == "failed").any() else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,256 @@
+import asyncio
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+import pandas as pd
+import pytest
+from extract import api_extractor, fast_normalize, pagination
+from extract.http_cache import HttpCache
+
+TOTAL_PAGES = 6
+PAGE_SIZE = 3
+ROWS = [
+    {"id": i, "user": {"id": i // PAGE_SIZE + 1}, "title": f"p{i // PAGE_SIZE + 1}"}
+    for i in range(TOTAL_PAGES * PAGE_SIZE)
+]
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        parsed = urlparse(self.path)
+        query = parse_qs(parsed.query)
+        self.server.requests.append(self.path)
+        self.server.client_ports.add(self.client_address[1])
+        headers = {}
+
+        if parsed.path == "/etag":
+            page = int(query.get("page", ["1"])[0])
+            etag = f'"v1-{page}"'
+            if self.headers.get("If-None-Match") == etag:
+                self.server.not_modified += 1
+                self.send_response(304)
+                self.send_header("ETag", etag)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            headers["ETag"] = etag
+            body = ROWS[(page - 1) * PAGE_SIZE:page * PAGE_SIZE]
+        elif parsed.path == "/offset":
+            offset, limit = int(query["offset"][0]), int(query["limit"][0])
+            body = ROWS[offset:offset + limit]
+        elif parsed.path == "/cursor":
+            start = int(query.get("cursor", ["0"])[0])
+            next_cursor = start + PAGE_SIZE if start + PAGE_SIZE < len(ROWS) else None
+            body = {"data": ROWS[start:start + PAGE_SIZE], "meta": {"next": next_cursor}}
+        elif parsed.path == "/link":
+            start = int(query.get("start", ["0"])[0])
+            body = ROWS[start:start + PAGE_SIZE]
+            if start + PAGE_SIZE < len(ROWS):
+                port = self.server.server_address[1]
+                headers["Link"] = f'<http://127.0.0.1:{port}/link?start={start + PAGE_SIZE}>; rel="next"'
+        else:
+            page = int(query.get("page", ["1"])[0])
+            # Páginas iniciais mais lentas para baralhar a ordem de chegada
+            time.sleep(0.02 * max(0, 4 - page))
+            size = int(query.get("per_page", [PAGE_SIZE])[0])
+            body = ROWS[(page - 1) * size:page * size]
+
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def stub_api():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+    server.requests = []
+    server.client_ports = set()
+    server.not_modified = 0
+    thread = threading.Thread(target=server.serve_forever, kwargs={"poll_interval": 0.05}, daemon=True)
+    thread.start()
+    yield server, f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+
+
+def test_extract_api_concurrent_all_pages_in_order(stub_api):
+    server, base = stub_api
+    url = f"{base}/posts"
+    df = api_extractor.extract_api(
+        url, pagination_key="page", max_pages="all", columns=["id", "user.id"], concurrency=3
+    )
+
+    assert len(df) == TOTAL_PAGES * PAGE_SIZE
+    assert list(df["id"]) == list(range(TOTAL_PAGES * PAGE_SIZE))
+    assert list(df.columns) == ["id", "user.id"]
+    # Ligações reutilizadas pelo pool (no máximo uma por pedido em paralelo)
+    assert len(server.client_ports) <= 3
+
+
+def test_extract_api_concurrent_matches_sequential(stub_api):
+    _, base = stub_api
+    url = f"{base}/posts"
+    sequential = api_extractor.extract_api(url, pagination_key="page", max_pages=4)
+    concurrent = api_extractor.extract_api(url, pagination_key="page", max_pages=4, concurrency=4)
+
+    assert concurrent.equals(sequential)
+    assert len(concurrent) == 4 * PAGE_SIZE
+
+
+def test_extract_api_rate_limit(stub_api):
+    _, base = stub_api
+    url = f"{base}/posts"
+    start = time.monotonic()
+    df = api_extractor.extract_api(
+        url, pagination_key="page", max_pages=4, concurrency=4, rate_limit=20
+    )
+    assert len(df) == 4 * PAGE_SIZE
+    # 4 pedidos a 20/s → pelo menos 3 intervalos de 50 ms
+    assert time.monotonic() - start >= 0.15
+
+
+def test_concurrent_fetch_waits_for_in_flight_pages():
+    running = set()
+    cancel = threading.Event()
+
+    def fetch(index):
+        running.add(index)
+        time.sleep(0.05)
+        running.discard(index)
+        return pd.DataFrame({"id": [index]}) if index == 0 else pd.DataFrame()
+
+    pages = asyncio.run(api_extractor.fetch_pages_concurrently(fetch, None, 4, cancel=cancel))
+    assert len(pages) == 1
+    # Nenhum pedido continua em curso depois do fim (a sessão é fechada a seguir)
+    assert not running and cancel.is_set()
+
+
+def test_get_stops_retrying_when_cancelled(stub_api):
+    _, base = stub_api
+    cancel = threading.Event()
+    cancel.set()
+    with pytest.raises(api_extractor.RequestCancelled):
+        api_extractor.get(f"{base}/posts", cancel=cancel)
+
+
+@pytest.mark.parametrize("path, params, pagination, expected_requests", [
+    # 18 registos em páginas de 4 → 5 páginas, a última incompleta
+    ("/posts", {"per_page": 4}, {"type": "page", "param": "page", "page_size": 4}, 5),
+    ("/offset", None, {"type": "offset", "limit": 4}, 5),
+    ("/cursor", None, {"type": "cursor", "cursor_param": "cursor", "cursor_path": "meta.next"}, TOTAL_PAGES),
+    ("/link", None, {"type": "link"}, TOTAL_PAGES),
+])
+def test_pagination_strategies_fetch_exact_pages(stub_api, path, params, pagination, expected_requests):
+    server, base = stub_api
+    df = api_extractor.extract_api(f"{base}{path}", params=params, max_pages="all", pagination=pagination)
+
+    assert list(df["id"]) == list(range(len(ROWS)))
+    # Sem pedidos a páginas inexistentes
+    assert len(server.requests) == expected_requests
+
+
+def test_offset_pagination_concurrent(stub_api):
+    server, base = stub_api
+    df = api_extractor.extract_api(
+        f"{base}/offset", max_pages="all", concurrency=2,
+        pagination={"type": "offset", "limit": 4}
+    )
+    assert list(df["id"]) == list(range(len(ROWS)))
+
+
+def test_pagination_respects_max_pages(stub_api):
+    server, base = stub_api
+    df = api_extractor.extract_api(f"{base}/link", max_pages=2, pagination={"type": "link"})
+    assert len(df) == 2 * PAGE_SIZE
+    assert len(server.requests) == 2
+
+
+def test_unknown_pagination_type():
+    with pytest.raises(ValueError):
+        pagination.get_pagination_strategy({"type": "desconhecido"})
+
+
+def test_http_cache_conditional_requests_and_ttl(stub_api, tmp_path):
+    server, base = stub_api
+    url = f"{base}/etag"
+    cache_dir = str(tmp_path / "http_cache")
+
+    first = api_extractor.extract_api(
+        url, pagination_key="page", max_pages=3, http_cache={"cache_dir": cache_dir, "ttl_seconds": 0}
+    )
+    assert server.not_modified == 0
+
+    # TTL expirado → pedidos condicionais respondidos com 304
+    revalidated = api_extractor.extract_api(
+        url, pagination_key="page", max_pages=3, http_cache={"cache_dir": cache_dir, "ttl_seconds": 0}
+    )
+    assert server.not_modified == 3
+    assert revalidated.equals(first)
+
+    # Dentro do TTL → nenhum pedido
+    requests_before = len(server.requests)
+    cache = HttpCache(cache_dir, ttl_seconds=3600)
+    fresh = api_extractor.extract_api(url, pagination_key="page", max_pages=3, http_cache=cache)
+    assert len(server.requests) == requests_before
+    assert cache.stats["fresh"] == 3
+    assert fresh.equals(first)
+
+
+def test_http_cache_revalidates_last_page_and_stores_json(stub_api, tmp_path):
+    server, base = stub_api
+    url = f"{base}/etag"
+    cache = HttpCache(str(tmp_path / "http_cache"), ttl_seconds=3600)
+    first = api_extractor.extract_api(url, pagination_key="page", max_pages="all", http_cache=cache)
+    assert all(entry["file"].endswith(".json") for entry in cache.index.values())
+
+    # Dentro do TTL só a última página (vazia, sem pedido seguinte) volta ao servidor
+    requests_before = len(server.requests)
+    cache = HttpCache(str(tmp_path / "http_cache"), ttl_seconds=3600)
+    again = api_extractor.extract_api(url, pagination_key="page", max_pages="all", http_cache=cache)
+    assert len(server.requests) == requests_before + 1
+    assert cache.stats == {"fresh": TOTAL_PAGES, "revalidated": 1, "misses": 0, "evicted": 0}
+    assert again.equals(first)
+
+
+def test_http_cache_size_bound_eviction(stub_api, tmp_path):
+    _, base = stub_api
+    cache = HttpCache(str(tmp_path / "http_cache"), max_bytes=1)
+    api_extractor.extract_api(f"{base}/etag", pagination_key="page", max_pages=3, http_cache=cache)
+
+    assert cache.stats["evicted"] >= 2
+    assert len(cache.index) <= 1
+
+
+def test_fast_engine_matches_pandas_engine(stub_api):
+    _, base = stub_api
+    columns = ["id", "user.id", "title", "inexistente"]
+    expected = api_extractor.extract_api(f"{base}/posts", pagination_key="page", max_pages="all",
+                                         columns=columns)
+    fast = api_extractor.extract_api(f"{base}/posts", pagination_key="page", max_pages="all",
+                                     columns=columns, engine="fast", concurrency=2)
+
+    pd.testing.assert_frame_equal(fast, expected)
+
+
+def test_flatten_records_only_configured_paths():
+    records = [
+        {"id": 1, "user": {"id": 7, "address": {"city": "Luanda"}}, "tags": ["a"]},
+        {"id": 2, "user": {"id": 8}},
+    ]
+    block = fast_normalize.flatten_records(records, ["id", "user.address.city", "nada.aqui"])
+
+    assert len(block) == 2
+    assert block.columns == {"id": [1, 2], "user.address.city": ["Luanda", None]}
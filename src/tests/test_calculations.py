@@ -2,6 +2,7 @@ import pandas as pd
 import pytest
 from datetime import datetime, timedelta
 from transform import calculations
+from utils.config_loader import load_json
 
 
 @pytest.fixture
@@ -15,13 +16,15 @@ def sample_df():
 
 
 def test_add_id_tempo(monkeypatch, sample_df):
-    # Mock datetime para resultado previsível
+    # Mock da data atual (no fuso configurado) para resultado previsível
     fake_today = datetime(2025, 10, 29)
-    monkeypatch.setattr(calculations, "datetime", lambda: fake_today)
+    monkeypatch.setattr(calculations, "local_now", lambda: fake_today)
 
-    df_out = calculations.add_id_tempo(sample_df, offset_days=1, fixed_date=datetime(2025, 10, 29))
+    df_out = calculations.add_id_tempo(sample_df, offset_days=1)
     assert "ID_TEMPO" in df_out.columns
     assert df_out["ID_TEMPO"].iloc[0] == 20251028
+    df_out = calculations.add_id_tempo(sample_df, offset_days=1, fixed_date=datetime(2025, 10, 1))
+    assert df_out["ID_TEMPO"].iloc[0] == 20250930
 
 
 def test_substring_column(sample_df):
@@ -78,4 +81,38 @@ def test_apply_calculations_end_to_end(sample_df):
 
 def test_apply_calculations_no_rules(sample_df):
     df_out = calculations.apply_calculations(sample_df, None)
-    pd.testing.assert_frame_equal(df_out, sample_df)
\ No newline at end of file
+    pd.testing.assert_frame_equal(df_out, sample_df)
+
+
+def test_compiled_calculations_match_step_by_step(sample_df):
+    rules = {
+        "substring": [{"col": "ContractNumber", "start": 0, "end": 3, "new_col": "Prefix"}],
+        "aggregations": [{"group_by": ["Prefix"], "agg": {"Valor": "sum"}}],
+    }
+    expected = calculations.aggregate_values(
+        calculations.substring_column(sample_df, "ContractNumber", 0, 3, "Prefix"),
+        group_by=["Prefix"], agg_rules={"Valor": "sum"}
+    )
+    df_out = calculations.compile_calculations(rules).run(sample_df)
+    pd.testing.assert_frame_equal(df_out, expected)
+    assert "Prefix" not in sample_df.columns
+
+
+def test_sas_aml_calculations_on_projected_columns(tmp_path, monkeypatch):
+    # As colunas de sources.json têm de cobrir tudo o que os cálculos usam
+    monkeypatch.chdir(tmp_path)
+    cfg = load_json("sources.json")["SAS_AML"]
+    df = pd.DataFrame({
+        "ID_TEMPO": [20250925, 20250925, 20250926],
+        "TransactionID": [1, 2, 3],
+        "TransactionGenerationDate": pd.to_datetime(["2025-09-25", "2025-09-25", "2025-09-26"]),
+        "ContractNumber": ["CT00001", "CT00002", "CT00003"],
+        "Valor": [10.0, 20.0, 5.0],
+        "Extra": ["x", "y", "z"],
+    })[cfg["columns"]]
+
+    pending = []
+    df_out = calculations.apply_calculations(df, cfg["calculations"], pending=pending)
+    assert df_out.sort_values("ID_TEMPO")["Valor"].tolist() == [30.0, 5.0]
+    assert df_out.sort_values("ID_TEMPO")["TransactionID"].tolist() == [2, 1]
+    assert len(pending) == 1
@@ -0,0 +1,93 @@
+import sqlite3
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from model import calendar
+from model.surrogate_keys import MISSING_SK
+from transform import calculations
+from transform.compiler import compile_rules
+
+MODEL = {
+    "dimensions": {
+        "Tempo": {"keys": ["ID_TEMPO"], "attributes": {"Ano": "INT", "Mes": "INT", "Dia": "INT"}, "scd_type": 2},
+        "Cliente": {"keys": ["ContractPrefix"], "scd_type": 2},
+    }
+}
+
+
+@pytest.fixture
+def dw_conn(tmp_path):
+    conn = sqlite3.connect(str(tmp_path / "dw.db"))
+    conn.execute(
+        "CREATE TABLE Dim_Tempo (SK_Tempo INTEGER PRIMARY KEY AUTOINCREMENT, ID_TEMPO TEXT, "
+        "Ano INTEGER, Mes INTEGER, Dia INTEGER, ValidFrom TIMESTAMP, ValidTo TIMESTAMP, IsCurrent INTEGER)"
+    )
+    conn.commit()
+    yield conn
+    conn.close()
+
+
+def test_dimension_covers_range():
+    cal = calendar.Calendar("2024-02-27", "2024-03-01")
+    dim = cal.dimension(["Ano", "Mes", "Dia", "DiaSemana"])
+
+    assert dim["ID_TEMPO"].tolist() == [20240227, 20240228, 20240229, 20240301]
+    assert dim["Dia"].tolist() == [27, 28, 29, 1]
+    assert dim["DiaSemana"].tolist() == [2, 3, 4, 5]
+    with pytest.raises(ValueError):
+        cal.dimension(["Feriado"])
+
+
+def test_id_tempo_from_transaction_dates():
+    cal = calendar.Calendar("2025-01-01", "2025-12-31", tz="Africa/Luanda")
+    values = pd.Series(["20250103", "20241231", None, "invalid"], index=[10, 11, 12, 13])
+    keys = cal.id_tempo(values)
+
+    assert keys.index.tolist() == [10, 11, 12, 13]
+    # Fora do intervalo continua a ter a chave certa
+    assert keys.tolist()[:2] == [20250103, 20241231]
+    assert keys.isna().tolist() == [False, False, True, True]
+
+
+def test_id_tempo_converts_to_configured_timezone():
+    cal = calendar.Calendar("2025-01-01", "2025-12-31", tz="Africa/Luanda")
+    utc = pd.Series(pd.to_datetime(["2025-03-01 23:30"]).tz_localize("UTC"))
+    assert cal.id_tempo(utc).tolist() == [20250302]  # UTC+1
+
+
+def test_get_calendar_is_cached():
+    calendar.clear_cache()
+    first = calendar.get_calendar("2025-01-01", "2025-12-31", tz="UTC")
+    assert calendar.get_calendar("2025-01-01", "2025-12-31", tz="UTC") is first
+    assert calendar.get_calendar("2025-01-01", "2026-12-31", tz="UTC") is not first
+
+
+def test_load_calendar_dimension_and_surrogate_keys(dw_conn):
+    cal = calendar.Calendar("2025-01-01", "2025-01-10")
+    stats = calendar.load_calendar_dimension(dw_conn, MODEL, cal)
+    assert stats["inserted"] == 10
+    # Segunda carga: nada de novo
+    assert calendar.load_calendar_dimension(dw_conn, MODEL, cal)["inserted"] == 0
+
+    sks = cal.surrogate_keys(pd.Series(["20250105", "20250101", "20250301"]))
+    assert sks.tolist() == [5, 1, MISSING_SK]
+    assert dw_conn.execute("SELECT COUNT(*) FROM Dim_Tempo WHERE IsCurrent = 1").fetchone()[0] == 10
+
+
+def test_add_id_tempo_from_date_column():
+    df = pd.DataFrame({"Data": ["20250103", "20250215"], "Valor": [1.0, 2.0]})
+    rules = {"generate_id_tempo": True, "id_tempo_from": "Data", "filter": [["Valor", ">", 1]]}
+
+    expected = calculations.apply_calculations(df, rules)
+    assert expected["ID_TEMPO"].tolist() == [20250215]
+    pd.testing.assert_frame_equal(compile_rules({}, rules).collect(df), expected)
+
+
+def test_calendar_lookup_matches_strftime():
+    cal = calendar.Calendar("2015-01-01", "2027-12-31")
+    days = pd.Series(pd.to_datetime(np.random.default_rng(0).integers(
+        pd.Timestamp("2015-01-01").value, pd.Timestamp("2027-12-31").value, 10_000)))
+    expected = days.dt.strftime("%Y%m%d").astype(int)
+    assert (cal.id_tempo(days).to_numpy(dtype=np.int64) == expected.to_numpy()).all()
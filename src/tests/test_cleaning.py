@@ -66,3 +66,21 @@ def test_apply_cleaning_rules(sample_df):
 def test_apply_cleaning_rules_empty(sample_df):
     df_out = cleaning.apply_cleaning_rules(sample_df, {})
     pd.testing.assert_frame_equal(df_out, sample_df)
+
+
+def test_apply_cleaning_rules_keeps_input_intact(sample_df):
+    original = sample_df.copy()
+    cleaning.apply_cleaning_rules(sample_df, {"normalize_dates": ["DateCol"], "fill_missing": {"Value": 0}})
+    pd.testing.assert_frame_equal(sample_df, original)
+
+
+def test_compiled_plan_without_copy_mutates_owned_frame(sample_df):
+    rules = {"normalize_dates": ["DateCol"], "fill_missing": {"Value": 0}}
+    expected = cleaning.apply_cleaning_rules(sample_df, rules)
+
+    plan = cleaning.compile_cleaning_rules(rules)
+    assert [name for name, _ in plan.steps] == ["normalize_dates", "handle_missing_values", "fill_missing"]
+    owned = sample_df.copy()
+    df_out = plan.run(owned, copy=False)
+    assert df_out is owned
+    pd.testing.assert_frame_equal(df_out, expected)
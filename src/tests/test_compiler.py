@@ -0,0 +1,93 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from transform import calculations, cleaning
+from transform.compiler import compile_rules
+
+CLEANING = {
+    "normalize_dates": ["Data"],
+    "drop_duplicates": ["TransactionID"],
+    "fill_missing": {"ContractNumber": "N/A"},
+}
+AGGREGATION = {
+    "substring": [{"col": "ContractNumber", "start": 0, "end": 2, "new_col": "Prefixo"}],
+    "aggregations": [{"group_by": ["ID_TEMPO", "Conta"], "agg": {"Valor": "sum"}}],
+}
+
+
+@pytest.fixture
+def sample_df():
+    return pd.DataFrame({
+        "ID_TEMPO": [20250101, 20250101, 20250102, 20250102, 20250102],
+        "TransactionID": [1, 1, 2, 3, 4],
+        "Data": ["2025-01-01", "2025-01-01", "2025-01-02", "invalid", None],
+        "ContractNumber": ["CT1", "CT1", None, "CT3", "CT4"],
+        "Conta": ["A", "A", "B", "B", "A"],
+        "Valor": [10.0, 10.0, np.nan, 30.0, 5.0],
+        "Extra": [None, None, None, None, None],
+    })
+
+
+def eager(df, cleaning_rules, calculation_rules):
+    return calculations.apply_calculations(
+        cleaning.apply_cleaning_rules(df, cleaning_rules), calculation_rules)
+
+
+@pytest.mark.parametrize("calculation_rules", [{}, {"substring": AGGREGATION["substring"]}, AGGREGATION])
+def test_lazy_plan_matches_eager_rules(sample_df, calculation_rules):
+    expected = eager(sample_df, CLEANING, calculation_rules)
+    plan = compile_rules(CLEANING, calculation_rules)
+
+    pd.testing.assert_frame_equal(plan.collect(sample_df), expected)
+
+    # Execução por etapas (como no DAG) dá o mesmo resultado
+    cleaned = plan.collect(sample_df, stages=("clean",))
+    pd.testing.assert_frame_equal(plan.collect(cleaned, copy=False, stages=("calculate",)), expected)
+
+
+def test_projection_pushdown_drops_unused_columns(sample_df):
+    plan = compile_rules(CLEANING, AGGREGATION)
+    explain = plan.explain(list(sample_df.columns))
+
+    assert "project: drop ['Data', 'ContractNumber', 'Extra']" in explain
+    # Passos que só escrevem colunas não usadas pela agregação são eliminados
+    assert "normalize_dates" not in explain
+    assert "substring" not in explain
+    assert "fill_missing" not in explain
+
+
+def test_projection_with_nulls_only_in_dropped_columns(sample_df):
+    # Só a coluna largada "Extra" tem nulos
+    df = sample_df.drop(columns=["Data", "ContractNumber"]).assign(Valor=[1.0, 1.0, 2.0, 3.0, 4.0])
+    rules = {"aggregations": [{"group_by": ["Conta"], "agg": {"ID_TEMPO": "max"}}]}
+    expected = eager(df, {"drop_duplicates": ["TransactionID"]}, rules)
+
+    result = compile_rules({"drop_duplicates": ["TransactionID"]}, rules).collect(df)
+
+    pd.testing.assert_frame_equal(result, expected)
+
+
+def test_predicate_pushdown_moves_filter_before_calculations(sample_df):
+    rules = {"add_id_tempo": True, "substring": AGGREGATION["substring"], "filter": [["Conta", "==", "A"]]}
+    plan = compile_rules(CLEANING, rules)
+    steps = plan.explain(list(sample_df.columns)).splitlines()
+
+    # O filtro sobe para antes dos cálculos, mas não passa o fill_missing (barreira)
+    assert steps[-3:] == ["filter: [['Conta', '==', 'A']]", "add_id_tempo", "substring:Prefixo"]
+    assert steps[-4] == "fill_missing"
+    pd.testing.assert_frame_equal(plan.collect(sample_df), eager(sample_df, CLEANING, rules))
+
+
+def test_filter_masks_treat_nulls_as_false(sample_df):
+    rules = {"filter": [["Valor", "!=", 10.0], ["ContractNumber", "not in", ["CT3"]]]}
+    result = compile_rules(rules).collect(sample_df)
+
+    assert result["TransactionID"].tolist() == [4]
+    pd.testing.assert_frame_equal(result, cleaning.apply_cleaning_rules(sample_df, rules))
+
+
+def test_collect_keeps_input_intact(sample_df):
+    original = sample_df.copy()
+    compile_rules(CLEANING, AGGREGATION).collect(sample_df)
+    pd.testing.assert_frame_equal(sample_df, original)
@@ -0,0 +1,159 @@
+import pandas as pd
+import pytest
+from extract import csv_extractor, encoding_cache
+from utils.state_store import StateStore
+
+
+@pytest.fixture(autouse=True)
+def tmp_encoding_cache(tmp_path, monkeypatch):
+    # Evita escrever o cache de encodings no diretório de trabalho
+    cache = encoding_cache.EncodingCache(str(tmp_path / "cache" / "encodings.json"))
+    monkeypatch.setattr(encoding_cache, "_default_cache", cache)
+    return cache
+
+
+@pytest.fixture
+def csv_dir(tmp_path):
+    pd.DataFrame({
+        "id_produto": [1, 2, 3, 1],
+        "nome": ["Arroz", "Feijão", "Milho", "Arroz"],
+        "preco": [1200, 1500, 900, 1200],
+        "extra": ["x", "y", "z", "x"]
+    }).to_csv(tmp_path / "produtos_202501.csv", index=False)
+    pd.DataFrame({
+        "id_produto": [3, 4],
+        "nome": ["Milho", "Óleo"],
+        "preco": [900, 2500],
+        "extra": ["z", "w"]
+    }).to_csv(tmp_path / "produtos_202502.csv", index=False)
+    return tmp_path
+
+
+def test_iter_csv_chunks_projection_and_source_file(csv_dir):
+    chunks = list(csv_extractor.iter_csv_chunks(
+        str(csv_dir), columns=["preco", "id_produto", "__source_file"], chunksize=2, deduplicate=False
+    ))
+
+    assert all(len(c) <= 2 for c in chunks)
+    df = pd.concat(chunks, ignore_index=True)
+    assert list(df.columns) == ["preco", "id_produto", "__source_file"]
+    assert len(df) == 6
+    assert set(df["__source_file"]) == {"produtos_202501.csv", "produtos_202502.csv"}
+
+
+def test_iter_csv_chunks_deduplicates_like_extract_csv(csv_dir):
+    # Sem `__source_file` nas colunas, Milho repetido entre ficheiros também sai
+    chunks = csv_extractor.iter_csv_chunks(str(csv_dir), columns=["id_produto", "nome", "preco"], chunksize=2)
+    assert sorted(pd.concat(chunks)["id_produto"]) == [1, 2, 3, 4]
+
+    # Com `__source_file`, as linhas de ficheiros diferentes são distintas
+    chunks = csv_extractor.iter_csv_chunks(str(csv_dir), chunksize=2)
+    assert sorted(pd.concat(chunks)["id_produto"]) == [1, 2, 3, 3, 4]
+
+
+@pytest.mark.parametrize("columns", [None, ["id_produto", "nome", "preco"], ["nome", "__source_file"]])
+def test_streaming_extract_csv_matches_full_read(csv_dir, columns):
+    full = csv_extractor.extract_csv(str(csv_dir), columns=columns)
+    streamed = pd.concat(csv_extractor.extract_csv(str(csv_dir), columns=columns, chunksize=2),
+                         ignore_index=True)
+
+    pd.testing.assert_frame_equal(streamed, full.reset_index(drop=True))
+
+
+def test_iter_csv_chunks_dedup_ignores_inferred_dtypes(tmp_path):
+    # "valor" sai int64 no 1.º bloco e float64 no 2.º (tem um nulo)
+    (tmp_path / "a.csv").write_text("codigo,valor\nA,10\nA,10\nB,10\nA,\nA,10\nB,20\n")
+    df = pd.concat(csv_extractor.iter_csv_chunks(str(tmp_path), chunksize=3), ignore_index=True)
+
+    assert df["codigo"].tolist() == ["A", "B", "A", "B"]
+    assert df["valor"].tolist()[:2] == [10, 10] and df["valor"].isna().tolist() == [False, False, True, False]
+
+
+@pytest.mark.parametrize("columns", [None, ["id_produto", "nome", "preco"]])
+def test_iter_csv_chunks_dedup_with_memory_budget(csv_dir, columns):
+    expected = pd.concat(csv_extractor.iter_csv_chunks(str(csv_dir), columns=columns, chunksize=2))
+    chunks = list(csv_extractor.iter_csv_chunks(str(csv_dir), columns=columns, chunksize=2, memory_budget=1))
+
+    assert all(len(c) <= 2 for c in chunks)
+    df = pd.concat(chunks)
+    assert list(df.columns) == list(expected.columns)
+    assert sorted(map(tuple, df.to_numpy().tolist())) == sorted(map(tuple, expected.to_numpy().tolist()))
+
+
+def test_iter_csv_chunks_are_per_file(csv_dir):
+    chunks = list(csv_extractor.iter_csv_chunks(str(csv_dir), chunksize=3, deduplicate=False))
+    # 4 linhas + 2 linhas → blocos de 3, 1 e 2 (sem juntar ficheiros)
+    assert [len(c) for c in chunks] == [3, 1, 2]
+
+
+def test_iter_csv_chunks_schema_validation(csv_dir):
+    with pytest.raises(ValueError):
+        list(csv_extractor.iter_csv_chunks(str(csv_dir), schema={"inexistente": "str"}))
+
+
+def test_extract_csv_parallel_matches_sequential(csv_dir):
+    sequential = csv_extractor.extract_csv(str(csv_dir), parallel=False)
+    parallel = csv_extractor.extract_csv(str(csv_dir), parallel=True, max_workers=2)
+
+    pd.testing.assert_frame_equal(parallel, sequential)
+    assert list(parallel["__source_file"].unique()) == ["produtos_202501.csv", "produtos_202502.csv"]
+
+
+def test_use_parallel_defaults_to_sequential_for_small_inputs(csv_dir):
+    files = csv_extractor.list_csv_files(str(csv_dir))
+    assert not csv_extractor.use_parallel(files)
+    assert csv_extractor.use_parallel(files, parallel=True)
+
+
+def test_detect_encoding_utf8_fast_path(tmp_path, monkeypatch):
+    file = tmp_path / "utf8.csv"
+    file.write_text("nome\nFeijão\n", encoding="utf-8")
+
+    def fail(raw):
+        raise AssertionError("chardet não deve ser chamado para UTF-8 válido")
+
+    monkeypatch.setattr(csv_extractor.chardet, "detect", fail)
+    assert csv_extractor.detect_encoding(str(file)) == "utf-8"
+
+
+def test_detect_encoding_falls_back_to_chardet(tmp_path):
+    file = tmp_path / "latin1.csv"
+    file.write_bytes("nome\nFeijão com açúcar e pão\n".encode("latin-1"))
+    assert csv_extractor.detect_encoding(str(file)).lower() != "utf-8"
+
+
+def test_encoding_cache_hits_and_persistence(csv_dir, tmp_path):
+    cache_path = str(tmp_path / "enc.json")
+    cache = encoding_cache.EncodingCache(cache_path)
+    csv_extractor.extract_csv(str(csv_dir), encoding_cache=cache)
+    assert cache.stats()["misses"] == 2
+
+    reloaded = encoding_cache.EncodingCache(cache_path)
+    csv_extractor.extract_csv(str(csv_dir), encoding_cache=reloaded)
+    assert reloaded.stats()["hits"] == 2
+    assert reloaded.stats()["misses"] == 0
+
+    # Ficheiro alterado muda de fingerprint
+    (csv_dir / "produtos_202502.csv").write_text("id_produto,nome,preco,extra\n5,Sal,100,q\n")
+    assert reloaded.get(str(csv_dir / "produtos_202502.csv")) is None
+
+    # A nova fingerprint substitui a antiga (uma entrada por ficheiro)
+    csv_extractor.extract_csv(str(csv_dir), encoding_cache=reloaded)
+    assert reloaded.stats()["entries"] == 2
+
+
+def test_extract_csv_skips_ingested_files(csv_dir, tmp_path):
+    state = StateStore(str(tmp_path / "state.db"))
+    first = csv_extractor.extract_csv(str(csv_dir), state=state, source_name="PRECARIO")
+    state.commit("PRECARIO")
+
+    second = csv_extractor.extract_csv(str(csv_dir), state=state, source_name="PRECARIO")
+    assert len(first) > 0
+    assert second.empty
+
+    pd.DataFrame({"id_produto": [9], "nome": ["Sal"], "preco": [100], "extra": ["q"]}).to_csv(
+        csv_dir / "produtos_202503.csv", index=False
+    )
+    third = csv_extractor.extract_csv(str(csv_dir), state=state, source_name="PRECARIO")
+    assert list(third["__source_file"].unique()) == ["produtos_202503.csv"]
+    state.close()
@@ -0,0 +1,75 @@
+import pandas as pd
+import pytest
+
+from transform import cleaning, dates
+
+
+@pytest.fixture(autouse=True)
+def empty_cache():
+    dates.clear_cache()
+    yield
+    dates.clear_cache()
+
+
+def test_infer_date_format_from_sample():
+    values = ["bad", "2025-01-31 10:00:00", "2025-02-01 11:30:00"]
+    assert dates.infer_date_format(values) == "%Y-%m-%d %H:%M:%S"
+    assert dates.infer_date_format(["31/01/2025", "01/02/2025"]) == "%d/%m/%Y"
+    assert dates.infer_date_format(["foo", "bar"]) is None
+
+
+@pytest.mark.filterwarnings("ignore:Parsing dates")
+@pytest.mark.parametrize("values", [
+    ["01/02/2025", "13/02/2025"],
+    ["31/01/2025", "01/02/2025"],
+    ["02-03-2025", "04-05-2025 10:00"],
+])
+def test_ambiguous_dates_follow_to_datetime(values):
+    # Mês-primeiro, a não ser que o primeiro valor só possa ser dia-primeiro
+    parsed, _ = dates.parse_dates(pd.Series(values))
+    expected = pd.to_datetime(pd.Series(values), errors="coerce")
+    assert parsed.tolist()[0] == expected.tolist()[0]
+    assert parsed.isna().tolist() == expected.isna().tolist()
+
+
+def test_ambiguous_dates_day_first_when_configured():
+    s = pd.Series(["01/02/2025", "13/02/2025"])
+    assert dates.parse_dates(s)[0].tolist()[0] == pd.Timestamp("2025-01-02")
+    parsed, _ = dates.parse_dates(s, date_format="%d/%m/%Y")
+    assert parsed.tolist() == [pd.Timestamp("2025-02-01"), pd.Timestamp("2025-02-13")]
+    fmt = dates.infer_date_format(s, candidates=["%d/%m/%Y"])
+    assert fmt == "%d/%m/%Y"
+
+
+def test_parse_dates_reports_coerced_values():
+    s = pd.Series(["2025-01-01", "2025-01-01", "invalid", None, "2025-01-02"])
+    parsed, stats = dates.parse_dates(s)
+
+    assert stats == {"format": "%Y-%m-%d", "unique": 3, "coerced": 1}
+    assert parsed.tolist()[:2] == [pd.Timestamp("2025-01-01")] * 2
+    assert parsed.isna().tolist() == [False, False, True, True, False]
+    pd.testing.assert_series_equal(parsed, pd.to_datetime(s, format="%Y-%m-%d", errors="coerce"))
+
+
+def test_parse_dates_integer_dates_with_nulls():
+    parsed, stats = dates.parse_dates(pd.Series([20250101, None, 20250230]))
+    assert stats["format"] == "%Y%m%d"
+    assert stats["coerced"] == 1
+    assert parsed.iloc[0] == pd.Timestamp("2025-01-01")
+
+
+def test_parse_dates_reuses_cache_between_chunks():
+    dates.parse_dates(pd.Series(["2025-01-01", "2025-01-02"]))
+    parsed, _ = dates.parse_dates(pd.Series(["2025-01-02", "2025-01-03"]))
+
+    assert len(dates._cache["%Y-%m-%d"]) == 3
+    assert parsed.tolist() == [pd.Timestamp("2025-01-02"), pd.Timestamp("2025-01-03")]
+
+
+def test_normalize_dates_with_explicit_formats():
+    df = pd.DataFrame({"A": ["01/02/2025", "x"], "B": ["2025-02-01", "2025-02-02"]})
+    out = cleaning.normalize_dates(df, {"A": "%d/%m/%Y", "B": None})
+
+    assert out["A"].tolist()[0] == pd.Timestamp("2025-02-01")
+    assert out["A"].isna().tolist() == [False, True]
+    assert out["B"].tolist() == [pd.Timestamp("2025-02-01"), pd.Timestamp("2025-02-02")]
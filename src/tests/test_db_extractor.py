@@ -0,0 +1,223 @@
+import os
+import sqlite3
+
+import pandas as pd
+import pyarrow.parquet as pq
+import pytest
+from extract import db_extractor
+from utils.db_pool import ConnectionPool
+from utils.state_store import StateStore
+
+
+@pytest.fixture
+def sqlite_db(tmp_path):
+    # SQLite como substituto do SQL Server (mesma interface DB-API)
+    db_path = str(tmp_path / "aml.db")
+    conn = sqlite3.connect(db_path)
+    conn.execute(
+        "CREATE TABLE TMP_DRR4 (ID_TEMPO INTEGER, TransactionID INTEGER, "
+        "TransactionGenerationDate TEXT, ContractNumber TEXT, Valor REAL)"
+    )
+    rows = [
+        (20250925 if i % 2 else 20250926, i, f"2025-09-25 10:{i % 60:02d}:00", f"CT{i:05d}", i * 10.0)
+        for i in range(1, 26)
+    ]
+    conn.executemany("INSERT INTO TMP_DRR4 VALUES (?, ?, ?, ?, ?)", rows)
+    conn.commit()
+    conn.close()
+    return db_path
+
+
+@pytest.fixture
+def sqlite_pool(sqlite_db):
+    pool = ConnectionPool("aml_test", lambda: sqlite3.connect(sqlite_db, check_same_thread=False), max_size=3)
+    yield pool
+    pool.close_all()
+
+
+@pytest.fixture
+def source_cfg():
+    return {
+        "connection": "sqlserver_aml",
+        "query": "SELECT * FROM TMP_DRR4 WHERE ID_TEMPO = :id_tempo",
+        "columns": ["TransactionID", "ContractNumber", "ID_TEMPO"],
+    }
+
+
+def test_build_query_pushes_projection_and_limit():
+    query = db_extractor.build_query(
+        "SELECT * FROM T WHERE ID_TEMPO = :id_tempo", {"id_tempo": 20250925}, 10, ["A", "B"]
+    )
+    assert query == "SELECT TOP 10 [A], [B] FROM (SELECT * FROM T WHERE ID_TEMPO = 20250925) AS src"
+
+
+def test_extract_db_stream_writes_row_groups(sqlite_pool, source_cfg, tmp_path):
+    output = str(tmp_path / "aml.parquet")
+    path = db_extractor.extract_db_stream(
+        source_cfg, params={"id_tempo": 20250925}, batch_size=4, pool=sqlite_pool, output_path=output
+    )
+
+    parquet = pq.ParquetFile(path)
+    assert parquet.metadata.num_rows == 13
+    assert parquet.metadata.num_row_groups == 4
+    df = pd.read_parquet(path)
+    assert list(df.columns) == ["TransactionID", "ContractNumber", "ID_TEMPO"]
+    assert set(df["ID_TEMPO"]) == {20250925}
+
+
+def test_extract_db_stream_empty_result(sqlite_pool, source_cfg, tmp_path):
+    path = db_extractor.extract_db_stream(
+        source_cfg, params={"id_tempo": 1}, pool=sqlite_pool, output_path=str(tmp_path / "vazio.parquet")
+    )
+    assert pq.ParquetFile(path).metadata.num_rows == 0
+
+
+def test_partition_predicates_cover_range():
+    predicates = db_extractor.partition_predicates("TransactionID", 1, 25, 4)
+    assert len(predicates) == 4
+    assert predicates[0].endswith("IS NULL)")
+    assert predicates[1] == "[TransactionID] >= 7 AND [TransactionID] < 13"
+    assert predicates[-1] == "[TransactionID] >= 20"
+
+
+def test_extract_db_partitioned_matches_full_extraction(sqlite_db, sqlite_pool, source_cfg, tmp_path):
+    with sqlite3.connect(sqlite_db) as conn:
+        conn.execute("INSERT INTO TMP_DRR4 VALUES (20250925, NULL, NULL, 'SEM_ID', 0)")
+
+    cfg = {**source_cfg, "partitioning": {"column": "TransactionID", "num_partitions": 3, "max_workers": 3}}
+    path = db_extractor.extract_db_partitioned(
+        cfg, params={"id_tempo": 20250925}, batch_size=2, pool=sqlite_pool,
+        output_path=str(tmp_path / "aml_part.parquet")
+    )
+    full = db_extractor.extract_db_stream(
+        source_cfg, params={"id_tempo": 20250925}, pool=sqlite_pool,
+        output_path=str(tmp_path / "aml_full.parquet")
+    )
+
+    df_part = pd.read_parquet(path).sort_values("ContractNumber", ignore_index=True)
+    df_full = pd.read_parquet(full).sort_values("ContractNumber", ignore_index=True)
+    assert len(df_part) == 14
+    pd.testing.assert_frame_equal(df_part, df_full)
+
+
+def test_extract_db_partitioned_requires_integer_column(sqlite_pool, source_cfg, tmp_path):
+    cfg = {**source_cfg, "partitioning": {"column": "ContractNumber", "num_partitions": 3}}
+    with pytest.raises(ValueError, match="ContractNumber"):
+        db_extractor.extract_db_partitioned(cfg, params={"id_tempo": 20250925}, pool=sqlite_pool,
+                                            output_path=str(tmp_path / "aml.parquet"))
+
+    cfg["partitioning"] = {"column": "TransactionID", "lower": 1.5, "upper": 25}
+    with pytest.raises(ValueError, match="inteira"):
+        db_extractor.extract_db_partitioned(cfg, params={"id_tempo": 20250925}, pool=sqlite_pool,
+                                            output_path=str(tmp_path / "aml.parquet"))
+
+
+def test_parquet_sink_widens_schema_across_batches(tmp_path):
+    # Driver sem tipos (SQLite): inteiros no 1.º lote, float e texto em lotes seguintes
+    description = [("Valor", None), ("Codigo", None), ("Nota", None)]
+    sink = db_extractor.ParquetSink(str(tmp_path / "out.parquet"), row_group_size=2)
+    sink.write(description, [(1, 10, None), (2, 20, None)])
+    sink.write(description, [(2.5, "A1", 7)])
+    sink.write(description, [(3, 30, "x")])
+    df = pd.read_parquet(sink.commit())
+
+    assert df["Valor"].tolist() == [1.0, 2.0, 2.5, 3.0]
+    assert df["Codigo"].tolist() == ["10", "20", "A1", "30"]
+    assert df["Nota"].tolist()[2:] == ["7", "x"]
+    assert os.listdir(tmp_path) == ["out.parquet"]
+
+
+def test_extract_db_reuses_pooled_connection(sqlite_pool, source_cfg):
+    for id_tempo in (20250925, 20250926, 20250925):
+        df = db_extractor.extract_db(source_cfg, params={"id_tempo": id_tempo}, save_csv=False, pool=sqlite_pool)
+        assert set(df["ID_TEMPO"]) == {id_tempo}
+
+    stats = sqlite_pool.stats()
+    assert stats["created"] == 1
+    assert stats["reused"] == 2
+    assert stats["in_use"] == 0
+
+
+def test_extract_db_incremental_watermark(sqlite_db, sqlite_pool, source_cfg, tmp_path):
+    cfg = {
+        **source_cfg,
+        "name": "SAS_AML",
+        "incremental_key": "TransactionID",
+        "incremental_query": "SELECT * FROM TMP_DRR4",
+    }
+    state = StateStore(str(tmp_path / "state.db"))
+
+    first = db_extractor.extract_db(cfg, save_csv=False, pool=sqlite_pool, state=state)
+    assert len(first) == 25
+    # Sem staging concluído o watermark não avança
+    assert state.get_watermark("SAS_AML") is None
+    state.commit("SAS_AML")
+    assert state.get_watermark("SAS_AML") == 25
+
+    with sqlite3.connect(sqlite_db) as conn:
+        conn.execute("INSERT INTO TMP_DRR4 VALUES (20250927, 26, NULL, 'CT00026', 260)")
+
+    path = db_extractor.extract_db_stream(
+        cfg, pool=sqlite_pool, state=state, output_path=str(tmp_path / "delta.parquet")
+    )
+    delta = pd.read_parquet(path)
+    assert list(delta["TransactionID"]) == [26]
+    assert state.get_watermark("SAS_AML") == 26
+    state.close()
+
+
+def test_extract_db_dispatches_to_partitioned_extraction(sqlite_pool, source_cfg, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    cfg = {
+        **source_cfg,
+        "name": "SAS_AML",
+        "incremental_key": "TransactionID",
+        "partitioning": {"column": "TransactionID", "num_partitions": 3, "max_workers": 3},
+        "fetch_size": 4,
+    }
+    used = []
+    original = db_extractor.extract_db_partitioned
+    monkeypatch.setattr(db_extractor, "extract_db_partitioned",
+                        lambda *args, **kwargs: used.append(kwargs) or original(*args, **kwargs))
+    state = StateStore(str(tmp_path / "state.db"))
+
+    df = db_extractor.extract_db(cfg, params={"id_tempo": 20250925}, save_csv=False,
+                                 pool=sqlite_pool, state=state)
+    assert used and used[0]["batch_size"] == 4
+    assert sorted(df["TransactionID"]) == list(range(1, 26, 2))
+    assert list(df.columns) == source_cfg["columns"]
+    # Parquet temporário removido; watermark pendente até ao staging
+    assert os.listdir(tmp_path / "data" / "staging") == []
+    assert state.get_watermark("SAS_AML") is None
+    state.commit("SAS_AML")
+    assert state.get_watermark("SAS_AML") == 25
+    state.close()
+
+
+def test_extract_source_streams_when_configured(sqlite_pool, source_cfg, tmp_path, monkeypatch):
+    from pipelines import run_all_sources as pipeline
+
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(db_extractor, "get_connection_pool", lambda cfg: sqlite_pool)
+    cfg = {**source_cfg, "type": "database", "stream": True, "fetch_size": 5}
+
+    df = pipeline.extract_source(cfg, params={"id_tempo": 20250926})
+    expected = db_extractor.extract_db(source_cfg, params={"id_tempo": 20250926}, save_csv=False,
+                                       pool=sqlite_pool)
+    pd.testing.assert_frame_equal(df, expected)
+    assert os.listdir(tmp_path / "data" / "staging") == []
+
+
+def test_extract_db_deduplicates_with_memory_budget(sqlite_pool, source_cfg, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    cfg = {**source_cfg, "stream": True, "fetch_size": 4, "dedup_memory_budget": 1,
+           "cleaning_rules": {"drop_duplicates": ["ID_TEMPO", "ContractNumber"]}}
+    full = db_extractor.extract_db({**source_cfg, "stream": True}, params={"id_tempo": 20250925},
+                                   save_csv=False, pool=sqlite_pool)
+
+    df = db_extractor.extract_db(cfg, params={"id_tempo": 20250925}, save_csv=False, pool=sqlite_pool)
+    pd.testing.assert_frame_equal(df, full)
+
+    cfg["cleaning_rules"]["drop_duplicates"] = ["ID_TEMPO"]
+    df = db_extractor.extract_db(cfg, params={"id_tempo": 20250925}, save_csv=False, pool=sqlite_pool)
+    pd.testing.assert_frame_equal(df, full.head(1))
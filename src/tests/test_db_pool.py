@@ -0,0 +1,93 @@
+import sqlite3
+import threading
+
+import pytest
+from utils import db_pool
+from utils.db_pool import ConnectionPool
+
+
+def make_pool(**options):
+    return ConnectionPool("teste", lambda: sqlite3.connect(":memory:", check_same_thread=False), **options)
+
+
+def test_pool_reuses_connections():
+    pool = make_pool(max_size=2)
+    with pool.connection() as first:
+        pass
+    with pool.connection() as second:
+        assert second is first
+
+    assert pool.stats()["created"] == 1
+    assert pool.stats()["checkouts"] == 2
+
+
+def test_pool_max_size_and_checkout_timeout():
+    pool = make_pool(max_size=1, checkout_timeout=0.05)
+    conn = pool.acquire()
+    with pytest.raises(TimeoutError):
+        pool.acquire()
+
+    # Libertar a ligação desbloqueia quem está à espera
+    waiter = threading.Thread(target=lambda: pool.release(pool.acquire()))
+    pool.checkout_timeout = 2
+    waiter.start()
+    pool.release(conn)
+    waiter.join(timeout=2)
+    assert pool.stats()["in_use"] == 0
+
+
+def test_pool_idle_timeout_and_health_check():
+    pool = make_pool(idle_timeout=0)
+    with pool.connection():
+        pass
+    with pool.connection():
+        pass
+    assert pool.stats()["closed_idle"] == 1
+
+    pool = make_pool(health_check_interval=0)
+    with pool.connection() as conn:
+        pass
+    conn.close()  # ligação morta enquanto livre
+    with pool.connection() as fresh:
+        assert fresh is not conn
+    assert pool.stats()["failed_health_checks"] == 1
+
+
+def test_get_pool_registry(monkeypatch):
+    monkeypatch.setattr(db_pool, "_pools", {})
+    factory = lambda: sqlite3.connect(":memory:")
+    pool = db_pool.get_pool("sqlserver_aml", factory, max_size=3)
+
+    assert db_pool.get_pool("sqlserver_aml") is pool
+    assert pool.max_size == 3
+    with pytest.raises(KeyError):
+        db_pool.get_pool("inexistente")
+
+
+def test_health_check_runs_outside_pool_lock(monkeypatch):
+    pool = make_pool(max_size=2, health_check_interval=0)
+    stale, other = pool.acquire(), pool.acquire()
+    pool.release(stale)
+
+    started, proceed = threading.Event(), threading.Event()
+
+    def slow_ping(conn):
+        started.set()
+        proceed.wait(timeout=2)
+        return True
+
+    monkeypatch.setattr(pool, "_healthy", slow_ping)
+    checker = threading.Thread(target=pool.acquire)
+    checker.start()
+    assert started.wait(timeout=2)
+
+    # Com o health check em curso, o pool continua disponível para os outros threads
+    released = threading.Thread(target=pool.release, args=(other,))
+    released.start()
+    released.join(timeout=1)
+    assert not released.is_alive()
+    assert pool.stats()["idle"] == 1
+
+    proceed.set()
+    checker.join(timeout=2)
+    assert pool.stats()["in_use"] == 1
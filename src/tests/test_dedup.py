@@ -0,0 +1,111 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from transform import cleaning, dedup
+
+
+@pytest.fixture
+def frame():
+    rng = np.random.default_rng(0)
+    n = 5000
+    return pd.DataFrame({
+        "TransactionID": rng.integers(0, 1500, n),
+        "ContractNumber": rng.choice(["CT1", "CT2", None], n),
+        "Valor": rng.random(n),
+    })
+
+
+def test_drop_duplicates_matches_pandas(frame):
+    pd.testing.assert_frame_equal(dedup.drop_duplicates(frame, ["TransactionID"]),
+                                  frame.drop_duplicates(subset=["TransactionID"]))
+    pd.testing.assert_frame_equal(dedup.drop_duplicates(frame, ["TransactionID", "ContractNumber"]),
+                                  frame.drop_duplicates(subset=["TransactionID", "ContractNumber"]))
+
+
+def test_key_digests_ignore_int_float_storage():
+    as_int = pd.DataFrame({"ID": [1, 2]})
+    as_float = pd.DataFrame({"ID": [1.0, 2.0]})
+    assert (dedup.key_digests(as_int) == dedup.key_digests(as_float)).all()
+
+
+def test_digest_set_contains_across_runs():
+    digests = dedup.DigestSet()
+    for i in range(12):
+        digests.add(np.array([i * 10, i * 10 + 1], dtype=np.uint64))
+    assert len(digests._runs) <= dedup.DigestSet.MAX_RUNS
+    assert digests.contains(np.array([0, 1, 111, 5], dtype=np.uint64)).tolist() == [True, True, True, False]
+
+
+@pytest.mark.parametrize("budget", [10**9, 20_000])
+def test_hash_deduplicator_matches_drop_duplicates(frame, tmp_path, budget):
+    deduplicator = dedup.HashDeduplicator(subset=["TransactionID"], memory_budget=budget,
+                                          partitions=4, spill_dir=str(tmp_path))
+    for start in range(0, len(frame), 1000):
+        deduplicator.add(frame.iloc[start:start + 1000])
+    result = deduplicator.collect()
+
+    pd.testing.assert_frame_equal(result, frame.drop_duplicates(subset=["TransactionID"]))
+    if budget < 10**9:
+        assert deduplicator.spilled_partitions > 0
+    assert not any(tmp_path.iterdir())  # ficheiros temporários apagados
+
+
+def test_key_index_rejects_previous_loads(tmp_path):
+    first = pd.DataFrame({"TransactionID": [1, 2, 2], "Valor": [1.0, 2.0, 2.0]})
+    second = pd.DataFrame({"TransactionID": [2, 3], "Valor": [9.0, 3.0]})
+
+    index = dedup.KeyIndex("TMP_AML", ["TransactionID"], str(tmp_path))
+    out = cleaning.deduplicate(first, subset=["TransactionID"], key_index=index)
+    assert out["TransactionID"].tolist() == [1, 2]
+    index.commit()
+
+    reloaded = dedup.KeyIndex("TMP_AML", ["TransactionID"], str(tmp_path))
+    assert reloaded.load() and len(reloaded) == 2
+    out = cleaning.deduplicate(second, subset=["TransactionID"], key_index=reloaded)
+    assert out["TransactionID"].tolist() == [3]
+
+
+def test_key_index_rollback_discards_pending(tmp_path):
+    index = dedup.KeyIndex("TMP_AML", ["TransactionID"], str(tmp_path))
+    dedup.drop_duplicates(pd.DataFrame({"TransactionID": [1]}), ["TransactionID"], index=index)
+    index.rollback()
+    index.commit()
+    assert len(index) == 0
+
+
+def test_open_index_from_source_config(tmp_path):
+    cfg = {"target_table": "TMP_AML",
+           "cleaning_rules": {"drop_duplicates": ["TransactionID"], "persistent_dedup": True}}
+    index = dedup.open_index(cfg, str(tmp_path))
+    assert index.table == "TMP_AML" and index.keys == ["TransactionID"]
+    assert dedup.open_index({"cleaning_rules": {"drop_duplicates": ["ID"]}}, str(tmp_path)) is None
+
+
+def test_text_digests_ignore_inferred_dtypes():
+    as_int = pd.DataFrame({"ID": [1, 2], "Nome": ["a", "b"]})
+    as_float = pd.DataFrame({"ID": [1.0, 2.0], "Nome": ["a", "b"]})
+    expected = dedup.text_digests(as_int)
+    assert (dedup.text_digests(as_float) == expected).all()
+    assert dedup.text_digests(pd.DataFrame({"ID": [None, 1.5], "Nome": ["a", "b"]}))[0] != expected[0]
+
+
+def test_text_digests_keep_text_as_text():
+    # Códigos com zeros à esquerda ou "1.0" não se confundem com números (como em drop_duplicates)
+    codes = pd.DataFrame({"Codigo": ["0123", "123", "1.0", "1"]})
+    assert len(set(dedup.text_digests(codes))) == 4
+    assert dedup.text_digests(pd.DataFrame({"Codigo": [123]}))[0] != dedup.text_digests(codes)[0]
+
+
+def test_hash_deduplicator_estimates_memory_once(frame, monkeypatch):
+    deduplicator = dedup.HashDeduplicator(subset=["TransactionID"], partitions=4)
+    calls = []
+    original = pd.DataFrame.memory_usage
+    monkeypatch.setattr(pd.DataFrame, "memory_usage",
+                        lambda self, *args, **kwargs: calls.append(1) or original(self, *args, **kwargs))
+    for start in range(0, len(frame), 1000):
+        deduplicator.add(frame.iloc[start:start + 1000])
+
+    assert len(calls) == 1
+    assert deduplicator._sizes.sum() > 0
+    deduplicator.close()
@@ -0,0 +1,83 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from transform import cleaning, dtypes
+
+
+@pytest.mark.parametrize("type_name, kind", [
+    ("INT", "int"), ("bigint", "int"), ("DECIMAL(18,2)", "float"), ("NVARCHAR(50)", "string"),
+    ("DATETIME", "datetime"), ("BIT", "bool"), ("str", "string"), ("category", "category"),
+])
+def test_logical_type(type_name, kind):
+    assert dtypes.logical_type(type_name) == kind
+
+
+def test_target_dtypes_schema_overrides_model():
+    cfg = {
+        "schema": {"Valor": "int"},
+        "dimensional_model": {
+            "dimensions": {"Cliente": {"attributes": {"ContractNumber": "NVARCHAR(50)"}}},
+            "facts": {"Valor": "DECIMAL(18,2)"},
+        },
+    }
+    assert dtypes.target_dtypes(cfg) == {"ContractNumber": "string", "Valor": "int"}
+
+
+def test_smallest_int_dtype():
+    assert dtypes.smallest_int_dtype(pd.Series([1, 100, None])) == pd.Int8Dtype()
+    assert dtypes.smallest_int_dtype(pd.Series([20250101, 20251231])) == pd.Int32Dtype()
+    assert dtypes.smallest_int_dtype(pd.Series([1.5, 2.0])) is None
+
+
+def test_apply_schema_converts_only_what_is_needed():
+    n = 2000
+    df = pd.DataFrame({
+        "ID_TEMPO": np.full(n, 20250101),
+        "Conta": np.random.default_rng(0).choice(["A", "B", "C"], n),
+        "Texto": [f"t{i}" for i in range(n)],
+        "Valor": pd.array(np.arange(n, dtype=float), dtype="Float64"),
+    })
+    out, report = dtypes.apply_schema(df, {"ID_TEMPO": "int", "Conta": "string",
+                                           "Texto": "string", "Valor": "float"})
+
+    assert set(report) == {"ID_TEMPO", "Conta", "Texto"}  # Valor já está no tipo alvo
+    assert out["ID_TEMPO"].dtype == pd.Int32Dtype()
+    assert isinstance(out["Conta"].dtype, pd.CategoricalDtype)
+    assert out["Texto"].dtype == dtypes.STRING_DTYPE
+    assert report["Conta"]["saved"] > 0
+    assert df["ID_TEMPO"].dtype == np.int64  # input intacto
+
+
+def test_handle_missing_values_only_touches_null_columns():
+    df = pd.DataFrame({"A": [1, 2, 3], "B": [1.0, None, 3.0]})
+    out = cleaning.handle_missing_values(df)
+
+    assert out["A"].dtype == np.int64
+    assert out["B"].dtype == pd.Int64Dtype()
+    assert out["B"].isna().sum() == 1
+
+
+def test_fill_missing_on_category_column():
+    df = pd.DataFrame({"ContractNumber": pd.Series(["CT1", None, "CT1"], dtype="category")})
+    out = cleaning.fill_missing(df, {"ContractNumber": "N/A"})
+    assert out["ContractNumber"].tolist() == ["CT1", "N/A", "CT1"]
+
+
+def test_non_convertible_float_and_bool_columns_are_kept():
+    df = pd.DataFrame({"Valor": ["10.5", "abc", None], "Flag": ["S", "talvez", None]})
+    out = cleaning.handle_missing_values(df, schema={"Valor": "float", "Flag": "bool"})
+
+    assert out["Valor"].tolist()[:2] == ["10.5", "abc"]
+    assert out["Flag"].tolist()[:2] == ["S", "talvez"]
+
+
+def test_float_and_bool_columns_from_text():
+    df = pd.DataFrame({"Valor": ["10.5", "3", None], "Flag": ["S", " n ", None], "Bit": [1, 0, 1]})
+    out, _ = dtypes.apply_schema(df, {"Valor": "float", "Flag": "bool", "Bit": "bool"})
+
+    assert out["Valor"].dtype == pd.Float64Dtype()
+    assert out["Valor"].tolist()[:2] == [10.5, 3.0]
+    assert out["Flag"].dtype == pd.BooleanDtype()
+    assert out["Flag"].tolist()[:2] == [True, False] and out["Flag"].isna().iloc[2]
+    assert out["Bit"].tolist() == [True, False, True]
@@ -0,0 +1,71 @@
+import pandas as pd
+import pytest
+
+from transform import calculations, expressions
+from transform.compiler import compile_rules
+
+DERIVE = {
+    "Ano": "year(Data)",
+    "Mes": "month(Data)",
+    "ValorAOA": "Valor * lookup(Moeda, 'cambio', 1)",
+    "Faixa": "iif(Valor * lookup(Moeda, 'cambio', 1) > 10000, 'ALTO', 'NORMAL')",
+    "Prefixo": "ContractNumber[0:2]",
+}
+LOOKUPS = {"cambio": {"USD": 900.0}}
+
+
+@pytest.fixture
+def sample_df():
+    return pd.DataFrame({
+        "Data": ["20250103", "20250215", None],
+        "Valor": pd.array([100, 5, None], dtype="Int8"),
+        "Moeda": ["USD", "AOA", "USD"],
+        "ContractNumber": ["CT1", "XY2", None],
+    })
+
+
+def test_derived_columns(sample_df):
+    out = expressions.DerivedColumns(DERIVE, LOOKUPS).evaluate(sample_df.copy())
+
+    assert out["Ano"].tolist()[:2] == [2025, 2025] and out["Ano"].dtype == pd.Int64Dtype()
+    assert out["Mes"].tolist()[:2] == [1, 2] and pd.isna(out["Mes"].iloc[2])
+    assert out["ValorAOA"].tolist()[:2] == [90000.0, 5.0]  # Int8 promovido antes da multiplicação
+    assert out["Faixa"].tolist() == ["ALTO", "NORMAL", "NORMAL"]
+    assert out["Prefixo"].tolist()[:2] == ["CT", "XY"]
+
+
+def test_common_subexpressions_are_shared():
+    derived = expressions.DerivedColumns(DERIVE, LOOKUPS)
+    # to_date(Data) e Valor * lookup(...) (o lookup interior conta com a expressão que o contém)
+    assert derived.shared == 2
+    assert derived.reads == {"Data", "Valor", "Moeda", "ContractNumber"}
+    assert derived.uses_dates
+
+
+def test_later_expressions_read_derived_columns():
+    df = pd.DataFrame({"A": [1, 2]})
+    out = expressions.DerivedColumns({"A": "A * 10", "B": "A + 1"}).evaluate(df)
+    assert out["B"].tolist() == [11, 21]
+
+
+@pytest.mark.parametrize("text", ["__import__('os')", "A.real", "lambda: 1", "foo(A)", "lookup(A, B)"])
+def test_rejects_unsupported_constructs(text):
+    with pytest.raises(ValueError):
+        expressions.parse(text)
+
+
+def test_missing_lookup_table():
+    with pytest.raises(ValueError, match="cambio"):
+        expressions.DerivedColumns({"X": "lookup(Moeda, 'cambio')"})
+
+
+def test_lazy_plan_matches_eager_with_derive(sample_df):
+    rules = {"generate_id_tempo": True, "derive": DERIVE, "lookups": LOOKUPS,
+             "filter": [["Moeda", "==", "USD"]]}
+    expected = calculations.apply_calculations(sample_df, rules)
+
+    plan = compile_rules({}, rules)
+    pd.testing.assert_frame_equal(plan.collect(sample_df), expected)
+    assert "ID_TEMPO" in expected.columns
+    # derive lê datas em texto: o filtro não passa por cima
+    assert plan.explain(list(sample_df.columns)).splitlines()[-1] == "filter: [['Moeda', '==', 'USD']]"
@@ -0,0 +1,129 @@
+import sqlite3
+
+import pandas as pd
+import pytest
+from load import load_to_dw as dw
+from utils.db_pool import ConnectionPool
+
+
+@pytest.fixture
+def dw_db(tmp_path):
+    # SQLite como substituto do SQL Server (mesma interface DB-API)
+    db_path = str(tmp_path / "dw.db")
+    conn = sqlite3.connect(db_path)
+    conn.execute("CREATE TABLE TMP_AML (ID_TEMPO INTEGER, TransactionID INTEGER PRIMARY KEY, ContractNumber TEXT)")
+    conn.commit()
+    conn.close()
+    return db_path
+
+
+@pytest.fixture
+def dw_pool(dw_db):
+    pool = ConnectionPool("dw_test", lambda: sqlite3.connect(dw_db, check_same_thread=False), max_size=2)
+    yield pool
+    pool.close_all()
+
+
+@pytest.fixture
+def staged_file(tmp_path):
+    df = pd.DataFrame({
+        "ID_TEMPO": [20250925] * 25,
+        "TransactionID": range(1, 26),
+        "ContractNumber": [f"CT{i:05d}" if i % 5 else None for i in range(1, 26)],
+    })
+    path = str(tmp_path / "TMP_AML.parquet")
+    df.to_parquet(path, index=False)
+    return path
+
+
+def count_rows(db_path, table="TMP_AML"):
+    conn = sqlite3.connect(db_path)
+    n = conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+    conn.close()
+    return n
+
+
+def test_load_commits_in_batches(dw_db, dw_pool, staged_file):
+    cfg = {"target_table": "TMP_AML", "load": {"batch_size": 4, "commit_size": 10}}
+    stats = dw.load_to_dw(staged_file, cfg, pool=dw_pool)
+
+    assert stats["rows"] == 25
+    assert stats["batches"] == 7
+    assert stats["commits"] == 3
+    assert stats["rows_per_sec"] > 0
+    assert count_rows(dw_db) == 25
+
+    conn = sqlite3.connect(dw_db)
+    assert conn.execute("SELECT COUNT(*) FROM TMP_AML WHERE ContractNumber IS NULL").fetchone()[0] == 5
+    conn.close()
+
+
+def test_replace_mode_and_column_subset(dw_db, dw_pool, staged_file):
+    cfg = {"target_table": "TMP_AML", "load": {"mode": "replace", "columns": ["TransactionID", "ID_TEMPO"]}}
+    dw.load_to_dw(staged_file, cfg, pool=dw_pool)
+    dw.load_to_dw(staged_file, cfg, pool=dw_pool)
+    assert count_rows(dw_db) == 25
+
+
+def test_upsert_replaces_only_staged_keys(dw_db, tmp_path):
+    conn = sqlite3.connect(dw_db)
+    conn.execute("CREATE TABLE AML_DAILY (ID_TEMPO INTEGER, TransactionID INTEGER, Valor REAL)")
+    conn.executemany("INSERT INTO AML_DAILY VALUES (?, ?, ?)", [(20250924, 3, 30.0), (20250925, 2, 20.0)])
+    conn.commit()
+
+    # Agregação incremental: os totais dos dias tocados vêm completos, não como delta
+    path = str(tmp_path / "AML_DAILY.parquet")
+    pd.DataFrame({"ID_TEMPO": [20250925, 20250926], "TransactionID": [5, 1],
+                  "Valor": [50.0, 10.0]}).to_parquet(path, index=False)
+    for _ in range(2):
+        stats = dw.load_table(conn, path, "AML_DAILY", mode="upsert", keys=["ID_TEMPO"])
+    assert stats["replaced_keys"] == 2
+    assert conn.execute("SELECT * FROM AML_DAILY ORDER BY ID_TEMPO").fetchall() == [
+        (20250924, 3, 30.0), (20250925, 5, 50.0), (20250926, 1, 10.0)
+    ]
+    with pytest.raises(ValueError):
+        dw.load_table(conn, path, "AML_DAILY", mode="upsert")
+    conn.close()
+
+
+def test_failed_load_rolls_back_open_transaction(dw_db, dw_pool, staged_file):
+    cfg = {"target_table": "TMP_AML", "load": {"batch_size": 10, "commit_size": None}}
+    dw.load_to_dw(staged_file, cfg, pool=dw_pool)
+
+    # Segunda carga viola a chave primária: nada da transação fica gravado
+    with pytest.raises(sqlite3.IntegrityError):
+        dw.load_to_dw(staged_file, cfg, pool=dw_pool)
+    assert count_rows(dw_db) == 25
+
+
+def test_load_from_csv_staging(dw_db, dw_pool, tmp_path):
+    path = str(tmp_path / "TMP_AML.csv")
+    pd.DataFrame({"ID_TEMPO": [1, 2], "TransactionID": [1, 2], "ContractNumber": ["A", None]}).to_csv(path, index=False)
+
+    stats = dw.load_to_dw(path, {"target_table": "TMP_AML"}, pool=dw_pool)
+    assert stats["rows"] == 2
+    assert count_rows(dw_db) == 2
+
+
+def test_insert_statement_quotes_identifiers():
+    assert dw.insert_statement("TMP_AML", ["A", "B"]) == "INSERT INTO [TMP_AML] ([A], [B]) VALUES (?, ?)"
+    assert dw.delete_statement("TMP_AML", ["A", "B"]) == "DELETE FROM [TMP_AML] WHERE [A] = ? AND [B] = ?"
+
+
+def test_load_partition_files_restores_partition_column(dw_db, dw_pool, tmp_path, monkeypatch):
+    from load.load_to_staging import load_to_staging
+
+    monkeypatch.chdir(tmp_path)
+    cfg = {"target_table": "TMP_AML", "staging": {"partition_by": ["ID_TEMPO"]}}
+    df = pd.DataFrame({"ID_TEMPO": [20250925, 20250926], "TransactionID": [1, 2], "ContractNumber": ["A", "B"]})
+    load_to_staging(df, cfg, mode="append")
+    files = load_to_staging(df.assign(TransactionID=[3, 4]), cfg, mode="append")
+
+    # Só os ficheiros desta execução são carregados
+    stats = dw.load_to_dw(files, cfg, pool=dw_pool)
+    assert stats["rows"] == 2
+    conn = sqlite3.connect(dw_db)
+    assert conn.execute("SELECT ID_TEMPO, TransactionID FROM TMP_AML ORDER BY 2").fetchall() == [
+        (20250925, 3), (20250926, 4)
+    ]
+    conn.close()
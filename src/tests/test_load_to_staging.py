@@ -0,0 +1,149 @@
+import os
+import time
+
+import pandas as pd
+import pyarrow.parquet as pq
+import pytest
+from load import staging_manifest
+from load.load_to_staging import (STALE_TMP_SECONDS, cleanup_old_versions, latest_staging, load_to_staging,
+                                  read_staging)
+
+
+@pytest.fixture(autouse=True)
+def workdir(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+
+@pytest.fixture
+def aml_df():
+    return pd.DataFrame({
+        "ID_TEMPO": [20250925, 20250925, 20250926, 20250927],
+        "TransactionID": [1, 2, 3, 4],
+        "ContractNumber": ["CT1", "CT2", "CT3", "CT4"],
+    })
+
+
+def partition_files(table_dir):
+    return sorted(
+        os.path.relpath(os.path.join(root, f), table_dir)
+        for root, _, files in os.walk(table_dir) for f in files if f.endswith(".parquet")
+    )
+
+
+def test_monolithic_parquet_honours_write_options(aml_df):
+    cfg = {"target_table": "TMP_AML", "staging": {"compression": "zstd", "row_group_size": 2}}
+    path = load_to_staging(aml_df, cfg)
+
+    metadata = pq.ParquetFile(path).metadata
+    assert metadata.num_row_groups == 2
+    assert metadata.row_group(0).column(0).compression == "ZSTD"
+
+
+def test_partitioned_append_adds_files(aml_df):
+    cfg = {"target_table": "TMP_AML", "staging": {"partition_by": ["ID_TEMPO"]}}
+    written = load_to_staging(aml_df, cfg, mode="append")
+    table_dir = os.path.join("staging", "TMP_AML")
+    assert len(written) == 3
+    assert len(partition_files(table_dir)) == 3
+
+    written = load_to_staging(aml_df[aml_df["ID_TEMPO"] == 20250927], cfg, mode="append")
+    assert len(written) == 1
+    files = partition_files(table_dir)
+    assert len(files) == 4
+    assert sum(f.startswith("ID_TEMPO=20250927") for f in files) == 2
+
+    # Leitura com pruning de partições
+    day = read_staging(cfg, filters=[("ID_TEMPO", "=", 20250925)])
+    assert sorted(day["TransactionID"]) == [1, 2]
+    assert len(read_staging(cfg)) == 5
+
+
+def test_partitioned_replace_overwrites_only_batch_partitions(aml_df):
+    cfg = {"target_table": "TMP_AML", "staging": {"partition_by": "ID_TEMPO"}}
+    load_to_staging(aml_df, cfg)
+    rerun = pd.DataFrame({"ID_TEMPO": [20250926], "TransactionID": [30], "ContractNumber": ["CT30"]})
+    load_to_staging(rerun, cfg)
+
+    staged = read_staging(cfg).sort_values("TransactionID")
+    assert list(staged["TransactionID"]) == [1, 2, 4, 30]
+
+
+def test_replace_keeps_only_latest_version(aml_df):
+    cfg = {"target_table": "TMP_CLIENTES", "staging_format": "csv"}
+    load_to_staging(aml_df, cfg)
+    # Versão antiga gravada antes de existir manifesto
+    aml_df.to_csv(os.path.join("staging", "TMP_CLIENTES", "TMP_CLIENTES_20000101_000000.csv"), index=False)
+    path = load_to_staging(aml_df, cfg)
+    assert sorted(os.listdir(os.path.join("staging", "TMP_CLIENTES"))) == sorted(
+        ["_manifest.json", os.path.basename(path)]
+    )
+
+
+def test_empty_batch_does_not_replace_existing_version(aml_df):
+    cfg = {"target_table": "TMP_AML"}
+    path = load_to_staging(aml_df, cfg)
+    with pytest.raises(ValueError):
+        load_to_staging(aml_df.iloc[0:0], cfg)
+    assert latest_staging(cfg) == [path]
+    assert len(read_staging(cfg)) == len(aml_df)
+
+    # Sem versões anteriores, um lote vazio é gravado normalmente
+    assert os.path.exists(load_to_staging(aml_df.iloc[0:0], {"target_table": "TMP_VAZIO"}))
+
+
+def test_manifest_records_versions_and_latest(aml_df):
+    cfg = {"target_table": "TMP_AML", "incremental_key": "TransactionID"}
+    load_to_staging(aml_df, cfg, mode="append")
+    second = load_to_staging(aml_df.tail(2), cfg, mode="append")
+
+    table_dir = os.path.join("staging", "TMP_AML")
+    manifest = staging_manifest.read_manifest(table_dir)
+    assert [v["rows"] for v in manifest["versions"]] == [4, 2]
+    entry = manifest["versions"][-1]["files"][0]
+    assert entry["min"] == {"TransactionID": 3} and entry["max"] == {"TransactionID": 4}
+    assert entry["checksum"] == staging_manifest.file_checksum(second)
+    assert latest_staging(cfg) == [second]
+
+    # Pruning pelo min/max: só a primeira versão tem TransactionID 1
+    assert staging_manifest.manifest_files(table_dir, [("TransactionID", "=", 1)]) == [
+        os.path.join(table_dir, manifest["versions"][0]["files"][0]["file"])
+    ]
+    assert sorted(read_staging(cfg, filters=[("TransactionID", ">=", 3)])["TransactionID"]) == [3, 3, 4, 4]
+
+    cleanup_old_versions(table_dir, keep_last=1)
+    assert len(staging_manifest.read_manifest(table_dir)["versions"]) == 1
+    assert len(read_staging(cfg)) == 2
+
+
+def test_partition_replace_updates_manifest(aml_df):
+    cfg = {"target_table": "TMP_AML", "staging": {"partition_by": ["ID_TEMPO"], "key_columns": ["ID_TEMPO"]}}
+    load_to_staging(aml_df, cfg)
+    load_to_staging(aml_df[aml_df["ID_TEMPO"] == 20250925], cfg)
+
+    table_dir = os.path.join("staging", "TMP_AML")
+    files = staging_manifest.manifest_files(table_dir)
+    assert len(files) == 3 and all(os.path.exists(f) for f in files)
+    pruned = staging_manifest.manifest_files(table_dir, [("ID_TEMPO", "in", [20250926, 20250927])])
+    assert len(pruned) == 2
+
+
+def test_crash_leftovers_are_invisible(aml_df):
+    cfg = {"target_table": "TMP_AML"}
+    path = load_to_staging(aml_df, cfg)
+    table_dir = os.path.dirname(path)
+
+    # Ficheiro parcial de uma escrita interrompida não é considerado versão
+    leftover = os.path.join(table_dir, ".TMP_AML_20990101_000000.parquet.tmp")
+    with open(leftover, "wb") as f:
+        f.write(b"PAR1")
+    assert latest_staging(cfg) == [path]
+    assert len(read_staging(cfg)) == 4
+
+    # Temporário recente pode ser de uma escrita em curso: fica até ser antigo
+    cleanup_old_versions(table_dir)
+    assert os.path.exists(leftover)
+    stale = time.time() - STALE_TMP_SECONDS - 60
+    os.utime(leftover, (stale, stale))
+    cleanup_old_versions(table_dir)
+    assert not any(f.endswith(".tmp") for f in os.listdir(table_dir))
@@ -0,0 +1,219 @@
+import threading
+
+import pandas as pd
+import pytest
+from pipelines import run_all_sources as pipeline
+from pipelines.dag import CPU, IO, DagScheduler, NoData, Task, timing_report
+from utils.state_store import StateStore
+
+
+def test_dag_passes_results_in_dependency_order():
+    dag = DagScheduler()
+    dag.add(Task("a", lambda: 2))
+    dag.add(Task("b", lambda a: a * 10, deps=["a"], kind=CPU))
+    dag.add(Task("c", lambda a, b: a + b, deps=["a", "b"]))
+
+    results = dag.run()
+    assert results["c"].status == "done"
+    assert results["c"].value == 22
+
+
+def test_dag_runs_independent_tasks_concurrently():
+    barrier = threading.Barrier(2, timeout=5)
+
+    def wait_for_other():
+        barrier.wait()
+        return True
+
+    dag = DagScheduler(io_workers=2)
+    dag.add(Task("src1.extract", wait_for_other, kind=IO))
+    dag.add(Task("src2.extract", wait_for_other, kind=IO))
+
+    results = dag.run()
+    assert all(r.status == "done" for r in results.values())
+
+
+def test_dag_failure_skips_downstream_only():
+    def boom():
+        raise RuntimeError("falhou")
+
+    dag = DagScheduler()
+    dag.add(Task("bad.extract", boom, source="bad", stage="extract"))
+    dag.add(Task("bad.clean", lambda df: df, deps=["bad.extract"], source="bad", stage="clean"))
+    dag.add(Task("good.extract", lambda: pd.DataFrame({"id": [1, 2, 3]}), source="good", stage="extract"))
+
+    results = dag.run()
+    assert results["bad.extract"].status == "failed"
+    assert results["bad.clean"].status == "skipped"
+    assert results["good.extract"].status == "done"
+
+    report = timing_report(results)
+    assert set(report.columns) >= {"source", "stage", "status", "seconds", "rows"}
+    assert report.set_index("stage").loc["extract"].shape[0] == 2
+    assert report[report["source"] == "good"]["rows"].iloc[0] == 3
+
+
+def test_dag_no_data_skips_downstream_without_failing():
+    def nothing():
+        raise NoData("sem ficheiros novos")
+
+    dag = DagScheduler()
+    dag.add(Task("src.extract", nothing, source="src", stage="extract"))
+    dag.add(Task("src.stage", lambda df: df, deps=["src.extract"], source="src", stage="stage"))
+
+    results = dag.run()
+    assert results["src.extract"].status == "empty"
+    assert results["src.extract"].rows == 0
+    assert results["src.stage"].status == "skipped"
+    assert not (timing_report(results)["status"] == "failed").any()
+
+
+def test_dag_rejects_cycles_and_unknown_deps():
+    dag = DagScheduler()
+    dag.add(Task("a", lambda b: b, deps=["b"]))
+    dag.add(Task("b", lambda a: a, deps=["a"]))
+    with pytest.raises(ValueError):
+        dag.run()
+
+    dag = DagScheduler()
+    dag.add(Task("a", lambda x: x, deps=["x"]))
+    with pytest.raises(ValueError):
+        dag.run()
+
+
+def test_source_chain_stages_and_commits_state(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    data_dir = tmp_path / "data"
+    data_dir.mkdir()
+    pd.DataFrame({
+        "id_produto": [1, 2, 2],
+        "nome": ["A", "B", "B"],
+        "preco": [10.0, 20.0, 20.0],
+    }).to_csv(data_dir / "precos.csv", index=False)
+
+    cfg = {
+        "name": "PRECARIO",
+        "type": "csv",
+        "path": str(data_dir),
+        "target_table": "DW_PRECARIOS",
+        "columns": ["id_produto", "nome", "preco"],
+        "cleaning_rules": {"drop_duplicates": ["id_produto"]},
+    }
+    state = StateStore(str(tmp_path / "state.db"))
+    loaded = []
+
+    dag = DagScheduler(io_workers=2, cpu_workers=1)
+    tasks = pipeline.add_source_tasks(dag, "PRECARIO", cfg, state=state,
+                                      loader=lambda path, c: loaded.append(path) or 2)
+    assert [t.stage for t in tasks] == ["extract", "clean", "calculate", "stage", "load"]
+    assert [t.kind for t in tasks] == [IO, CPU, CPU, IO, IO]
+
+    results = dag.run()
+    assert all(r.status == "done" for r in results.values())
+    staged = pd.read_parquet(loaded[0])
+    assert len(staged) == 2
+    assert results["PRECARIO.clean"].rows == 2
+
+    # O ficheiro ficou registado como ingerido só depois do staging
+    assert state.pending_files("PRECARIO", [str(data_dir / "precos.csv")]) == []
+    state.close()
+
+
+def test_rerun_without_new_files_keeps_staging(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    data_dir = tmp_path / "data"
+    data_dir.mkdir()
+    pd.DataFrame({"id_produto": [1, 2], "preco": [10.0, 20.0]}).to_csv(data_dir / "precos.csv", index=False)
+    cfg = {
+        "name": "PRECARIO",
+        "type": "csv",
+        "path": str(data_dir),
+        "target_table": "DW_PRECARIOS",
+        "columns": ["id_produto", "preco"],
+    }
+    state = StateStore(str(tmp_path / "state.db"))
+
+    def run():
+        loaded = []
+        dag = DagScheduler(io_workers=2, cpu_workers=1)
+        pipeline.add_source_tasks(dag, "PRECARIO", cfg, state=state,
+                                  loader=lambda path, c: loaded.append(path) or 2)
+        return dag.run(), loaded
+
+    _, loaded = run()
+    staged = pd.read_parquet(loaded[0])
+
+    # Segunda execução: o CSV já foi ingerido, nada a gravar nem a carregar
+    results, loaded_again = run()
+    assert results["PRECARIO.extract"].status == "empty"
+    assert [results[f"PRECARIO.{s}"].status for s in ("clean", "calculate", "stage", "load")] == ["skipped"] * 4
+    assert loaded_again == []
+    pd.testing.assert_frame_equal(pd.read_parquet(loaded[0]), staged)
+    assert state.pending_files("PRECARIO", [str(data_dir / "precos.csv")]) == []
+    state.close()
+
+
+def test_failed_load_keeps_state_uncommitted(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    data_dir = tmp_path / "data"
+    data_dir.mkdir()
+    pd.DataFrame({"id_produto": [1, 2], "preco": [10.0, 20.0]}).to_csv(data_dir / "precos.csv", index=False)
+    cfg = {
+        "name": "PRECARIO",
+        "type": "csv",
+        "path": str(data_dir),
+        "target_table": "DW_PRECARIOS",
+        "columns": ["id_produto", "preco"],
+    }
+    state = StateStore(str(tmp_path / "state.db"))
+    csv_file = [str(data_dir / "precos.csv")]
+
+    def broken_loader(path, c):
+        raise RuntimeError("DW indisponível")
+
+    dag = DagScheduler(io_workers=2, cpu_workers=1)
+    pipeline.add_source_tasks(dag, "PRECARIO", cfg, state=state, loader=broken_loader)
+    results = dag.run()
+    assert results["PRECARIO.stage"].status == "done"
+    assert results["PRECARIO.load"].status == "failed"
+    # O ficheiro não fica como ingerido: a execução seguinte volta a carregá-lo
+    assert state.pending_files("PRECARIO", csv_file) == csv_file
+
+    loaded = []
+    dag = DagScheduler(io_workers=2, cpu_workers=1)
+    pipeline.add_source_tasks(dag, "PRECARIO", cfg, state=state, loader=lambda path, c: loaded.append(path))
+    assert dag.run()["PRECARIO.load"].status == "done"
+    assert len(pd.read_parquet(loaded[0])) == 2
+    assert state.pending_files("PRECARIO", csv_file) == []
+    state.close()
+
+
+def test_stage_commits_state_for_batch_emptied_by_rules(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    cfg = {"name": "PRECARIO", "target_table": "DW_PRECARIOS"}
+    committed = []
+
+    class Pending:
+        def commit(self):
+            committed.append(True)
+
+        def rollback(self):
+            raise AssertionError("rollback inesperado")
+
+    with pytest.raises(NoData):
+        pipeline.stage_source(pd.DataFrame({"id": []}), cfg, pending=[Pending()])
+    assert committed == [True]
+    assert not (tmp_path / "staging").exists()
+
+
+def test_build_pipeline_skips_unsupported_sources(monkeypatch):
+    configs = {
+        "DRR": {"name": "DRR", "type": "ftp"},
+        "PRECARIO": {"name": "PRECARIO", "type": "csv", "path": "data/"},
+    }
+    monkeypatch.setattr(pipeline, "load_config", lambda name: configs[name])
+
+    dag = pipeline.build_pipeline(["DRR", "PRECARIO"])
+    assert sorted(dag.tasks) == [
+        "PRECARIO.calculate", "PRECARIO.clean", "PRECARIO.extract", "PRECARIO.stage"
+    ]
@@ -0,0 +1,79 @@
+import sqlite3
+from datetime import datetime
+
+import pandas as pd
+import pytest
+from model import scd2
+
+
+@pytest.fixture
+def dimension():
+    return pd.DataFrame({
+        "SK_Cliente": [1, 2, 3, 4],
+        "ContractPrefix": ["CT001", "CT002", "CT003", "CT002"],
+        "ContractNumber": ["CT00100", "CT00200", None, "CT00299"],
+        "ValidFrom": pd.to_datetime(["2025-01-01"] * 4),
+        "ValidTo": [scd2.OPEN_VALID_TO, pd.Timestamp("2025-06-01"), scd2.OPEN_VALID_TO, scd2.OPEN_VALID_TO],
+        "IsCurrent": [True, False, True, True],
+    })
+
+
+def test_scd2_merge_classifies_rows(dimension):
+    incoming = pd.DataFrame({
+        "ContractPrefix": ["CT001", "CT002", "CT003", "CT004"],
+        "ContractNumber": ["CT00100", "CT00250", None, "CT00400"],
+    })
+    changes = scd2.scd2_merge(dimension, incoming, ["ContractPrefix"], ["ContractNumber"],
+                              "SK_Cliente", as_of=datetime(2025, 10, 1))
+
+    assert changes.stats == {"inserted": 1, "changed": 1, "unchanged": 2}
+    assert list(changes.expired_keys) == [4]
+    assert sorted(changes.new_rows["ContractPrefix"]) == ["CT002", "CT004"]
+    assert changes.new_rows["IsCurrent"].all()
+    assert (changes.new_rows["ValidTo"] == scd2.OPEN_VALID_TO).all()
+
+    merged = scd2.apply_to_frame(dimension, changes, "SK_Cliente")
+    current = merged[merged["IsCurrent"].astype(bool)]
+    assert current["ContractPrefix"].is_unique
+    assert len(current) == 4
+    assert merged.loc[merged["SK_Cliente"] == 4, "ValidTo"].iloc[0] == pd.Timestamp("2025-10-01")
+    assert list(merged["SK_Cliente"].tail(2)) == [5, 6]
+
+
+def test_scd2_merge_is_idempotent(dimension):
+    incoming = pd.DataFrame({"ContractPrefix": ["CT001", "CT002"], "ContractNumber": ["CT00100", "CT00250"]})
+    first = scd2.scd2_merge(dimension, incoming, ["ContractPrefix"], ["ContractNumber"], "SK_Cliente")
+    merged = scd2.apply_to_frame(dimension, first, "SK_Cliente")
+
+    second = scd2.scd2_merge(merged, incoming, ["ContractPrefix"], ["ContractNumber"], "SK_Cliente")
+    assert second.stats == {"inserted": 0, "changed": 0, "unchanged": 2}
+    assert second.new_rows.empty
+
+
+def test_scd2_merge_rejects_duplicate_current_keys(dimension):
+    dimension.loc[1, "IsCurrent"] = True
+    incoming = pd.DataFrame({"ContractPrefix": ["CT002"], "ContractNumber": ["X"]})
+    with pytest.raises(ValueError):
+        scd2.scd2_merge(dimension, incoming, ["ContractPrefix"], ["ContractNumber"], "SK_Cliente")
+
+
+def test_merge_dimension_on_database(tmp_path):
+    conn = sqlite3.connect(str(tmp_path / "dw.db"))
+    conn.execute(
+        "CREATE TABLE Dim_Cliente (SK_Cliente INTEGER PRIMARY KEY AUTOINCREMENT, "
+        "ContractPrefix TEXT, ContractNumber TEXT, ValidFrom TIMESTAMP, ValidTo TIMESTAMP, IsCurrent INTEGER)"
+    )
+    dim_info = {"keys": ["ContractPrefix"], "attributes": {"ContractNumber": "NVARCHAR(50)"}, "scd_type": 2}
+
+    batch = pd.DataFrame({"ContractPrefix": ["CT001", "CT002"], "ContractNumber": ["A", "B"]})
+    assert scd2.merge_dimension(conn, "Cliente", dim_info, batch)["inserted"] == 2
+
+    batch = pd.DataFrame({"ContractPrefix": ["CT001", "CT002", "CT003"], "ContractNumber": ["A", "B2", "C"]})
+    stats = scd2.merge_dimension(conn, "Cliente", dim_info, batch)
+    assert stats == {"inserted": 1, "changed": 1, "unchanged": 1}
+
+    rows = conn.execute(
+        "SELECT ContractPrefix, ContractNumber, IsCurrent FROM Dim_Cliente ORDER BY SK_Cliente"
+    ).fetchall()
+    assert rows == [("CT001", "A", 1), ("CT002", "B", 0), ("CT002", "B2", 1), ("CT003", "C", 1)]
+    conn.close()
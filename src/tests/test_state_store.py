@@ -0,0 +1,50 @@
+import pytest
+from utils.state_store import StateStore, state_key
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = StateStore(str(tmp_path / "state" / "etl_state.db"))
+    yield store
+    store.close()
+
+
+def test_watermark_only_advances_on_commit(store, tmp_path):
+    assert store.get_watermark("SAS_AML") is None
+
+    store.stage_watermark("SAS_AML", "ID_TEMPO", 20250925)
+    store.stage_watermark("SAS_AML", "ID_TEMPO", 20250924)
+    assert store.get_watermark("SAS_AML") is None
+
+    store.commit("SAS_AML")
+    assert store.get_watermark("SAS_AML") == 20250925
+
+    # Estado persiste entre execuções
+    reopened = StateStore(store.path)
+    assert reopened.get_watermark("SAS_AML") == 20250925
+    reopened.close()
+
+
+def test_rollback_discards_pending(store):
+    store.stage_watermark("SAS_AML", "ID_TEMPO", 20250930)
+    store.rollback("SAS_AML")
+    store.commit("SAS_AML")
+    assert store.get_watermark("SAS_AML") is None
+
+
+def test_ingested_files_tracking(store, tmp_path):
+    file = tmp_path / "produtos.csv"
+    file.write_text("id\n1\n")
+    assert store.pending_files("PRECARIO", [str(file)]) == [str(file)]
+
+    store.stage_files("PRECARIO", [str(file)])
+    store.commit("PRECARIO")
+    assert store.is_ingested("PRECARIO", str(file))
+
+    file.write_text("id\n1\n2\n")
+    assert not store.is_ingested("PRECARIO", str(file))
+
+
+def test_state_key():
+    assert state_key({"name": "SAS_AML", "target_table": "TMP_AML"}) == "SAS_AML"
+    assert state_key({"target_table": "TMP_AML"}) == "TMP_AML"
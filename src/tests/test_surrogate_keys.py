@@ -0,0 +1,89 @@
+import sqlite3
+
+import numpy as np
+import pandas as pd
+import pytest
+from model import surrogate_keys as sk
+
+
+@pytest.fixture
+def dw_conn(tmp_path):
+    conn = sqlite3.connect(str(tmp_path / "dw.db"))
+    conn.execute(
+        "CREATE TABLE Dim_Cliente (SK_Cliente INTEGER PRIMARY KEY AUTOINCREMENT, ContractPrefix TEXT, "
+        "ContractNumber TEXT, ValidFrom TIMESTAMP, ValidTo TIMESTAMP, IsCurrent INTEGER)"
+    )
+    conn.execute("CREATE TABLE Dim_Tempo (SK_Tempo INTEGER PRIMARY KEY AUTOINCREMENT, ID_TEMPO TEXT)")
+    conn.executemany(
+        "INSERT INTO Dim_Cliente (ContractPrefix, ContractNumber, IsCurrent) VALUES (?, ?, ?)",
+        [("CT001", "A", 1), ("CT002", "B", 0), ("CT002", "B2", 1)]
+    )
+    conn.executemany("INSERT INTO Dim_Tempo (ID_TEMPO) VALUES (?)", [("20250925",), ("20250926",)])
+    conn.commit()
+    yield conn
+    conn.close()
+
+
+@pytest.fixture
+def model():
+    return {
+        "dimensions": {
+            "Tempo": {"keys": ["ID_TEMPO"], "scd_type": 1},
+            "Cliente": {"keys": ["ContractPrefix"], "scd_type": 2},
+        }
+    }
+
+
+def test_index_resolves_latest_version():
+    index = sk.SurrogateKeyIndex("Dim_Cliente", ["ContractPrefix"], "SK_Cliente")
+    index.update(pd.DataFrame({"ContractPrefix": ["CT001", "CT002"], "SK_Cliente": [1, 2]}))
+    index.update(pd.DataFrame({"ContractPrefix": ["CT002"], "SK_Cliente": [3]}))
+
+    facts = pd.DataFrame({"ContractPrefix": ["CT002", "CT001", "CT999", "CT002"]})
+    assert list(index.resolve(facts)) == [3, 1, sk.MISSING_SK, 3]
+    assert len(index) == 2
+    assert index.hashes.dtype == np.uint64
+
+
+def test_index_matches_numeric_keys_stored_as_float_or_text():
+    index = sk.SurrogateKeyIndex("Dim_Tempo", ["ID_TEMPO"], "SK_Tempo")
+    index.update(pd.DataFrame({"ID_TEMPO": ["20240101", "20240102"], "SK_Tempo": [1, 2]}))
+
+    # Coluna com nulos lida como float: 20240101.0 é a mesma chave que "20240101"
+    facts = pd.DataFrame({"ID_TEMPO": [20240101.0, None, 20240102.0, 20240101.5]})
+    assert list(index.resolve(facts)) == [1, sk.MISSING_SK, 2, sk.MISSING_SK]
+    assert list(index.resolve(pd.DataFrame({"ID_TEMPO": [20240102, 20240101]}))) == [2, 1]
+
+
+def test_resolve_surrogate_keys_infers_late_members(dw_conn, model, tmp_path):
+    facts = pd.DataFrame({
+        "ID_TEMPO": [20250925, 20250926, 20250925],
+        "ContractPrefix": ["CT002", "CT003", "CT001"],
+        "Valor": [10.0, 20.0, 30.0],
+    })
+    result = sk.resolve_surrogate_keys(dw_conn, facts, model, cache_dir=str(tmp_path / "cache"))
+
+    assert list(result["SK_Tempo"]) == [1, 2, 1]
+    assert list(result["SK_Cliente"]) == [3, 4, 1]
+    inferred = dw_conn.execute(
+        "SELECT ContractNumber, IsCurrent FROM Dim_Cliente WHERE ContractPrefix = 'CT003'"
+    ).fetchall()
+    assert inferred == [(None, 1)]
+
+
+def test_index_cache_only_reads_new_members(dw_conn, tmp_path):
+    cache_dir = str(tmp_path / "cache")
+    index = sk.load_index(dw_conn, "Dim_Cliente", ["ContractPrefix"], "SK_Cliente", cache_dir=cache_dir)
+    index.save(cache_dir)
+
+    dw_conn.execute("INSERT INTO Dim_Cliente (ContractPrefix, IsCurrent) VALUES ('CT010', 1)")
+    dw_conn.commit()
+
+    reloaded = sk.SurrogateKeyIndex("Dim_Cliente", ["ContractPrefix"], "SK_Cliente")
+    assert reloaded.load(cache_dir)
+    assert reloaded.refresh(dw_conn) == 1
+    assert list(reloaded.resolve(pd.DataFrame({"ContractPrefix": ["CT010", "CT002"]}))) == [4, 3]
+
+    # Chaves diferentes invalidam o cache
+    other = sk.SurrogateKeyIndex("Dim_Cliente", ["ContractNumber"], "SK_Cliente")
+    assert not other.load(cache_dir)
@@ -0,0 +1,268 @@
+"""
+Agregação incremental com estados parciais combináveis.
+
+Em vez de um groupby sobre todos os dados, cada grupo guarda um estado parcial
+que se combina com o de outros lotes ou dias:
+
+    sum → soma | count → contagem | min/max → min/max | mean → soma + contagem
+    nunique → HyperLogLog (aproximado, ~1.6% de erro com a precisão por defeito)
+
+O estado é persistido em disco (Parquet + registos HLL em .npz), pelo que os
+totais diários por ID_TEMPO podem ser atualizados só com o lote novo. Tal como o
+índice de deduplicação, o estado de uma execução só é gravado com commit().
+"""
+import json
+import os
+import threading
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+import pandas as pd
+from loguru import logger
+
+from transform.dedup import key_digests
+
+SUPPORTED_FUNCS = ("sum", "count", "min", "max", "mean", "nunique")
+DEFAULT_STATE_DIR = os.path.join("data/staging", ".agg_state")
+DEFAULT_PRECISION = 12     # 2^12 registos HLL (4 KiB) por grupo e coluna
+ROWS = "__rows"
+
+# Como combinar cada estado parcial
+_MERGE = {"sum": "sum", "count": "sum", "min": "min", "max": "max", "size": "sum"}
+
+
+# ---------------------------------------------------------------------------
+# HyperLogLog
+# ---------------------------------------------------------------------------
+
+def _bit_length(values: np.ndarray) -> np.ndarray:
+    """Número de bits de cada uint64 (exato, sem passar por float)."""
+    x = values.copy()
+    n = np.zeros(len(x), dtype=np.int64)
+    for shift in (32, 16, 8, 4, 2, 1):
+        big = x >= np.uint64(1 << shift)
+        n[big] += shift
+        x[big] >>= np.uint64(shift)
+    return n + (x > 0)
+
+
+def hll_observations(hashes: np.ndarray, precision: int = DEFAULT_PRECISION):
+    """Registo (primeiros `precision` bits) e rank (zeros à esquerda + 1) de cada hash."""
+    p = np.uint64(precision)
+    registers = (hashes >> (np.uint64(64) - p)).astype(np.int64)
+    rest = (hashes << p) | np.uint64(1 << (precision - 1))  # sentinela: rank <= 64 - p + 1
+    ranks = (65 - _bit_length(rest)).astype(np.uint8)
+    return registers, ranks
+
+
+def hll_estimate(registers: np.ndarray, precision: int = DEFAULT_PRECISION) -> np.ndarray:
+    """Estimativa de cardinalidade por linha de uma matriz de registos (grupos × 2^p)."""
+    m = 1 << precision
+    alpha = 0.7213 / (1 + 1.079 / m)
+    raw = alpha * m * m / np.exp2(-registers.astype(np.float64)).sum(axis=1)
+    zeros = (registers == 0).sum(axis=1)
+    # Contagem linear para cardinalidades pequenas
+    small = (raw <= 2.5 * m) & (zeros > 0)
+    linear = m * np.log(m / np.maximum(zeros, 1))
+    return np.where(small, linear, raw)
+
+
+# ---------------------------------------------------------------------------
+# Estado incremental
+# ---------------------------------------------------------------------------
+
+class IncrementalAggregate:
+    """
+    Agregação por `group_by` com estados parciais, ex:
+
+        agg = IncrementalAggregate(["ID_TEMPO"], {"TransactionID": "count", "Valor": "sum"},
+                                   name="aml_daily")
+        agg.load()                         # estado de execuções anteriores
+        for chunk in chunks:
+            agg.update(chunk)              # devolve os grupos tocados, já combinados
+        agg.commit()                       # grava o estado
+        totals = agg.result()              # igual a groupby(group_by).agg(...).reset_index()
+    """
+
+    def __init__(self, group_by: List[str], agg_rules: Dict[str, str], name: Optional[str] = None,
+                 state_dir: str = DEFAULT_STATE_DIR, precision: int = DEFAULT_PRECISION):
+        unsupported = {f for f in agg_rules.values() if f not in SUPPORTED_FUNCS}
+        if unsupported:
+            raise ValueError(f"Funções de agregação não suportadas em modo incremental: {unsupported}")
+        self.group_by = list(group_by)
+        self.agg_rules = dict(agg_rules)
+        self.name = name or "_".join(self.group_by)
+        self.state_dir = state_dir
+        self.precision = precision
+
+        self.specs = {ROWS: (self.group_by[0], "size")}
+        for col, func in self.agg_rules.items():
+            if func in ("sum", "mean"):
+                self.specs[f"{col}__sum"] = (col, "sum")
+            if func in ("count", "mean"):
+                self.specs[f"{col}__count"] = (col, "count")
+            if func in ("min", "max"):
+                self.specs[f"{col}__{func}"] = (col, func)
+        self.distinct = [col for col, func in self.agg_rules.items() if func == "nunique"]
+
+        self.state: Optional[pd.DataFrame] = None
+        self.registers: Dict[str, np.ndarray] = {}
+        self._committed = (None, {})
+        self._lock = threading.Lock()
+
+    # ---------------- Estados parciais ----------------
+    def _group_index(self, df: pd.DataFrame) -> pd.Index:
+        if len(self.group_by) == 1:
+            return pd.Index(df[self.group_by[0]], name=self.group_by[0])
+        return pd.MultiIndex.from_frame(df[self.group_by])
+
+    def partial(self, df: pd.DataFrame) -> pd.DataFrame:
+        """Estado parcial de um lote (uma linha por grupo)."""
+        return df.groupby(self.group_by).agg(**self.specs)
+
+    def _merge_state(self, partial: pd.DataFrame, replace: bool) -> pd.DataFrame:
+        if self.state is None:
+            return partial
+        current = self.state
+        if replace:
+            current = current.loc[~current.index.isin(partial.index)]
+        merged = pd.concat([current, partial])
+        funcs = {col: _MERGE[func] for col, (_, func) in self.specs.items()}
+        return merged.groupby(level=list(range(merged.index.nlevels))).agg(funcs)
+
+    def _align_registers(self, new_index: pd.Index, replaced: Optional[pd.Index]):
+        m = 1 << self.precision
+        for col in self.distinct:
+            registers = np.zeros((len(new_index), m), dtype=np.uint8)
+            old = self.registers.get(col)
+            if old is not None and self.state is not None:
+                keep = np.ones(len(self.state), dtype=bool)
+                if replaced is not None:
+                    keep = ~self.state.index.isin(replaced)
+                pos = new_index.get_indexer(self.state.index[keep])
+                registers[pos] = old[keep]
+            self.registers[col] = registers
+
+    def _observe(self, df: pd.DataFrame, index: pd.Index):
+        """Junta aos registos HLL os valores distintos do lote."""
+        m = 1 << self.precision
+        rows = index.get_indexer(self._group_index(df))
+        for col in self.distinct:
+            valid = (rows >= 0) & df[col].notna().to_numpy()
+            if not valid.any():
+                continue
+            hashes = key_digests(df.loc[valid, [col]])
+            registers, ranks = hll_observations(hashes, self.precision)
+            cells = rows[valid] * m + registers
+            best = pd.Series(ranks).groupby(cells).max()
+            flat = self.registers[col].reshape(-1)
+            flat[best.index] = np.maximum(flat[best.index], best.to_numpy())
+
+    def update(self, df: pd.DataFrame, mode: str = "merge") -> pd.DataFrame:
+        """
+        Junta um lote ao estado e devolve o resultado dos grupos tocados pelo lote.
+        mode="replace" substitui o estado desses grupos (ex: dia reprocessado por inteiro).
+        """
+        if mode not in ("merge", "replace"):
+            raise ValueError(f"Modo desconhecido: {mode}")
+        partial = self.partial(df)
+        with self._lock:
+            replaced = partial.index if mode == "replace" else None
+            state = self._merge_state(partial, replace=mode == "replace")
+            self._align_registers(state.index, replaced)
+            self.state = state
+            self._observe(df, state.index)
+        logger.info(f"Agregação incremental '{self.name}': {len(df)} linhas em {len(partial)} grupo(s) "
+                    f"({len(self.state)} no estado)")
+        return self.result(groups=partial.index)
+
+    def result(self, groups: Optional[pd.Index] = None) -> pd.DataFrame:
+        """
+        Valores finais (todos os grupos ou só `groups`), no formato de groupby().agg().reset_index().
+        Os valores são acumulados: incluem os lotes e execuções anteriores guardados no estado.
+        """
+        with self._lock:
+            state, registers = self.state, dict(self.registers)
+        if state is None:
+            return pd.DataFrame(columns=self.group_by + list(self.agg_rules))
+        positions = np.arange(len(state)) if groups is None else state.index.get_indexer(groups)
+        state = state.iloc[positions]
+
+        out = pd.DataFrame(index=state.index)
+        for col, func in self.agg_rules.items():
+            if func == "sum":
+                out[col] = state[f"{col}__sum"]
+            elif func == "count":
+                out[col] = state[f"{col}__count"].astype("int64")
+            elif func in ("min", "max"):
+                out[col] = state[f"{col}__{func}"]
+            elif func == "mean":
+                count = state[f"{col}__count"]
+                out[col] = state[f"{col}__sum"] / count.where(count > 0)
+            else:
+                estimate = hll_estimate(registers[col][positions], self.precision)
+                out[col] = np.rint(estimate).astype("int64")
+        return out.reset_index()
+
+    # ---------------- Persistência ----------------
+    @property
+    def paths(self):
+        base = os.path.join(self.state_dir, self.name)
+        return f"{base}.parquet", f"{base}.npz"
+
+    def _meta(self) -> str:
+        return json.dumps({"group_by": self.group_by, "agg": self.agg_rules, "precision": self.precision},
+                          sort_keys=True)
+
+    def save(self):
+        """Grava o estado atual (rename atómico do Parquet e dos registos HLL)."""
+        if self.state is None:
+            return
+        os.makedirs(self.state_dir, exist_ok=True)
+        state_path, registers_path = self.paths
+        tmp_state, tmp_registers = f"{state_path}.tmp", f"{registers_path}.tmp.npz"
+        self.state.reset_index().to_parquet(tmp_state, index=False)
+        np.savez(tmp_registers, meta=np.array(self._meta()), **self.registers)
+        os.replace(tmp_registers, registers_path)
+        os.replace(tmp_state, state_path)
+
+    def load(self) -> bool:
+        """Carrega o estado persistido; ignora-o se a configuração da agregação mudou."""
+        state_path, registers_path = self.paths
+        if not (os.path.exists(state_path) and os.path.exists(registers_path)):
+            return False
+        try:
+            with np.load(registers_path) as data:
+                if str(data["meta"]) != self._meta():
+                    logger.warning(f"Estado de agregação '{self.name}' ignorado (configuração diferente).")
+                    return False
+                registers = {col: data[col] for col in self.distinct}
+            state = pd.read_parquet(state_path).set_index(self.group_by)
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning(f"Estado de agregação '{self.name}' ignorado: {e}")
+            return False
+        self.state, self.registers = state, registers
+        self._committed = (state, dict(registers))
+        logger.info(f"Estado de agregação '{self.name}' carregado: {len(state)} grupo(s)")
+        return True
+
+    def commit(self):
+        with self._lock:
+            self.save()
+            self._committed = (self.state, dict(self.registers))
+
+    def rollback(self):
+        """Volta ao último estado gravado (descarta os lotes desde o último commit)."""
+        with self._lock:
+            self.state, registers = self._committed
+            self.registers = dict(registers)
+
+
+def aggregate_stream(chunks: Iterable[pd.DataFrame], group_by: List[str], agg_rules: Dict[str, str],
+                     aggregate: Optional[IncrementalAggregate] = None) -> pd.DataFrame:
+    """Agrega um fluxo de lotes (ex: iter_csv_chunks) sem os juntar em memória."""
+    aggregate = aggregate or IncrementalAggregate(group_by, agg_rules)
+    for chunk in chunks:
+        if not chunk.empty:
+            aggregate.update(chunk)
+    return aggregate.result()
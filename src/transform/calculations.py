@@ -1,20 +1,37 @@
 import pandas as pd
-from datetime import datetime, timedelta
+from datetime import timedelta
 from loguru import logger
 
+from model.calendar import get_calendar, local_now
+from transform.aggregation import IncrementalAggregate
+from transform.cleaning import filter_rows
+from transform.expressions import compile_derive
+from transform.plan import RulePlan
 
-def add_id_tempo(df, offset_days=1, fixed_date=None):
-    base_date = fixed_date or datetime.now()
+
+def add_id_tempo(df, offset_days=1, fixed_date=None, date_col=None):
+    """
+    ID_TEMPO (YYYYMMDD) da data de carga (hoje - offset_days, no fuso de general.yaml) ou,
+    com `date_col`, da data de cada linha via o calendário em cache.
+    """
+    if date_col:
+        if date_col in df.columns:
+            df["ID_TEMPO"] = get_calendar().id_tempo(df[date_col])
+            return df
+        logger.warning(f"Coluna '{date_col}' não encontrada — ID_TEMPO pela data de carga.")
+    base_date = fixed_date or local_now()
     load_date = (base_date - timedelta(days=offset_days)).strftime("%Y%m%d")
     df["ID_TEMPO"] = int(load_date)
     return df
 
 
-def substring_column(df: pd.DataFrame, col: str, start: int, end: int, new_col: str = None) -> pd.DataFrame:
+def substring_column(df: pd.DataFrame, col: str, start: int, end: int, new_col: str = None,
+                     inplace: bool = False) -> pd.DataFrame:
     """
     Cria uma nova coluna com substring de outra.
     """
-    df = df.copy()
+    if not inplace:
+        df = df.copy()
     if col not in df.columns:
         logger.warning(f"Coluna '{col}' não encontrada — substring ignorada.")
         return df
@@ -25,46 +42,102 @@ def substring_column(df: pd.DataFrame, col: str, start: int, end: int, new_col:
     return df
 
 
-def aggregate_values(df: pd.DataFrame, group_by: list, agg_rules: dict) -> pd.DataFrame:
+def aggregate_values(df: pd.DataFrame, group_by: list, agg_rules: dict,
+                     inplace: bool = False) -> pd.DataFrame:
     """
     Executa agregações com base em colunas e funções especificadas.
     Exemplo de agg_rules: { "Valor": "sum", "ContaOrigem": "nunique" }
+    O groupby não altera o input, por isso só é copiado se a agregação for ignorada.
     """
-    df = df.copy()
     if not set(group_by).issubset(df.columns):
         missing = [c for c in group_by if c not in df.columns]
         logger.warning(f"Colunas de agrupamento não encontradas: {missing}")
-        return df
+        return df if inplace else df.copy()
 
     grouped = df.groupby(group_by).agg(agg_rules).reset_index()
     logger.info(f"Agregação executada por {group_by} com regras {agg_rules}.")
     return grouped
 
 
-def apply_calculations(df: pd.DataFrame, rules: dict) -> pd.DataFrame:
+def wants_id_tempo(rules: dict) -> bool:
+    """"generate_id_tempo" (usado em sources.json) é sinónimo de "add_id_tempo"."""
+    return bool(rules.get("add_id_tempo") or rules.get("generate_id_tempo"))
+
+
+def incremental_aggregate(agg: dict) -> IncrementalAggregate:
     """
-    Orquestrador de cálculos derivados baseado em configuração JSON.
+    Agregação incremental de uma entrada de "aggregations", com o estado já carregado, ex:
+        {"group_by": ["ID_TEMPO"], "agg": {"Valor": "sum"}, "incremental": true,
+         "state": "aml_daily", "mode": "merge"}
+
+    Ao contrário da agregação normal, o resultado de cada grupo tocado pelo lote é o
+    total acumulado no estado (execuções anteriores + lote), não só o do lote; com
+    "mode": "replace" o lote substitui o estado desses grupos. Por isso só é usada
+    com "incremental": true, e a carga deve substituir as linhas do grupo (upsert).
+    """
+    aggregate = IncrementalAggregate(agg["group_by"], agg["agg"], name=agg.get("state"))
+    aggregate.load()
+    return aggregate
+
+
+def compile_calculations(rules: dict) -> RulePlan:
+    """
+    Compila as regras de cálculo num plano que altera um único DataFrame
+    (pela mesma ordem de apply_calculations). O estado das agregações incrementais
+    fica em `plan.pending`: o chamador faz commit() depois do staging/carga.
     """
-    df_result = df.copy()
+    steps, pending = [], []
     if not rules:
-        logger.info("⚙ Nenhuma regra de cálculo definida. Retornando DataFrame original.")
-        return df_result
+        return RulePlan(steps)
 
-    logger.info(f"Aplicando regras de cálculo: {rules}")
+    if wants_id_tempo(rules):
+        steps.append(("add_id_tempo",
+                      lambda df: add_id_tempo(df, offset_days=rules.get("offset_days", 1),
+                                              date_col=rules.get("id_tempo_from"))))
+
+    for s in rules.get("substring", []):
+        steps.append((f"substring:{s.get('new_col') or s['col']}",
+                      lambda df, s=s: substring_column(df, **s, inplace=True)))
+
+    derived = compile_derive(rules)
+    if derived is not None:
+        steps.append(("derive", derived.evaluate))
+
+    if "filter" in rules:
+        steps.append(("filter", lambda df: filter_rows(df, rules["filter"])))
+
+    for agg in rules.get("aggregations", []):
+        if agg.get("incremental"):
+            # O estado só é gravado com commit() (ver RulePlan.pending)
+            aggregate = incremental_aggregate(agg)
+            pending.append(aggregate)
+            steps.append((f"aggregate:{agg['group_by']}",
+                          lambda df, agg=agg, aggregate=aggregate: aggregate.update(
+                              df, mode=agg.get("mode", "merge"))))
+            continue
+        steps.append((f"aggregate:{agg['group_by']}",
+                      lambda df, agg=agg: aggregate_values(
+                          df, group_by=agg["group_by"], agg_rules=agg["agg"], inplace=True)))
 
-    if rules.get("add_id_tempo", False):
-        df_result = add_id_tempo(df_result, offset_days=rules.get("offset_days", 1))
+    return RulePlan(steps, pending)
 
-    if "substring" in rules:
-        for s in rules["substring"]:
-            df_result = substring_column(df_result, **s)
 
-    if "aggregations" in rules:
-        for agg in rules["aggregations"]:
-            df_result = aggregate_values(
-                df_result,
-                group_by=agg["group_by"],
-                agg_rules=agg["agg"]
-            )
+def apply_calculations(df: pd.DataFrame, rules: dict, copy: bool = True,
+                       pending: list = None) -> pd.DataFrame:
+    """
+    Orquestrador de cálculos derivados baseado em configuração JSON.
+    Faz uma única cópia do input (nenhuma com copy=False, se o chamador ceder o DataFrame).
+    pending: lista onde são acrescentados os estados das agregações incrementais,
+    para o chamador confirmar (commit) depois do staging; sem ela nada é gravado.
+    As agregações com "incremental": true devolvem totais acumulados entre execuções
+    (ver incremental_aggregate).
+    """
+    if not rules:
+        logger.info("⚙ Nenhuma regra de cálculo definida. Retornando DataFrame original.")
+        return df.copy() if copy else df
 
-    return df_result
+    logger.info(f"Aplicando regras de cálculo: {rules}")
+    plan = compile_calculations(rules)
+    if pending is not None:
+        pending.extend(plan.pending)
+    return plan.run(df, copy=copy)
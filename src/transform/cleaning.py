@@ -3,56 +3,150 @@ import numpy as np
 from datetime import datetime
 from loguru import logger
 
+from transform import dates, dedup, dtypes
+from transform.plan import RulePlan
 
-def normalize_dates(df: pd.DataFrame, date_cols: list) -> pd.DataFrame:
+
+def normalize_dates(df: pd.DataFrame, date_cols, inplace: bool = False,
+                    date_format: str = None) -> pd.DataFrame:
     """
     Converte colunas de data para datetime, remove formatos inválidos.
+    Com inplace=True altera e devolve o próprio DataFrame (sem cópia).
+
+    date_cols pode ser uma lista (formato inferido de uma amostra de cada coluna)
+    ou um dict coluna → formato, ex: {"TransactionGenerationDate": "%Y-%m-%d %H:%M:%S"}.
+    date_format aplica-se às colunas da lista.
     """
-    df = df.copy()
-    for col in date_cols:
+    if not inplace:
+        df = df.copy()
+    formats = date_cols if isinstance(date_cols, dict) else dict.fromkeys(date_cols, date_format)
+    for col, fmt in formats.items():
         if col in df.columns:
-            df[col] = pd.to_datetime(df[col], errors="coerce")
+            df[col], stats = dates.parse_dates(df[col], date_format=fmt)
+            if stats["coerced"]:
+                logger.warning(f"'{col}': {stats['coerced']} valores inválidos convertidos em NaT "
+                               f"(formato: {stats['format'] or 'livre'})")
+            else:
+                logger.debug(f"'{col}' convertida com o formato {stats['format'] or 'livre'}")
         else:
             logger.warning(f"Coluna '{col}' não encontrada para normalização de data.")
-    logger.info(f"Colunas de data normalizadas: {date_cols}")
+    logger.info(f"Colunas de data normalizadas: {list(formats)}")
     return df
 
 
-def handle_missing_values(df: pd.DataFrame) -> pd.DataFrame:
+def handle_missing_values(df: pd.DataFrame, inplace: bool = False, schema: dict = None) -> pd.DataFrame:
     """
-    Substitui todos os valores ausentes (NaN, None, NaT) por pd.NA.
+    Substitui os valores ausentes (NaN, None, NaT) por pd.NA.
+    Só as colunas com nulos passam a tipos nullable (coluna a coluna). Com schema
+    (coluna → tipo lógico, ver transform.dtypes.target_dtypes) essas colunas são
+    convertidas para o tipo compacto do schema, tenham ou não nulos.
     """
-    df = df.copy()
-    total_nulls_before = df.isna().sum().sum()
+    if not inplace:
+        df = df.copy()
+    nulls = df.isna().sum().to_numpy()
+    total_nulls = int(nulls.sum())
+
+    converted = {}
+    if schema:
+        df, converted = dtypes.apply_schema(df, schema, inplace=True)
 
-    if total_nulls_before == 0:
+    if total_nulls == 0:
         logger.info("Nenhum valor ausente encontrado.")
         return df
 
-    df = df.convert_dtypes()
-    df = df.fillna(pd.NA)
-
-    total_nulls_after = df.isna().sum().sum()
-    logger.info(
-        f"Valores ausentes substituídos por pd.NA "
-        f"(antes: {total_nulls_before}, depois: {total_nulls_after})"
-    )
+    for i in np.flatnonzero(nulls):
+        if df.columns[i] not in converted:
+            df.isetitem(i, df.iloc[:, i].convert_dtypes().fillna(pd.NA))
 
+    # A conversão não cria nem remove nulos: a contagem não é refeita
+    logger.info(f"Valores ausentes substituídos por pd.NA ({total_nulls} em "
+                f"{np.count_nonzero(nulls)} coluna(s))")
     return df
 
 
-def deduplicate(df: pd.DataFrame, subset=None) -> pd.DataFrame:
+def deduplicate(df: pd.DataFrame, subset=None, inplace: bool = False,
+                key_index: "dedup.KeyIndex" = None) -> pd.DataFrame:
     """
     Remove duplicados, opcionalmente com base em colunas específicas.
+    A comparação é feita por digest de 64 bits da chave (ver transform.dedup);
+    com key_index são também removidas as chaves já carregadas em execuções anteriores.
+    Devolve um DataFrame só com as linhas mantidas (o próprio, se não houver duplicados).
     """
-    df = df.copy()
+    if not inplace:
+        df = df.copy()
     before = len(df)
-    df = df.drop_duplicates(subset=subset)
+    df = dedup.drop_duplicates(df, subset=subset, index=key_index)
     after = len(df)
     logger.info(f"Removidos {before - after} duplicados (base: {subset})")
     return df
 
 
+def fill_missing(df: pd.DataFrame, values: dict, inplace: bool = False) -> pd.DataFrame:
+    """Preenche nulos com o valor padrão de cada coluna."""
+    if not inplace:
+        df = df.copy()
+    for col, val in values.items():
+        if col in df.columns:
+            if isinstance(df[col].dtype, pd.CategoricalDtype) and val not in df[col].cat.categories:
+                df[col] = df[col].cat.add_categories([val])
+            df[col] = df[col].fillna(val)
+            logger.info(f"Preenchidos valores nulos em '{col}' com '{val}'")
+    return df
+
+
+FILTER_OPS = ("=", "==", "!=", "<", "<=", ">", ">=", "in", "not in")
+
+
+def row_mask(df: pd.DataFrame, conditions: list) -> np.ndarray:
+    """
+    Máscara booleana das condições (AND), no formato dos filtros pyarrow:
+        [["ID_TEMPO", ">=", 20250101], ["Moeda", "in", ["AOA", "USD"]]]
+    Valores nulos nunca satisfazem uma condição (como no pyarrow).
+    Condições sobre colunas inexistentes são ignoradas.
+    """
+    mask = np.ones(len(df), dtype=bool)
+    for col, op, value in conditions:
+        if op not in FILTER_OPS:
+            raise ValueError(f"Operador de filtro desconhecido: {op}")
+        if col not in df.columns:
+            logger.warning(f"Coluna '{col}' não encontrada — condição de filtro ignorada.")
+            continue
+        s = df[col]
+        if op in ("=", "=="):
+            cond = s == value
+        elif op == "!=":
+            cond = s != value
+        elif op == "<":
+            cond = s < value
+        elif op == "<=":
+            cond = s <= value
+        elif op == ">":
+            cond = s > value
+        elif op == ">=":
+            cond = s >= value
+        elif op == "in":
+            cond = s.isin(value)
+        else:
+            cond = ~s.isin(value)
+        mask &= cond.fillna(False).to_numpy(dtype=bool) & s.notna().to_numpy()
+    return mask
+
+
+def filter_rows(df: pd.DataFrame, conditions: list) -> pd.DataFrame:
+    """
+    Mantém apenas as linhas que satisfazem as condições (ver row_mask).
+    Devolve um novo DataFrame só com as linhas selecionadas.
+    """
+    mask = row_mask(df, conditions)
+    before = len(df)
+    if mask.all():
+        df_out = df
+    else:
+        df_out = df.loc[mask]
+    logger.info(f"Filtro {conditions}: removidas {before - len(df_out)} linhas")
+    return df_out
+
+
 def generate_quality_report(df_before: pd.DataFrame, df_after: pd.DataFrame) -> dict:
     """
     Gera um relatório de qualidade com estatísticas básicas.
@@ -69,36 +163,58 @@ def generate_quality_report(df_before: pd.DataFrame, df_after: pd.DataFrame) ->
     return report
 
 
-def apply_cleaning_rules(df: pd.DataFrame, rules: dict) -> pd.DataFrame:
+def compile_cleaning_rules(rules: dict, schema: dict = None,
+                           key_index: "dedup.KeyIndex" = None) -> RulePlan:
     """
-    Aplica as regras de limpeza configuradas.
+    Compila as regras de limpeza num plano que altera um único DataFrame
+    (pela mesma ordem de apply_cleaning_rules). schema: tipos alvo para
+    handle_missing_values; key_index: índice persistente para drop_duplicates.
     """
-    df_clean = df.copy()
-
+    steps = []
     if not rules:
-        logger.info("⚙ Nenhuma regra de limpeza definida. Retornando DataFrame original.")
-        return df_clean
-
-    logger.info(f"Aplicando regras de limpeza: {rules}")
+        return RulePlan(steps)
 
     # ⚙ Normalizar datas
     if "normalize_dates" in rules:
-        df_clean = normalize_dates(df_clean, rules["normalize_dates"])
+        steps.append(("normalize_dates",
+                      lambda df: normalize_dates(df, rules["normalize_dates"], inplace=True,
+                                                 date_format=rules.get("date_format"))))
 
     # ⚙ Substituir nulos por pd.NA
-    df_clean = handle_missing_values(df_clean)
+    steps.append(("handle_missing_values",
+                  lambda df: handle_missing_values(df, inplace=True, schema=schema)))
 
     # ⚙ Remover duplicados
     if "drop_duplicates" in rules:
-        df_clean = deduplicate(df_clean, subset=rules["drop_duplicates"])
+        steps.append(("drop_duplicates",
+                      lambda df: deduplicate(df, subset=rules["drop_duplicates"], inplace=True,
+                                             key_index=key_index)))
 
     # ⚙ Preencher nulos com valor padrão
     if "fill_missing" in rules:
-        for col, val in rules["fill_missing"].items():
-            if col in df_clean.columns:
-                df_clean[col] = df_clean[col].fillna(val)
-                logger.info(f"Preenchidos valores nulos em '{col}' com '{val}'")
+        steps.append(("fill_missing", lambda df: fill_missing(df, rules["fill_missing"], inplace=True)))
+
+    # ⚙ Filtrar linhas
+    if "filter" in rules:
+        steps.append(("filter", lambda df: filter_rows(df, rules["filter"])))
+
+    return RulePlan(steps)
 
 
+def apply_cleaning_rules(df: pd.DataFrame, rules: dict, copy: bool = True,
+                         schema: dict = None, key_index: "dedup.KeyIndex" = None) -> pd.DataFrame:
+    """
+    Aplica as regras de limpeza configuradas.
+    Faz uma única cópia do input (nenhuma com copy=False, se o chamador ceder o DataFrame).
+    schema: tipos alvo por coluna (ver transform.dtypes.target_dtypes).
+    key_index: índice persistente de chaves já carregadas (ver transform.dedup.open_index).
+    """
+    if not rules:
+        logger.info("⚙ Nenhuma regra de limpeza definida. Retornando DataFrame original.")
+        return df.copy() if copy else df
+
+    logger.info(f"Aplicando regras de limpeza: {rules}")
+    df_clean = compile_cleaning_rules(rules, schema, key_index).run(df, copy=copy)
+
     logger.info("Limpeza concluída com sucesso.")
     return df_clean
@@ -0,0 +1,326 @@
+"""
+Compilador lazy das regras `cleaning_rules` + `calculations` de uma fonte.
+
+As regras são traduzidas para uma lista de nós (colunas lidas/escritas por
+cada passo) e só são otimizadas quando o schema do input é conhecido:
+
+- predicate pushdown: os filtros sobem no plano enquanto nenhum passo anterior
+  alterar as colunas que leem (e, num drop_duplicates, se forem da chave);
+  filtros adjacentes fundem-se numa única seleção de linhas;
+- projection pushdown: se o resultado só depende de algumas colunas (ex: plano
+  que termina numa agregação, ou output_columns), as restantes são largadas
+  logo no início e os passos que só escrevem colunas mortas são eliminados.
+
+Os passos de coluna e os filtros correm nos mesmos kernels pandas de
+cleaning/calculations (resultado idêntico ao de apply_cleaning_rules +
+apply_calculations): o ganho vem de executar menos trabalho, não de outro motor.
+"""
+from dataclasses import dataclass, field, replace
+from typing import Callable, List, Optional, Sequence, Set
+
+import pandas as pd
+from loguru import logger
+
+from transform import calculations, cleaning
+from transform.expressions import compile_derive
+
+# Tipos de nó
+COLUMN = "column"        # altera/cria colunas, linhas intactas
+ROWS = "rows"            # remove linhas (drop_duplicates)
+FILTER = "filter"
+AGGREGATE = "aggregate"  # muda a forma do DataFrame
+
+
+@dataclass
+class Node:
+    name: str
+    kind: str
+    stage: str
+    reads: Optional[Set[str]] = None   # None = todas as colunas
+    writes: Set[str] = field(default_factory=set)
+    fn: Optional[Callable[[pd.DataFrame], pd.DataFrame]] = None
+    rule: object = None
+    barrier: bool = False  # o resultado depende das linhas presentes: filtros não passam
+    pending: object = None  # estado com commit()/rollback() (ex: agregação incremental)
+
+
+# ---------------------------------------------------------------------------
+# Construção dos nós
+# ---------------------------------------------------------------------------
+
+def cleaning_nodes(rules: dict, schema: dict = None, key_index=None) -> List[Node]:
+    """Nós das regras de limpeza, pela ordem de compile_cleaning_rules."""
+    nodes = []
+    if not rules:
+        return nodes
+
+    if "normalize_dates" in rules:
+        date_cols = rules["normalize_dates"]
+        nodes.append(Node(
+            "normalize_dates", COLUMN, "clean", reads=set(date_cols), writes=set(date_cols),
+            fn=lambda df: cleaning.normalize_dates(df, date_cols, inplace=True,
+                                                   date_format=rules.get("date_format")),
+            rule=date_cols, barrier=True,  # o formato é inferido dos valores presentes
+        ))
+
+    # Tipos nullable em todas as colunas: não muda valores, mas os tipos inferidos
+    # dependem das linhas presentes
+    nodes.append(Node(
+        "handle_missing_values", COLUMN, "clean", reads=set(), writes=set(),
+        fn=lambda df: cleaning.handle_missing_values(df, inplace=True, schema=schema), barrier=True,
+    ))
+
+    if "drop_duplicates" in rules:
+        subset = rules["drop_duplicates"]
+        nodes.append(Node(
+            "drop_duplicates", ROWS, "clean", reads=None if subset is None else set(subset),
+            fn=lambda df: cleaning.deduplicate(df, subset=subset, inplace=True, key_index=key_index),
+            rule=subset, pending=key_index,
+        ))
+
+    if "fill_missing" in rules:
+        values = dict(rules["fill_missing"])
+        nodes.append(Node(
+            "fill_missing", COLUMN, "clean", reads=set(values), writes=set(values),
+            fn=lambda df, values=values: cleaning.fill_missing(df, values, inplace=True),
+            rule=values, barrier=True,  # o tipo final depende de haver nulos nas linhas
+        ))
+
+    if "filter" in rules:
+        conditions = [list(c) for c in rules["filter"]]
+        nodes.append(Node(
+            "filter", FILTER, "clean", reads={c[0] for c in conditions}, rule=conditions,
+        ))
+    return nodes
+
+
+def calculation_nodes(rules: dict) -> List[Node]:
+    """Nós das regras de cálculo, pela ordem de compile_calculations."""
+    nodes = []
+    if not rules:
+        return nodes
+
+    if calculations.wants_id_tempo(rules):
+        offset, date_col = rules.get("offset_days", 1), rules.get("id_tempo_from")
+        nodes.append(Node(
+            "add_id_tempo", COLUMN, "calculate", reads={date_col} if date_col else set(), writes={"ID_TEMPO"},
+            fn=lambda df: calculations.add_id_tempo(df, offset_days=offset, date_col=date_col),
+            # Datas em texto são lidas com inferência de formato sobre as linhas presentes
+            barrier=bool(date_col),
+        ))
+
+    for s in rules.get("substring", []):
+        target = s.get("new_col") or s["col"]
+        nodes.append(Node(
+            f"substring:{target}", COLUMN, "calculate", reads={s["col"]}, writes={target},
+            fn=lambda df, s=s: calculations.substring_column(df, **s, inplace=True),
+            rule=s,
+        ))
+
+    derived = compile_derive(rules)
+    if derived is not None:
+        # Datas em texto: o formato é inferido das linhas presentes, logo nenhum filtro passa por cima
+        nodes.append(Node(
+            "derive", COLUMN, "calculate", reads=derived.reads, writes=derived.writes,
+            fn=derived.evaluate, rule=rules["derive"], barrier=derived.uses_dates,
+        ))
+
+    if "filter" in rules:
+        conditions = [list(c) for c in rules["filter"]]
+        nodes.append(Node(
+            "filter", FILTER, "calculate", reads={c[0] for c in conditions}, rule=conditions,
+        ))
+
+    for agg in rules.get("aggregations", []):
+        if agg.get("incremental"):
+            # O estado só é gravado com commit() (após o staging, ver LazyRulePlan.pending)
+            aggregate = calculations.incremental_aggregate(agg)
+            fn = lambda df, agg=agg, aggregate=aggregate: aggregate.update(df, mode=agg.get("mode", "merge"))
+        else:
+            aggregate = None
+            fn = lambda df, agg=agg: calculations.aggregate_values(
+                df, group_by=agg["group_by"], agg_rules=agg["agg"], inplace=True)
+        nodes.append(Node(
+            f"aggregate:{agg['group_by']}", AGGREGATE, "calculate",
+            reads=set(agg["group_by"]) | set(agg["agg"]), fn=fn, rule=agg, pending=aggregate,
+        ))
+    return nodes
+
+
+# ---------------------------------------------------------------------------
+# Otimização
+# ---------------------------------------------------------------------------
+
+def _commutes(filter_node: Node, node: Node) -> bool:
+    """O filtro pode ser aplicado antes de `node` sem alterar o resultado?"""
+    if node.barrier:
+        return False
+    cols = filter_node.reads
+    if node.kind == COLUMN:
+        return not (cols & node.writes)
+    if node.kind == ROWS:
+        # Linhas duplicadas na chave têm os mesmos valores nas colunas do filtro
+        return node.reads is None or cols <= node.reads
+    return node.kind == FILTER
+
+
+def push_down_filters(nodes: List[Node]) -> List[Node]:
+    """
+    Sobe cada filtro no plano e funde filtros adjacentes. Um filtro que passa
+    para antes de um passo de outra etapa (ex: de calculate para clean) passa
+    a pertencer a essa etapa.
+    """
+    plan = []
+    for node in nodes:
+        if node.kind != FILTER:
+            plan.append(node)
+            continue
+        pos = len(plan)
+        while pos > 0 and _commutes(node, plan[pos - 1]):
+            pos -= 1
+        stage = plan[pos].stage if pos < len(plan) else node.stage
+        plan.insert(pos, replace(node, stage=stage))
+
+    fused = []
+    for node in plan:
+        if node.kind == FILTER and fused and fused[-1].kind == FILTER and fused[-1].stage == node.stage:
+            prev = fused[-1]
+            fused[-1] = replace(prev, reads=prev.reads | node.reads, rule=prev.rule + node.rule)
+        else:
+            fused.append(node)
+    return fused
+
+
+def live_columns(nodes: List[Node], columns: Sequence[str],
+                 output_columns: Optional[Sequence[str]] = None):
+    """
+    Devolve (colunas do input de que o resultado depende, nós a executar).
+    Colunas vivas None = todas (sem projeção possível).
+
+    O schema é propagado passo a passo para saber que agregações se aplicam
+    (aggregate_values ignora agrupamentos com colunas em falta). Sem
+    output_columns só há projeção quando o plano termina numa agregação.
+    """
+    present = set(columns)
+    applies = []
+    for node in nodes:
+        ok = node.kind != AGGREGATE or set(node.rule["group_by"]) <= present
+        applies.append(ok)
+        if node.kind == AGGREGATE and ok:
+            present = set(node.rule["group_by"]) | set(node.rule["agg"])
+        elif node.kind == COLUMN:
+            present |= node.writes
+
+    if output_columns is not None:
+        end, live = len(nodes), set(output_columns)
+    else:
+        aggregations = [i for i, n in enumerate(nodes) if n.kind == AGGREGATE and applies[i]]
+        if not aggregations:
+            return None, list(nodes)
+        end = aggregations[-1]
+        live = set(nodes[end].reads)
+
+    kept = []
+    for i in range(end - 1, -1, -1):
+        node = nodes[i]
+        if node.kind == AGGREGATE:
+            if applies[i]:
+                live = set(node.reads)
+        elif node.kind == COLUMN and node.writes and not (node.writes & live):
+            logger.debug(f"Passo eliminado (colunas não usadas): {node.name}")
+            continue
+        elif node.reads is None:
+            return None, list(nodes)
+        else:
+            # Colunas escritas ficam vivas (mantêm a posição no resultado)
+            live |= node.reads | node.writes
+        kept.append(node)
+    return live, kept[::-1] + list(nodes[end:])
+
+
+# ---------------------------------------------------------------------------
+# Plano lazy
+# ---------------------------------------------------------------------------
+
+class LazyRulePlan:
+    """
+    Plano lazy de limpeza + cálculos. Nada é executado até collect(), onde o
+    plano é otimizado para o schema do DataFrame recebido.
+
+        plan = compile_rules(cfg["cleaning_rules"], cfg["calculations"])
+        df = plan.collect(df)                       # limpeza + cálculos
+        df = plan.collect(df, stages=("clean",))    # só a limpeza (otimizada para o plano todo)
+    """
+
+    def __init__(self, nodes: List[Node], output_columns: Optional[Sequence[str]] = None):
+        self.nodes = list(nodes)
+        # Estados a confirmar (commit) ou descartar (rollback) depois do staging
+        self.pending = [n.pending for n in self.nodes if n.pending is not None]
+        self.output_columns = list(output_columns) if output_columns is not None else None
+
+    def __len__(self) -> int:
+        return len(self.nodes)
+
+    def optimize(self, columns: Sequence[str], stages: Optional[Sequence[str]] = None):
+        """
+        Devolve (colunas a largar no início, passos a executar) para um input
+        com estas colunas. Com `stages`, o input é o DataFrame à entrada da
+        primeira etapa pedida e a análise de colunas vivas cobre o resto do plano.
+        """
+        nodes = push_down_filters(self.nodes)
+        if stages is not None:
+            selected = [i for i, n in enumerate(nodes) if n.stage in stages]
+            nodes = nodes[selected[0]:] if selected else []
+
+        live, nodes = live_columns(nodes, columns, self.output_columns)
+        if stages is not None:
+            nodes = [n for n in nodes if n.stage in stages]
+
+        drop = [] if live is None else [c for c in columns if c not in live]
+        return drop, nodes
+
+    def explain(self, columns: Sequence[str], stages: Optional[Sequence[str]] = None) -> str:
+        """Descrição textual do plano otimizado (para logs e testes)."""
+        drop, plan = self.optimize(columns, stages)
+        lines = [f"project: drop {drop}"] if drop else []
+        for node in plan:
+            lines.append(f"filter: {node.rule}" if node.kind == FILTER else node.name)
+        return "\n".join(lines)
+
+    def collect(self, df: pd.DataFrame, copy: bool = True,
+                stages: Optional[Sequence[str]] = None) -> pd.DataFrame:
+        """
+        Executa o plano. Tal como RulePlan.run, copy=True faz uma única cópia
+        inicial; com copy=False o chamador cede o DataFrame ao plano.
+        """
+        drop, plan = self.optimize(list(df.columns), stages)
+        if drop:
+            logger.debug(f"Projeção: colunas não usadas largadas {drop}")
+            # Projeção antes da cópia: as colunas mortas nunca são copiadas
+            df = df.drop(columns=drop)
+            copy = False
+        if copy:
+            df = df.copy()
+
+        for node in plan:
+            logger.debug(f"Passo do plano: {node.name}")
+            if node.kind == FILTER:
+                df = cleaning.filter_rows(df, node.rule)
+            else:
+                df = node.fn(df)
+
+        if self.output_columns is not None:
+            df = df[[c for c in self.output_columns if c in df.columns]]
+        return df
+
+
+def compile_rules(cleaning_rules: dict = None, calculation_rules: dict = None,
+                  output_columns: Optional[Sequence[str]] = None,
+                  schema: dict = None, key_index=None) -> LazyRulePlan:
+    """
+    Compila as regras de uma fonte (sources.json) num plano lazy.
+    schema: tipos alvo por coluna (ver transform.dtypes.target_dtypes);
+    key_index: índice persistente de chaves já carregadas (ver transform.dedup.open_index).
+    """
+    nodes = cleaning_nodes(cleaning_rules or {}, schema, key_index) + calculation_nodes(calculation_rules or {})
+    return LazyRulePlan(nodes, output_columns=output_columns)
@@ -0,0 +1,176 @@
+"""
+Conversão rápida de colunas de data.
+
+Em vez de deixar o pandas adivinhar o formato elemento a elemento, o formato é
+inferido de uma amostra de valores distintos e a coluna é convertida de forma
+vetorizada com esse formato explícito. Só os valores distintos são convertidos
+(as datas repetem-se muito) e os resultados ficam em cache por formato, para
+os lotes seguintes da mesma fonte (ex: extração em chunks).
+"""
+import threading
+from functools import lru_cache
+from typing import Dict, Iterable, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+from loguru import logger
+
+# Formatos testados na inferência (o default_date_format do general.yaml entra primeiro)
+CANDIDATE_FORMATS = (
+    "%Y-%m-%d %H:%M:%S",
+    "%Y-%m-%d %H:%M:%S.%f",
+    "%Y-%m-%dT%H:%M:%S",
+    "%Y-%m-%d",
+    "%Y/%m/%d %H:%M:%S",
+    "%Y/%m/%d",
+    "%m/%d/%Y %H:%M:%S",
+    "%m/%d/%Y",
+    "%m-%d-%Y",
+    "%d/%m/%Y %H:%M:%S",
+    "%d/%m/%Y",
+    "%d-%m-%Y",
+    "%Y%m%d",
+)
+# Datas ambíguas (01/02/2025) seguem a regra do pd.to_datetime: decide o primeiro
+# valor, lido mês-primeiro sempre que possível. Dia-primeiro só se esse valor não
+# couber em mês-primeiro (31/01/2025) ou se estiver configurado (date_format /
+# default_date_format).
+MONTH_FIRST = {
+    "%d/%m/%Y %H:%M:%S": "%m/%d/%Y %H:%M:%S",
+    "%d/%m/%Y": "%m/%d/%Y",
+    "%d-%m-%Y": "%m-%d-%Y",
+}
+DEFAULT_SAMPLE_SIZE = 1000
+MIN_MATCH_RATIO = 0.5        # fração mínima da amostra que o formato tem de converter
+MAX_CACHE_ENTRIES = 1_000_000
+
+_cache: Dict[str, pd.Series] = {}
+_cache_lock = threading.Lock()
+
+
+@lru_cache(maxsize=1)
+def default_date_format() -> Optional[str]:
+    """default_date_format do general.yaml (None se não houver configuração)."""
+    try:
+        from utils.config_loader import load_yaml
+        return load_yaml("general.yaml").get("default_date_format")
+    except Exception as e:
+        logger.debug(f"general.yaml indisponível para o formato de data por defeito: {e}")
+        return None
+
+
+def _text(value) -> str:
+    if isinstance(value, str):
+        return value
+    if isinstance(value, (float, np.floating)) and float(value).is_integer():
+        return str(int(value))  # 20250101.0 (inteiros com nulos) → "20250101"
+    return str(value)
+
+
+def _as_text(values) -> np.ndarray:
+    """Valores distintos como strings (inteiros tipo 20250101 incluídos)."""
+    return np.asarray([_text(v) for v in values], dtype=object)
+
+
+def infer_date_format(values: Iterable, sample_size: int = DEFAULT_SAMPLE_SIZE,
+                      candidates: Iterable[str] = None) -> Optional[str]:
+    """
+    Escolhe o formato que converte mais valores de uma amostra de valores
+    distintos (None se nenhum converter pelo menos MIN_MATCH_RATIO da amostra).
+    Formatos dia-primeiro não configurados cedem ao equivalente mês-primeiro
+    quando este lê o primeiro valor (ver MONTH_FIRST).
+    """
+    sample = pd.Index(values).dropna().unique()[:sample_size]
+    if len(sample) == 0:
+        return None
+    sample = _as_text(sample)
+
+    if candidates is None:
+        default = default_date_format()
+        candidates = ([default] if default else []) + [f for f in CANDIDATE_FORMATS if f != default]
+        configured = {default}
+    else:
+        candidates = list(candidates)
+        configured = set(candidates)
+
+    best, best_hits = None, 0
+    for fmt in candidates:
+        hits = pd.to_datetime(sample, format=fmt, errors="coerce").notna().sum()
+        if hits > best_hits:
+            best, best_hits = fmt, hits
+        if hits == len(sample):
+            break
+    if best_hits < MIN_MATCH_RATIO * len(sample):
+        return None
+    twin = MONTH_FIRST.get(best)
+    if twin and best not in configured and pd.notna(pd.to_datetime(sample[0], format=twin, errors="coerce")):
+        return twin
+    return best
+
+
+def _parse_unique(uniques: np.ndarray, fmt: Optional[str]) -> np.ndarray:
+    """Converte valores distintos, usando e atualizando a cache do formato."""
+    key = fmt or ""
+    with _cache_lock:
+        cached = _cache.get(key)
+    if cached is None:
+        positions = np.full(len(uniques), -1)
+    else:
+        positions = cached.index.get_indexer(uniques)
+
+    missing = positions < 0
+    result = np.empty(len(uniques), dtype="datetime64[us]")
+    if cached is not None and not missing.all():
+        result[~missing] = cached.to_numpy()[positions[~missing]]
+
+    if missing.any():
+        new_values = uniques[missing]
+        if fmt is None:
+            parsed = pd.to_datetime(pd.Series(new_values, dtype=object), errors="coerce")
+        else:
+            parsed = pd.to_datetime(pd.Series(new_values, dtype=object), format=fmt, errors="coerce")
+        parsed = parsed.to_numpy().astype("datetime64[us]")
+        result[missing] = parsed
+
+        fresh = pd.Series(parsed, index=pd.Index(new_values, dtype=object))
+        with _cache_lock:
+            current = _cache.get(key)
+            if current is None or len(current) + len(fresh) > MAX_CACHE_ENTRIES:
+                _cache[key] = fresh
+            else:
+                _cache[key] = pd.concat([current, fresh])
+    return result
+
+
+def clear_cache():
+    """Esvazia a cache de datas convertidas."""
+    with _cache_lock:
+        _cache.clear()
+
+
+def parse_dates(values: pd.Series, date_format: str = None,
+                sample_size: int = DEFAULT_SAMPLE_SIZE) -> Tuple[pd.Series, dict]:
+    """
+    Converte uma coluna para datetime64. Valores inválidos ficam NaT.
+
+    O formato é, por ordem: o indicado, o inferido da amostra, ou a conversão
+    livre do pandas (se nenhum formato conhecido servir). Devolve a coluna e
+    estatísticas: {"format", "unique", "coerced"} (coerced = valores não nulos
+    que não foram convertidos).
+    """
+    if pd.api.types.is_datetime64_any_dtype(values):
+        return values, {"format": None, "unique": None, "coerced": 0}
+
+    codes, uniques = pd.factorize(values, use_na_sentinel=True)
+    uniques = _as_text(uniques)
+    fmt = date_format or infer_date_format(uniques, sample_size)
+
+    parsed_unique = _parse_unique(uniques, fmt)
+    parsed = parsed_unique[codes] if len(uniques) else np.empty(len(codes), dtype="datetime64[us]")
+    parsed[codes < 0] = np.datetime64("NaT")
+
+    coerced_unique = np.isnat(parsed_unique)
+    coerced = int(np.bincount(codes[codes >= 0], minlength=len(uniques))[coerced_unique].sum()) \
+        if len(uniques) else 0
+    result = pd.Series(parsed, index=values.index, name=values.name)
+    return result, {"format": fmt, "unique": len(uniques), "coerced": coerced}
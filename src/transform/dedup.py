@@ -0,0 +1,347 @@
+"""
+Deduplicação por hash.
+
+As colunas da chave são reduzidas a um digest de 64 bits por linha (8 bytes,
+em vez de comparar as linhas inteiras) e a primeira ocorrência de cada digest
+é encontrada numa tabela de hash uint64. Sobre isto há dois extras:
+
+- HashDeduplicator: deduplicação em lotes (ex: extração em chunks) com
+  orçamento de memória; acima dele, as partições de hash maiores são gravadas
+  em disco e deduplicadas uma a uma no fim (cada partição cabe em memória);
+- KeyIndex: índice persistente dos digests já carregados (ex: TransactionID do
+  TMP_AML), para rejeitar duplicados de cargas anteriores. As chaves novas só
+  entram no índice com commit(), depois do staging.
+
+A probabilidade de colisão de digests é desprezável (~n²/2^65: 3e-8 para
+1 milhão de chaves).
+"""
+import os
+import shutil
+import tempfile
+import threading
+from typing import Iterator, List, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+from loguru import logger
+
+DEFAULT_INDEX_DIR = os.path.join("data/staging", ".dedup_index")
+DEFAULT_MEMORY_BUDGET = 256 * 2**20
+DEFAULT_PARTITIONS = 16
+_DIGEST = "__digest"
+_SEQ = "__seq"
+
+
+def key_digests(df: pd.DataFrame, subset: Optional[Sequence[str]] = None) -> np.ndarray:
+    """
+    Digest uint64 das colunas da chave (todas, se subset=None). Inteiros guardados
+    como float (por causa de nulos) são normalizados, para o digest não depender do dtype.
+    """
+    cols = list(df.columns) if subset is None else list(subset)
+    keys = df[cols]
+    for col in cols:
+        values = keys[col]
+        if pd.api.types.is_float_dtype(values):
+            valid = values.dropna().to_numpy(dtype="float64")
+            if np.array_equal(valid, np.floor(valid)) and (np.abs(valid) < 2**63).all():
+                keys = keys.assign(**{col: values.astype("Int64")})
+    return pd.util.hash_pandas_object(keys, index=False).to_numpy()
+
+
+def _canonical(values: pd.Series):
+    """
+    Forma canónica de uma coluna em duas partes: número (float64, só para colunas
+    int/float) e texto (restantes, comparado como texto). Assim o mesmo número fica
+    igual quer um bloco o tenha lido como int ou como float (por ter nulos), mas
+    texto como "0123" ou "1.0" não se confunde com 123 ou 1.
+    Inteiros a partir de 2**53 ficam como texto, para não colidirem no float.
+    """
+    nulls = values.isna().to_numpy()
+    numbers = np.full(len(values), np.nan)
+    if pd.api.types.is_numeric_dtype(values) and not pd.api.types.is_bool_dtype(values):
+        # cópia: to_numpy pode devolver uma vista só de leitura
+        numbers = np.array(values.to_numpy(dtype="float64", na_value=np.nan), dtype="float64")
+        numbers[np.abs(numbers) >= 2**53] = np.nan
+    as_text = np.isnan(numbers) & ~nulls
+    text = np.full(len(values), None, dtype=object)
+    if as_text.any():
+        text[as_text] = values[as_text].astype(str).to_numpy(dtype=object)
+    return numbers, text
+
+
+def text_digests(df: pd.DataFrame) -> np.ndarray:
+    """
+    Digest uint64 por linha que não depende do dtype numérico inferido na leitura
+    (ex: blocos de CSV em que a mesma coluna sai int64 num bloco e float64 noutro).
+    """
+    parts = {}
+    for i, col in enumerate(df.columns):
+        parts[f"n{i}"], parts[f"t{i}"] = _canonical(df[col])
+    return pd.util.hash_pandas_object(pd.DataFrame(parts), index=False).to_numpy()
+
+
+def first_occurrences(digests: np.ndarray) -> np.ndarray:
+    """Máscara das primeiras ocorrências de cada digest (como drop_duplicates keep="first")."""
+    # Tabela de hash uint64 do pandas: O(n), sem ordenar
+    return ~pd.Series(digests, copy=False).duplicated(keep="first").to_numpy()
+
+
+def drop_duplicates(df: pd.DataFrame, subset: Optional[Sequence[str]] = None,
+                    index: Optional["KeyIndex"] = None) -> pd.DataFrame:
+    """
+    Remove duplicados (mantém a primeira ocorrência, com o índice original).
+    Com `index`, remove também as chaves já carregadas e guarda as novas como pendentes.
+    """
+    if df.empty:
+        return df
+    if index is None and subset is not None and len(subset) == 1:
+        # Uma só coluna: a tabela de hash do próprio dtype dispensa o digest
+        mask = ~df[subset[0]].duplicated(keep="first").to_numpy()
+        return df if mask.all() else df.loc[mask]
+    digests = key_digests(df, subset)
+    mask = first_occurrences(digests)
+    if index is not None:
+        mask &= ~index.contains(digests)
+        index.stage(digests[mask])
+    return df if mask.all() else df.loc[mask]
+
+
+class DigestSet:
+    """
+    Conjunto de digests uint64 em arrays ordenados (8 bytes por chave, contra
+    ~70 bytes de um int num set Python). Os lotes novos entram como "runs"
+    ordenados, fundidos num só quando passam de MAX_RUNS.
+    """
+    MAX_RUNS = 8
+
+    def __init__(self, digests: Optional[np.ndarray] = None):
+        self._runs: List[np.ndarray] = []
+        if digests is not None and len(digests):
+            self._runs.append(np.unique(np.asarray(digests, dtype=np.uint64)))
+
+    def __len__(self) -> int:
+        return sum(len(r) for r in self._runs)
+
+    def contains(self, digests: np.ndarray) -> np.ndarray:
+        found = np.zeros(len(digests), dtype=bool)
+        for run in self._runs:
+            pos = np.searchsorted(run, digests).clip(max=len(run) - 1)
+            found |= run[pos] == digests
+        return found
+
+    def add(self, digests: np.ndarray):
+        if len(digests):
+            self._runs.append(np.unique(np.asarray(digests, dtype=np.uint64)))
+        if len(self._runs) > self.MAX_RUNS:
+            self._runs = [self.to_array()]
+
+    def to_array(self) -> np.ndarray:
+        if not self._runs:
+            return np.empty(0, dtype=np.uint64)
+        return self._runs[0] if len(self._runs) == 1 else np.unique(np.concatenate(self._runs))
+
+
+class KeyIndex:
+    """
+    Digests das chaves já carregadas de uma tabela, guardados em .npz
+    (8 bytes por chave). As chaves de uma execução ficam pendentes até commit().
+    """
+
+    def __init__(self, table: str, keys: Sequence[str], index_dir: str = DEFAULT_INDEX_DIR):
+        self.table = table
+        self.keys = list(keys)
+        self.index_dir = index_dir
+        self.known = DigestSet()
+        self.pending = DigestSet()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.known)
+
+    @property
+    def path(self) -> str:
+        return os.path.join(self.index_dir, f"{self.table}.npz")
+
+    def contains(self, digests: np.ndarray) -> np.ndarray:
+        """Máscara dos digests já carregados ou pendentes."""
+        with self._lock:
+            return self.known.contains(digests) | self.pending.contains(digests)
+
+    def stage(self, digests: np.ndarray):
+        """Regista chaves novas como pendentes (só entram no índice com commit)."""
+        with self._lock:
+            self.pending.add(digests)
+
+    def commit(self):
+        """Junta as chaves pendentes ao índice e grava-o (rename atómico)."""
+        with self._lock:
+            pending, self.pending = self.pending, DigestSet()
+            self.known = DigestSet(np.union1d(self.known.to_array(), pending.to_array()))
+        self.save()
+
+    def rollback(self):
+        with self._lock:
+            self.pending = DigestSet()
+
+    def save(self):
+        os.makedirs(self.index_dir, exist_ok=True)
+        tmp_path = f"{self.path}.tmp.npz"
+        np.savez(tmp_path, digests=self.known.to_array(), keys=np.array(self.keys))
+        os.replace(tmp_path, self.path)
+
+    def load(self) -> bool:
+        """Carrega o índice guardado; ignora-o se as chaves configuradas mudaram."""
+        if not os.path.exists(self.path):
+            return False
+        try:
+            with np.load(self.path) as data:
+                if list(data["keys"]) != self.keys:
+                    logger.warning(f"Índice de chaves de {self.table} ignorado (chaves diferentes).")
+                    return False
+                self.known = DigestSet(data["digests"])
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning(f"Índice de chaves de {self.table} ignorado: {e}")
+            return False
+        return True
+
+
+def open_index(cfg: dict, index_dir: str = DEFAULT_INDEX_DIR) -> Optional[KeyIndex]:
+    """
+    Índice persistente da fonte, se configurado, ex:
+        "cleaning_rules": {"drop_duplicates": ["TransactionID"], "persistent_dedup": true}
+    """
+    rules = cfg.get("cleaning_rules") or {}
+    keys = rules.get("drop_duplicates")
+    if not rules.get("persistent_dedup") or not keys:
+        return None
+    index = KeyIndex(cfg.get("load", {}).get("table") or cfg.get("target_table", "unknown_table"), keys, index_dir)
+    index.load()
+    logger.info(f"Índice de deduplicação de {index.table}: {len(index)} chaves já carregadas")
+    return index
+
+
+class HashDeduplicator:
+    """
+    Deduplicação de um fluxo de lotes com orçamento de memória (grace hash):
+
+        dedup = HashDeduplicator(subset=["TransactionID"], memory_budget=512 * 2**20)
+        for chunk in chunks:
+            dedup.add(chunk)
+        df = dedup.collect()            # ou: for part in dedup.partitions(): ...
+
+    As linhas são distribuídas por partições de hash; quando o total em memória
+    passa o orçamento, a partição maior é gravada em disco (Parquet). No fim cada
+    partição é deduplicada sozinha, mantendo a primeira ocorrência do fluxo.
+    A memória é estimada por linhas × bytes médios por linha, medidos uma vez no
+    primeiro lote. Sem subset, as linhas inteiras são comparadas com text_digests
+    (blocos de CSV com dtypes inferidos diferentes).
+    """
+
+    def __init__(self, subset: Optional[Sequence[str]] = None,
+                 memory_budget: int = DEFAULT_MEMORY_BUDGET,
+                 partitions: int = DEFAULT_PARTITIONS,
+                 spill_dir: Optional[str] = None,
+                 index: Optional[KeyIndex] = None):
+        self.subset = list(subset) if subset is not None else None
+        self.memory_budget = memory_budget
+        self.num_partitions = partitions
+        self.index = index
+        self._spill_root = spill_dir
+        self._spill_dir: Optional[str] = None
+        self._buffers: List[List[pd.DataFrame]] = [[] for _ in range(partitions)]
+        self._sizes = np.zeros(partitions, dtype=np.int64)
+        self._row_bytes: Optional[float] = None
+        self._spilled = [0] * partitions
+        self.spilled_partitions = 0
+        self._seq = 0
+        self.rows_in = 0
+
+    def add(self, df: pd.DataFrame):
+        """Acrescenta um lote (já sem os duplicados internos ao lote)."""
+        if df.empty:
+            return
+        self.rows_in += len(df)
+        digests = text_digests(df) if self.subset is None else key_digests(df, self.subset)
+        mask = first_occurrences(digests)
+        if self.index is not None:
+            mask &= ~self.index.contains(digests)
+        chunk = df.loc[mask].assign(**{
+            _DIGEST: digests[mask],
+            _SEQ: np.arange(self._seq, self._seq + len(df))[mask],
+        })
+        self._seq += len(df)
+
+        if self._row_bytes is None and len(chunk):
+            self._row_bytes = chunk.memory_usage(index=False, deep=True).sum() / len(chunk)
+
+        part_ids = (chunk[_DIGEST].to_numpy() % np.uint64(self.num_partitions)).astype(np.int64)
+        counts = np.bincount(part_ids, minlength=self.num_partitions)
+        for p in np.flatnonzero(counts):
+            self._buffers[p].append(chunk.loc[part_ids == p])
+        self._sizes += (counts * (self._row_bytes or 0)).astype(np.int64)
+
+        while self._sizes.sum() > self.memory_budget and self._sizes.max() > 0:
+            self._spill(int(self._sizes.argmax()))
+
+    def _spill(self, p: int):
+        if self._spill_dir is None:
+            if self._spill_root:
+                os.makedirs(self._spill_root, exist_ok=True)
+            self._spill_dir = tempfile.mkdtemp(prefix="dedup_", dir=self._spill_root)
+        frame = pd.concat(self._buffers[p])
+        path = os.path.join(self._spill_dir, f"part_{p:03d}_{self._spilled[p]:05d}.parquet")
+        frame.to_parquet(path, index=True)
+        logger.debug(f"Partição {p} gravada em disco ({len(frame)} linhas, {self._sizes[p] / 2**20:.1f} MiB)")
+        self._buffers[p] = []
+        self._sizes[p] = 0
+        self._spilled[p] += 1
+
+    def _partition(self, p: int) -> pd.DataFrame:
+        frames = [
+            pd.read_parquet(os.path.join(self._spill_dir, f"part_{p:03d}_{i:05d}.parquet"))
+            for i in range(self._spilled[p])
+        ] + self._buffers[p]
+        self._buffers[p] = []
+        if not frames:
+            return pd.DataFrame()
+        frame = pd.concat(frames).sort_values(_SEQ, kind="stable")
+        return frame.loc[first_occurrences(frame[_DIGEST].to_numpy())]
+
+    def partitions(self) -> Iterator[pd.DataFrame]:
+        """Partições deduplicadas (cada uma pela ordem de chegada). Limpa os ficheiros no fim."""
+        try:
+            for p in range(self.num_partitions):
+                frame = self._partition(p)
+                if frame.empty:
+                    continue
+                if self.index is not None:
+                    self.index.stage(frame[_DIGEST].to_numpy())
+                yield frame.drop(columns=[_DIGEST, _SEQ])
+        finally:
+            self.close()
+
+    def collect(self) -> pd.DataFrame:
+        """Resultado completo pela ordem de chegada (igual a drop_duplicates sobre a concatenação)."""
+        frames = []
+        self.spilled_partitions = sum(1 for n in self._spilled if n)
+        try:
+            for p in range(self.num_partitions):
+                frame = self._partition(p)
+                if not frame.empty:
+                    frames.append(frame)
+        finally:
+            self.close()
+        if not frames:
+            return pd.DataFrame()
+        result = pd.concat(frames).sort_values(_SEQ, kind="stable")
+        if self.index is not None:
+            self.index.stage(result[_DIGEST].to_numpy())
+        logger.info(f"Deduplicação: {self.rows_in} → {len(result)} linhas "
+                    f"({self.spilled_partitions} partição(ões) gravadas em disco)")
+        return result.drop(columns=[_DIGEST, _SEQ])
+
+    def close(self):
+        if self._spill_dir is not None:
+            shutil.rmtree(self._spill_dir, ignore_errors=True)
+            self._spill_dir = None
+        self._spilled = [0] * self.num_partitions
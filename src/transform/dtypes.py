@@ -0,0 +1,193 @@
+"""
+Conversão de tipos guiada pelo schema da fonte.
+
+Os tipos alvo vêm do bloco "schema" da fonte (tipos Python: int, float, str,
+datetime, decimal, bool, category) ou, na falta dele, dos tipos SQL do
+dimensional_model (atributos das dimensões e factos). Só as colunas cujo tipo
+atual difere do alvo são convertidas, para tipos nullable compactos:
+inteiros com a menor largura que cabe nos valores, categorias para texto com
+poucos valores distintos e texto em Arrow para o restante.
+"""
+import re
+from typing import Dict, Optional
+
+import numpy as np
+import pandas as pd
+from loguru import logger
+
+from transform import dates
+
+CATEGORY_MAX_RATIO = 0.5   # texto vira categoria se distintos/linhas <= este rácio
+CATEGORY_MIN_ROWS = 1000   # ... e houver linhas suficientes para compensar o dicionário
+STRING_DTYPE = pd.StringDtype("pyarrow")
+INT_DTYPES = (pd.Int8Dtype(), pd.Int16Dtype(), pd.Int32Dtype(), pd.Int64Dtype())
+# Texto aceite como booleano (comparado em minúsculas, sem espaços)
+BOOL_VALUES = {
+    "true": True, "false": False, "t": True, "f": False, "1": True, "0": False,
+    "s": True, "n": False, "sim": True, "nao": False, "não": False,
+    "y": True, "yes": True, "no": False,
+}
+
+# Tipos SQL Server / Python → tipo lógico
+_SQL_KINDS = (
+    (r"^(tiny|small|big)?int|^integer", "int"),
+    (r"^(decimal|numeric|money|smallmoney|float|real)", "float"),
+    (r"^(n?varchar|n?char|n?text|uniqueidentifier)", "string"),
+    (r"^(date|datetime|datetime2|smalldatetime|datetimeoffset)$", "datetime"),
+    (r"^bit$", "bool"),
+)
+_PY_KINDS = {
+    "int": "int", "float": "float", "decimal": "float", "str": "string", "string": "string",
+    "datetime": "datetime", "date": "datetime", "bool": "bool", "category": "category",
+}
+
+
+def logical_type(type_name: str) -> Optional[str]:
+    """Tipo lógico (int/float/string/datetime/bool/category) de um tipo Python ou SQL."""
+    name = type_name.strip().lower()
+    if name in _PY_KINDS:
+        return _PY_KINDS[name]
+    base = name.split("(")[0].strip()
+    for pattern, kind in _SQL_KINDS:
+        if re.match(pattern, base):
+            return kind
+    return None
+
+
+def target_dtypes(cfg: dict) -> Dict[str, str]:
+    """
+    Tipos lógicos por coluna para uma fonte: dimensional_model (atributos e
+    factos) completado/sobreposto pelo bloco "schema".
+    """
+    types = {}
+    model = cfg.get("dimensional_model") or {}
+    for dim_info in model.get("dimensions", {}).values():
+        types.update(dim_info.get("attributes", {}))
+    types.update(model.get("facts", {}))
+    types.update(cfg.get("schema") or {})
+
+    kinds = {}
+    for col, type_name in types.items():
+        kind = logical_type(str(type_name))
+        if kind is None:
+            logger.warning(f"Tipo desconhecido para '{col}': {type_name} — coluna ignorada.")
+        else:
+            kinds[col] = kind
+    return kinds
+
+
+def smallest_int_dtype(values: pd.Series):
+    """Menor inteiro nullable onde cabem os valores (None se não forem inteiros)."""
+    numbers = pd.to_numeric(values, errors="coerce")
+    valid = numbers.dropna()
+    if len(valid) and not np.array_equal(valid.to_numpy(dtype="float64"), np.floor(valid.to_numpy(dtype="float64"))):
+        return None
+    if numbers.isna().sum() != values.isna().sum():
+        return None  # texto não numérico
+    low, high = (valid.min(), valid.max()) if len(valid) else (0, 0)
+    for dtype in INT_DTYPES:
+        info = np.iinfo(dtype.numpy_dtype)
+        if info.min <= low and high <= info.max:
+            return dtype
+    return None
+
+
+def float_values(values: pd.Series) -> Optional[pd.Series]:
+    """Valores como números (None se houver texto não numérico)."""
+    if pd.api.types.is_numeric_dtype(values) and not pd.api.types.is_bool_dtype(values):
+        return values
+    numbers = pd.to_numeric(values, errors="coerce")
+    if numbers.isna().sum() != values.isna().sum():
+        return None
+    return numbers
+
+
+def bool_values(values: pd.Series) -> Optional[pd.Series]:
+    """Valores como booleanos nullable (None se algum valor não for reconhecido)."""
+    if pd.api.types.is_bool_dtype(values):
+        return values
+    valid = values.dropna()
+    if pd.api.types.is_numeric_dtype(values):
+        if not valid.isin([0, 1]).all():
+            return None
+        mapped = valid.astype(bool)
+    else:
+        mapped = valid.astype(str).str.strip().str.lower().map(BOOL_VALUES)
+        if mapped.isna().any():
+            return None
+    return mapped.reindex(values.index).astype(pd.BooleanDtype())
+
+
+def compact_dtype(values: pd.Series, kind: str):
+    """Dtype alvo de uma coluna para o tipo lógico (None se não for possível converter)."""
+    if kind == "int":
+        return smallest_int_dtype(values) or (pd.Float64Dtype() if pd.api.types.is_numeric_dtype(values) else None)
+    if kind == "float":
+        return pd.Float64Dtype() if float_values(values) is not None else None
+    if kind == "bool":
+        return pd.BooleanDtype() if bool_values(values) is not None else None
+    if kind == "datetime":
+        return values.dtype if pd.api.types.is_datetime64_any_dtype(values) else np.dtype("datetime64[us]")
+    if kind in ("string", "category"):
+        if isinstance(values.dtype, pd.CategoricalDtype):
+            return values.dtype
+        if kind == "category" or (len(values) >= CATEGORY_MIN_ROWS
+                                  and values.nunique() <= CATEGORY_MAX_RATIO * len(values)):
+            return "category"
+        return STRING_DTYPE
+    return None
+
+
+def convert_column(values: pd.Series, kind: str) -> pd.Series:
+    """Converte uma coluna para o tipo lógico (devolve-a igual se já estiver no tipo alvo)."""
+    target = compact_dtype(values, kind)
+    if target is None:
+        logger.warning(f"'{values.name}': valores incompatíveis com o tipo {kind} — mantido {values.dtype}.")
+        return values
+    if target == "category" and isinstance(values.dtype, pd.CategoricalDtype):
+        return values
+    if values.dtype == target:
+        return values
+    if kind == "datetime":
+        return dates.parse_dates(values)[0]
+    if kind in ("int", "float") and not pd.api.types.is_numeric_dtype(values):
+        values = pd.to_numeric(values)
+    if kind == "bool":
+        return bool_values(values)
+    if target == "category":
+        # Texto como categoria: nulos ficam como categoria ausente
+        return values.astype(STRING_DTYPE).astype("category")
+    return values.astype(target)
+
+
+def apply_schema(df: pd.DataFrame, schema: Dict[str, str], inplace: bool = False):
+    """
+    Converte as colunas do schema (coluna → tipo lógico) que ainda não estão no
+    tipo alvo. Devolve (DataFrame, relatório por coluna convertida com os bytes
+    antes/depois).
+    """
+    if not inplace:
+        df = df.copy()
+    report = {}
+    for col, kind in schema.items():
+        if col not in df.columns:
+            continue
+        before = df[col]
+        after = convert_column(before, kind)
+        if after is before:
+            continue
+        bytes_before = int(before.memory_usage(index=False, deep=True))
+        bytes_after = int(after.memory_usage(index=False, deep=True))
+        df[col] = after
+        report[col] = {
+            "from": str(before.dtype), "to": str(after.dtype),
+            "bytes_before": bytes_before, "bytes_after": bytes_after,
+            "saved": bytes_before - bytes_after,
+        }
+        logger.debug(f"'{col}': {before.dtype} → {after.dtype} ({bytes_before - bytes_after:+,} bytes poupados)")
+
+    if report:
+        saved = sum(r["saved"] for r in report.values())
+        logger.info(f"Tipos convertidos pelo schema em {len(report)} coluna(s): "
+                    f"{saved / 2**20:.1f} MiB poupados")
+    return df, report
@@ -0,0 +1,300 @@
+"""
+Colunas derivadas declarativas para o bloco "calculations" de sources.json:
+
+    "derive": {
+        "Ano": "year(TransactionGenerationDate)",
+        "Mes": "month(TransactionGenerationDate)",
+        "ValorAOA": "Valor * lookup(Moeda, 'cambio', 1)",
+        "Faixa": "iif(Valor * lookup(Moeda, 'cambio', 1) > 100000, 'ALTO', 'NORMAL')",
+        "Prefixo": "ContractNumber[0:5]"
+    },
+    "lookups": {"cambio": {"USD": 905.5, "EUR": 980.0}}
+
+Sintaxe: aritmética (+ - * / // % **), comparações, and/or/not, `a if c else b`,
+fatias de texto col[i:j], nomes de colunas (ou col('Nome com espaços')) e as
+funções de FUNCTIONS. As expressões são lidas com o parser de Python, mas só os
+nós da lista branca são aceites (nada é executado com eval).
+
+Cada expressão é compilada numa árvore de tuplos; subexpressões iguais (em
+qualquer das colunas do bloco) têm a mesma chave e são calculadas uma só vez.
+Todas as operações são vetorizadas sobre colunas pandas/NumPy.
+"""
+import ast
+import operator
+from typing import Any, Callable, Dict, Optional, Set, Tuple
+
+import pandas as pd
+from loguru import logger
+
+from transform import dates
+
+Expr = Tuple  # ("col", nome) | ("const", valor) | (operador, *argumentos)
+
+_BINARY = {
+    ast.Add: operator.add, ast.Sub: operator.sub, ast.Mult: operator.mul,
+    ast.Div: operator.truediv, ast.FloorDiv: operator.floordiv, ast.Mod: operator.mod,
+    ast.Pow: operator.pow,
+}
+_COMPARE = {
+    ast.Eq: operator.eq, ast.NotEq: operator.ne, ast.Lt: operator.lt,
+    ast.LtE: operator.le, ast.Gt: operator.gt, ast.GtE: operator.ge,
+}
+
+
+def _as_datetime(values):
+    if pd.api.types.is_datetime64_any_dtype(values):
+        return values
+    return dates.parse_dates(values)[0]
+
+
+def _as_series(values, index) -> pd.Series:
+    return values if isinstance(values, pd.Series) else pd.Series(values, index=index)
+
+
+def _iif(cond, when_true, when_false, index=None):
+    cond = _as_series(cond, index).fillna(False).astype(bool)
+    return _as_series(when_true, index).where(cond, when_false)
+
+
+def _date_part(attr: str) -> Callable:
+    # Int64 nullable: datas inválidas ficam <NA> em vez de passarem a float
+    return lambda values: getattr(_as_datetime(values).dt, attr).astype("Int64")
+
+
+def _date_key(values):
+    d = _as_datetime(values)
+    return (d.dt.year * 10000 + d.dt.month * 100 + d.dt.day).astype("Int64")
+
+
+def _text(values):
+    return values.astype(str) if isinstance(values, pd.Series) else str(values)
+
+
+# Funções disponíveis: nome → (função, nº mínimo e máximo de argumentos)
+FUNCTIONS: Dict[str, Tuple[Callable, int, int]] = {
+    "year": (_date_part("year"), 1, 1),
+    "month": (_date_part("month"), 1, 1),
+    "day": (_date_part("day"), 1, 1),
+    "quarter": (_date_part("quarter"), 1, 1),
+    "weekday": (_date_part("weekday"), 1, 1),
+    "to_date": (_as_datetime, 1, 1),
+    "date": (lambda x: _as_datetime(x).dt.normalize(), 1, 1),
+    "date_key": (_date_key, 1, 1),
+    "substr": (lambda x, start, end=None: _text(x).str[start:end], 2, 3),
+    "upper": (lambda x: _text(x).str.upper(), 1, 1),
+    "lower": (lambda x: _text(x).str.lower(), 1, 1),
+    "strip": (lambda x: _text(x).str.strip(), 1, 1),
+    "len": (lambda x: _text(x).str.len(), 1, 1),
+    "concat": (lambda *parts: _concat(parts), 1, 99),
+    "coalesce": (lambda *parts: _coalesce(parts), 1, 99),
+    "isnull": (lambda x: x.isna(), 1, 1),
+    "round": (lambda x, n=0: x.round(n), 1, 2),
+    "abs": (lambda x: x.abs(), 1, 1),
+    "int": (lambda x: pd.to_numeric(x, errors="coerce").astype("Int64"), 1, 1),
+    "float": (lambda x: pd.to_numeric(x, errors="coerce").astype("Float64"), 1, 1),
+    "str": (_text, 1, 1),
+}
+# Funções tratadas pelo compilador (precisam do índice ou das tabelas de lookup)
+SPECIAL = {"iif": (3, 3), "lookup": (2, 3), "col": (1, 1)}
+DATE_FUNCS = {"year", "month", "day", "quarter", "weekday", "date", "date_key"}
+
+
+def _concat(parts):
+    result = None
+    for part in parts:
+        text = _text(part)
+        result = text if result is None else result + text
+    return result
+
+
+def _coalesce(parts):
+    result = parts[0]
+    for part in parts[1:]:
+        result = result.fillna(part) if isinstance(result, pd.Series) else result
+    return result
+
+
+def parse(text: str) -> Expr:
+    """Compila uma expressão de texto na árvore de tuplos."""
+    try:
+        tree = ast.parse(text.strip(), mode="eval").body
+    except SyntaxError as e:
+        raise ValueError(f"Expressão inválida '{text}': {e.msg}") from None
+    return _convert(tree, text)
+
+
+def _convert(node, text: str) -> Expr:
+    convert = lambda n: _convert(n, text)  # noqa: E731
+    if isinstance(node, ast.Name):
+        return ("col", node.id)
+    if isinstance(node, ast.Constant) and isinstance(node.value, (int, float, str, bool, type(None))):
+        return ("const", node.value)
+    if isinstance(node, ast.BinOp) and type(node.op) in _BINARY:
+        return ("bin", type(node.op).__name__, convert(node.left), convert(node.right))
+    if isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.USub):
+        return ("neg", convert(node.operand))
+    if isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.Not):
+        return ("not", convert(node.operand))
+    if isinstance(node, ast.BoolOp):
+        op = "and" if isinstance(node.op, ast.And) else "or"
+        result = convert(node.values[0])
+        for value in node.values[1:]:
+            result = (op, result, convert(value))
+        return result
+    if isinstance(node, ast.Compare) and all(type(op) in _COMPARE for op in node.ops):
+        # a < b < c → (a < b) and (b < c)
+        result, left = None, convert(node.left)
+        for op, right in zip(node.ops, node.comparators):
+            right = convert(right)
+            cmp = ("cmp", type(op).__name__, left, right)
+            result = cmp if result is None else ("and", result, cmp)
+            left = right
+        return result
+    if isinstance(node, ast.IfExp):
+        return ("call", "iif", convert(node.test), convert(node.body), convert(node.orelse))
+    if isinstance(node, ast.Subscript) and isinstance(node.slice, ast.Slice) and node.slice.step is None:
+        start = convert(node.slice.lower) if node.slice.lower else ("const", None)
+        end = convert(node.slice.upper) if node.slice.upper else ("const", None)
+        return ("call", "substr", convert(node.value), start, end)
+    if isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and not node.keywords:
+        name = node.func.id
+        limits = SPECIAL.get(name) or (FUNCTIONS[name][1:] if name in FUNCTIONS else None)
+        if limits is None:
+            raise ValueError(f"Função desconhecida '{name}' em '{text}'")
+        if not limits[0] <= len(node.args) <= limits[1]:
+            raise ValueError(f"Número de argumentos inválido para '{name}' em '{text}'")
+        args = tuple(convert(a) for a in node.args)
+        if name == "col":
+            if args[0][0] != "const" or not isinstance(args[0][1], str):
+                raise ValueError(f"col() espera o nome da coluna em texto: '{text}'")
+            return ("col", args[0][1])
+        if name == "lookup" and (args[1][0] != "const" or not isinstance(args[1][1], str)):
+            raise ValueError(f"lookup() espera o nome da tabela em texto: '{text}'")
+        if name in DATE_FUNCS and args[0][:2] != ("call", "to_date"):
+            # year(x) e month(x) partilham a mesma conversão de x (CSE)
+            args = (("call", "to_date", args[0]),)
+        return ("call", name) + args
+    raise ValueError(f"Construção não suportada em '{text}': {ast.dump(node)[:60]}")
+
+
+def columns_of(expr: Expr) -> Set[str]:
+    """Colunas referidas por uma expressão."""
+    if expr[0] == "col":
+        return {expr[1]}
+    if expr[0] == "const":
+        return set()
+    return set().union(*(columns_of(a) for a in expr[1:] if isinstance(a, tuple)))
+
+
+def _contains(expr: Expr, prefix: Tuple) -> bool:
+    if expr[:len(prefix)] == prefix:
+        return True
+    return expr[0] not in ("col", "const") and any(
+        _contains(a, prefix) for a in expr[1:] if isinstance(a, tuple))
+
+
+def _subexpressions(expr: Expr, counts: Dict[Expr, int]):
+    if expr[0] in ("col", "const"):
+        return
+    counts[expr] = counts.get(expr, 0) + 1
+    if counts[expr] == 1:
+        for arg in expr[1:]:
+            if isinstance(arg, tuple):
+                _subexpressions(arg, counts)
+
+
+class DerivedColumns:
+    """Bloco "derive" compilado: avalia todas as colunas numa passagem, com CSE."""
+
+    def __init__(self, derive: Dict[str, str], lookups: Optional[Dict[str, Dict]] = None):
+        self.exprs = {name: parse(text) for name, text in derive.items()}
+        self.lookups = {name: pd.Series(table) for name, table in (lookups or {}).items()}
+        for name, expr in self.exprs.items():
+            for table in self._lookup_tables(expr):
+                if table not in self.lookups:
+                    raise ValueError(f"Tabela de lookup '{table}' não definida (coluna '{name}')")
+
+        # Colunas de input: as referidas que não são derivadas antes no bloco
+        self.reads: Set[str] = set()
+        defined: Set[str] = set()
+        for name, expr in self.exprs.items():
+            self.reads |= columns_of(expr) - defined
+            defined.add(name)
+        self.writes = set(self.exprs)
+
+        counts: Dict[Expr, int] = {}
+        for expr in self.exprs.values():
+            _subexpressions(expr, counts)
+        self.shared = sum(1 for c in counts.values() if c > 1)
+
+    def _lookup_tables(self, expr: Expr) -> Set[str]:
+        if expr[0] in ("col", "const"):
+            return set()
+        tables = {expr[3][1]} if expr[:2] == ("call", "lookup") else set()
+        return tables.union(*(self._lookup_tables(a) for a in expr[1:] if isinstance(a, tuple)))
+
+    @property
+    def uses_dates(self) -> bool:
+        """Se alguma expressão converte texto em datas (a inferência de formato depende das linhas)."""
+        return any(_contains(expr, ("call", "to_date")) for expr in self.exprs.values())
+
+    def evaluate(self, df: pd.DataFrame) -> pd.DataFrame:
+        """Acrescenta/substitui as colunas derivadas em `df` (no próprio DataFrame)."""
+        cache: Dict[Expr, Any] = {}
+        for name, expr in self.exprs.items():
+            value = self._eval(expr, df, cache)
+            df[name] = value if isinstance(value, pd.Series) else pd.Series(value, index=df.index)
+            # A coluna passa a existir: expressões seguintes que a usem leem o novo valor
+            cache = {k: v for k, v in cache.items() if name not in columns_of(k)}
+        logger.info(f"Colunas derivadas: {list(self.exprs)} ({self.shared} subexpressão(ões) partilhada(s))")
+        return df
+
+    def _eval(self, expr: Expr, df: pd.DataFrame, cache: Dict[Expr, Any]):
+        kind = expr[0]
+        if kind == "const":
+            return expr[1]
+        if expr in cache:
+            return cache[expr]
+
+        if kind == "col":
+            if expr[1] not in df.columns:
+                raise KeyError(f"Coluna '{expr[1]}' não encontrada para as colunas derivadas")
+            value = df[expr[1]]
+            # Inteiros compactos (Int8/Int16/...) passam a 64 bits antes de aritmética
+            if pd.api.types.is_integer_dtype(value) and value.dtype.itemsize < 8:
+                value = value.astype("Int64" if isinstance(value.dtype, pd.api.extensions.ExtensionDtype)
+                                     else "int64")
+        else:
+            args = [self._eval(a, df, cache) if isinstance(a, tuple) else a for a in expr[1:]]
+            if kind == "bin":
+                value = _BINARY[getattr(ast, args[0])](args[1], args[2])
+            elif kind == "cmp":
+                value = _COMPARE[getattr(ast, args[0])](args[1], args[2])
+            elif kind == "neg":
+                value = -args[0]
+            elif kind == "not":
+                value = ~_as_series(args[0], df.index).fillna(False).astype(bool)
+            elif kind in ("and", "or"):
+                left = _as_series(args[0], df.index).fillna(False).astype(bool)
+                right = _as_series(args[1], df.index).fillna(False).astype(bool)
+                value = left & right if kind == "and" else left | right
+            else:
+                value = self._call(args[0], args[1:], df.index)
+        cache[expr] = value
+        return value
+
+    def _call(self, name: str, args, index):
+        if name == "iif":
+            return _iif(*args, index=index)
+        if name == "lookup":
+            values, table = _as_series(args[0], index), self.lookups[args[1]]
+            mapped = values.map(table)
+            return mapped.fillna(args[2]) if len(args) > 2 else mapped
+        return FUNCTIONS[name][0](*args)
+
+
+def compile_derive(rules: dict) -> Optional[DerivedColumns]:
+    """Bloco "derive" das regras de cálculo (None se não existir)."""
+    if not rules or not rules.get("derive"):
+        return None
+    return DerivedColumns(rules["derive"], rules.get("lookups"))
@@ -0,0 +1,40 @@
+from typing import Callable, List, Tuple
+
+import pandas as pd
+from loguru import logger
+
+Step = Tuple[str, Callable[[pd.DataFrame], pd.DataFrame]]
+
+
+class RulePlan:
+    """
+    Cadeia de regras compilada a partir de `cleaning_rules`/`calculations`.
+
+    Cada passo recebe o DataFrame do plano e altera-o no próprio objeto (sem
+    cópias intermédias); passos que mudam a forma (ex: agregações) devolvem um
+    novo DataFrame, que passa a ser o do plano. Planos somam-se com `+`.
+    `pending` são os estados (commit()/rollback()) a confirmar depois do staging,
+    como em LazyRulePlan.pending.
+    """
+
+    def __init__(self, steps: List[Step] = None, pending: List = None):
+        self.steps = list(steps or [])
+        self.pending = list(pending or [])
+
+    def __add__(self, other: "RulePlan") -> "RulePlan":
+        return RulePlan(self.steps + other.steps, self.pending + other.pending)
+
+    def __len__(self) -> int:
+        return len(self.steps)
+
+    def run(self, df: pd.DataFrame, copy: bool = True) -> pd.DataFrame:
+        """
+        Executa o plano. Com copy=True é feita uma única cópia inicial e o input
+        fica intacto; com copy=False o chamador cede o DataFrame ao plano.
+        """
+        if copy:
+            df = df.copy()
+        for name, step in self.steps:
+            logger.debug(f"Passo do plano: {name}")
+            df = step(df)
+        return df
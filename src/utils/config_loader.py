@@ -48,6 +48,7 @@ def load_config(source_name: str):
         raise KeyError(f"Fonte '{source_name}' não encontrada em sources.json")
 
     source_conf = sources[source_name]
+    source_conf["name"] = source_name
 
     # Se for do tipo database, resolve user/password do .env
     if source_conf.get("type") == "database":
@@ -0,0 +1,197 @@
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from loguru import logger
+
+
+class ConnectionPool:
+    """
+    Pool de ligações DB-API reutilizáveis para uma conexão de db_config.json.
+
+    - max_size: número máximo de ligações abertas (em uso + livres)
+    - idle_timeout: ligações livres há mais tempo do que isto (s) são fechadas
+    - health_check_interval: ligações livres há mais tempo do que isto (s) são
+      validadas com `health_check_query` antes de serem entregues
+    """
+
+    def __init__(self, name: str, factory: Callable[[], Any], max_size: int = 5,
+                 idle_timeout: float = 300, health_check_interval: float = 30,
+                 health_check_query: str = "SELECT 1", checkout_timeout: float = 60):
+        self.name = name
+        self.factory = factory
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self.health_check_interval = health_check_interval
+        self.health_check_query = health_check_query
+        self.checkout_timeout = checkout_timeout
+        self._idle: List[Tuple[Any, float]] = []
+        self._in_use = 0
+        self._cond = threading.Condition()
+        self.metrics = {
+            "created": 0, "reused": 0, "checkouts": 0, "closed_idle": 0,
+            "failed_health_checks": 0, "discarded": 0, "wait_seconds": 0.0,
+        }
+
+    @property
+    def size(self) -> int:
+        return self._in_use + len(self._idle)
+
+    def _healthy(self, conn) -> bool:
+        try:
+            cursor = conn.cursor()
+            cursor.execute(self.health_check_query)
+            cursor.fetchall()
+            return True
+        except Exception as e:
+            logger.warning(f"Ligação '{self.name}' falhou o health check: {e}")
+            return False
+
+    @staticmethod
+    def _close(conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def acquire(self):
+        """Obtém uma ligação livre (validada) ou abre uma nova, esperando se o pool estiver cheio."""
+        start = time.monotonic()
+        while True:
+            conn, needs_check = self._reserve(start)
+            if conn is None:
+                return self._open(start)
+            # Health check fora do lock: um ping lento não bloqueia os outros acquire/release
+            if not needs_check or self._healthy(conn):
+                with self._cond:
+                    self.metrics["reused"] += 1
+                    return self._checked_out(conn, start)
+            self._close(conn)
+            with self._cond:
+                self._in_use -= 1
+                self.metrics["failed_health_checks"] += 1
+                self._cond.notify()
+
+    def _reserve(self, start: float):
+        """
+        Sob o lock, reserva uma ligação livre → (conn, precisa de health check)
+        ou um lugar para abrir uma nova → (None, False).
+        """
+        expired = []
+        try:
+            with self._cond:
+                while True:
+                    now = time.monotonic()
+                    while self._idle:
+                        conn, released_at = self._idle.pop()
+                        idle_for = now - released_at
+                        if idle_for > self.idle_timeout:
+                            expired.append(conn)
+                            self.metrics["closed_idle"] += 1
+                            continue
+                        self._in_use += 1
+                        return conn, idle_for > self.health_check_interval
+
+                    if self.size < self.max_size:
+                        self._in_use += 1
+                        return None, False
+
+                    remaining = self.checkout_timeout - (now - start)
+                    if remaining <= 0:
+                        raise TimeoutError(
+                            f"Sem ligações livres no pool '{self.name}' após {self.checkout_timeout}s"
+                        )
+                    self._cond.wait(remaining)
+        finally:
+            for conn in expired:
+                self._close(conn)
+
+    def _open(self, start: float):
+        # Abre fora do lock (o login pode demorar)
+        try:
+            conn = self.factory()
+        except Exception:
+            with self._cond:
+                self._in_use -= 1
+                self._cond.notify()
+            raise
+        with self._cond:
+            self.metrics["created"] += 1
+            return self._checked_out(conn, start)
+
+    def _checked_out(self, conn, start: float):
+        self.metrics["checkouts"] += 1
+        self.metrics["wait_seconds"] += time.monotonic() - start
+        return conn
+
+    def release(self, conn, discard: bool = False):
+        """Devolve a ligação ao pool (ou fecha-a se `discard`, ex: após erro de ligação)."""
+        if not discard:
+            try:
+                conn.rollback()  # limpa transações pendentes antes de reutilizar
+            except Exception:
+                discard = True
+        with self._cond:
+            self._in_use -= 1
+            if discard:
+                self.metrics["discarded"] += 1
+            else:
+                self._idle.append((conn, time.monotonic()))
+            self._cond.notify()
+        if discard:
+            self._close(conn)
+
+    @contextmanager
+    def connection(self):
+        """Context manager: `with pool.connection() as conn: ...`"""
+        conn = self.acquire()
+        try:
+            yield conn
+        except Exception:
+            # Em caso de erro, a ligação só volta ao pool se ainda estiver saudável
+            self.release(conn, discard=not self._healthy(conn))
+            raise
+        else:
+            self.release(conn)
+
+    def close_all(self):
+        """Fecha todas as ligações livres."""
+        with self._cond:
+            idle, self._idle = self._idle, []
+        for conn, _ in idle:
+            self._close(conn)
+        logger.info(f"Pool '{self.name}' fechado | métricas: {self.stats()}")
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            return {**self.metrics, "in_use": self._in_use, "idle": len(self._idle)}
+
+
+_pools: Dict[str, ConnectionPool] = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(conn_name: str, factory: Optional[Callable[[], Any]] = None, **options) -> ConnectionPool:
+    """
+    Devolve o pool da conexão `conn_name` (criado na primeira utilização).
+    As opções vêm do bloco "pool" de db_config.json (max_size, idle_timeout, ...).
+    """
+    with _pools_lock:
+        pool = _pools.get(conn_name)
+        if pool is None:
+            if factory is None:
+                raise KeyError(f"Pool '{conn_name}' não existe e não foi indicada factory de ligações")
+            pool = ConnectionPool(conn_name, factory, **options)
+            _pools[conn_name] = pool
+            logger.info(f"Pool de ligações '{conn_name}' criado (max_size={pool.max_size})")
+        return pool
+
+
+def close_all_pools():
+    """Fecha todos os pools (fim do pipeline)."""
+    with _pools_lock:
+        pools = list(_pools.values())
+        _pools.clear()
+    for pool in pools:
+        pool.close_all()
@@ -0,0 +1,128 @@
+import json
+import os
+import sqlite3
+import threading
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from loguru import logger
+
+DEFAULT_STATE_PATH = os.path.join("data/state", "etl_state.db")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS watermarks (
+    source TEXT PRIMARY KEY,
+    key_column TEXT NOT NULL,
+    value TEXT NOT NULL,
+    updated_at TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS ingested_files (
+    source TEXT NOT NULL,
+    path TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    ingested_at TEXT NOT NULL,
+    PRIMARY KEY (source, path)
+);
+"""
+
+
+class StateStore:
+    """
+    Estado persistente da extração incremental (SQLite local):
+    high-water mark por fonte e ficheiros já ingeridos.
+
+    As alterações ficam pendentes em memória (`stage_*`) e só são gravadas por
+    `commit(source)`, numa única transação, depois de o staging ter sucesso.
+    """
+
+    def __init__(self, path: str = DEFAULT_STATE_PATH):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.executescript(SCHEMA)
+        self._lock = threading.Lock()
+        self._pending_watermarks: Dict[str, Tuple[str, Any]] = {}
+        self._pending_files: Dict[str, List[Tuple[str, int, int]]] = {}
+
+    # ---------------- Watermarks ----------------
+    def get_watermark(self, source: str) -> Optional[Any]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value FROM watermarks WHERE source = ?", (source,)
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def stage_watermark(self, source: str, key_column: str, value: Any):
+        """Regista o novo high-water mark (só avança em commit)."""
+        if value is None:
+            return
+        if hasattr(value, "item"):  # escalares numpy → tipos Python (JSON)
+            value = value.item()
+        current = self._pending_watermarks.get(source, (key_column, None))[1]
+        if current is None or value > current:
+            self._pending_watermarks[source] = (key_column, value)
+
+    # ---------------- Ficheiros ----------------
+    @staticmethod
+    def _fingerprint(file_path: str) -> Tuple[str, int, int]:
+        st = os.stat(file_path)
+        return os.path.abspath(file_path), st.st_size, st.st_mtime_ns
+
+    def is_ingested(self, source: str, file_path: str) -> bool:
+        """True se o ficheiro já foi ingerido e não mudou (mesmo tamanho e mtime)."""
+        path, size, mtime_ns = self._fingerprint(file_path)
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT size, mtime_ns FROM ingested_files WHERE source = ? AND path = ?",
+                (source, path)
+            ).fetchone()
+        return row is not None and tuple(row) == (size, mtime_ns)
+
+    def pending_files(self, source: str, files: Iterable[str]) -> List[str]:
+        """Filtra os ficheiros ainda por ingerir (novos ou alterados)."""
+        return [f for f in files if not self.is_ingested(source, f)]
+
+    def stage_files(self, source: str, files: Iterable[str]):
+        self._pending_files.setdefault(source, []).extend(self._fingerprint(f) for f in files)
+
+    # ---------------- Transação ----------------
+    def commit(self, source: str):
+        """Grava atomicamente o watermark e os ficheiros pendentes da fonte."""
+        watermark = self._pending_watermarks.pop(source, None)
+        files = self._pending_files.pop(source, [])
+        if watermark is None and not files:
+            return
+
+        now = datetime.now().isoformat()
+        with self._lock, self._conn:
+            if watermark is not None:
+                key_column, value = watermark
+                self._conn.execute(
+                    "INSERT INTO watermarks (source, key_column, value, updated_at) VALUES (?, ?, ?, ?) "
+                    "ON CONFLICT(source) DO UPDATE SET key_column = excluded.key_column, "
+                    "value = excluded.value, updated_at = excluded.updated_at",
+                    (source, key_column, json.dumps(value, default=str), now)
+                )
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO ingested_files (source, path, size, mtime_ns, ingested_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                [(source, path, size, mtime_ns, now) for path, size, mtime_ns in files]
+            )
+        logger.info(
+            f"Estado de '{source}' gravado: watermark={watermark[1] if watermark else '-'}, "
+            f"{len(files)} ficheiro(s) ingerido(s)"
+        )
+
+    def rollback(self, source: str):
+        """Descarta o estado pendente (ex: staging falhou)."""
+        self._pending_watermarks.pop(source, None)
+        self._pending_files.pop(source, None)
+
+    def close(self):
+        self._conn.close()
+
+
+def state_key(cfg: Dict) -> str:
+    """Nome da fonte usado como chave no estado (definido por load_config)."""
+    return cfg.get("name") or cfg.get("target_table") or cfg.get("connection") or cfg.get("path")
@@ -21,7 +21,7 @@ config = load_config("API_TRANSACOES")
 df = extract_api(
     base_url=config["base_url"],
     params=config.get("params"),
-    pagination_key=config.get("pagination_key"),
+    pagination=config.get("pagination"),
     max_pages=config.get("max_pages", 5),
     columns=config.get("columns"),
 )